@@ -0,0 +1,57 @@
+"""Benchmark the per-call overhead of log_sync_call.
+
+Run from the project root::
+
+    python benchmarks/bench_log_decorators.py [--calls 1000000]
+
+Compares a bare function with the decorated one at INFO (the production
+default), with LOG_CALL_TIMING enabled, and at DEBUG.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import log_utils  # noqa: E402
+from modules.logging_config import logger  # noqa: E402
+
+
+def noop(x):
+    return x
+
+
+def measure(func, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    log_utils.CALL_TIMING = False
+    plain = log_utils.log_sync_call(noop)
+    log_utils.CALL_TIMING = True
+    timed = log_utils.log_sync_call(noop)
+
+    print(f"bare function:      {measure(noop, args.calls):7.0f} ns/call")
+    print(f"decorated, INFO:    {measure(plain, args.calls):7.0f} ns/call")
+    print(f"decorated, timing:  {measure(timed, args.calls):7.0f} ns/call")
+    # keep DEBUG output out of the terminal and log file
+    for handler in logger.handlers:
+        handler.setLevel(logging.CRITICAL)
+    logger.setLevel(logging.DEBUG)
+    print(f"decorated, DEBUG:   {measure(plain, args.calls // 10):7.0f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure bot startup (module import) time and guard against regressions.
+
+Run from anywhere::
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--max-ms 800]
+
+Each run imports ``telegram_bot`` in a fresh interpreter with
+``-X importtime`` from a temporary working directory (config and
+templates must not depend on the CWD). Reports the median import time,
+the slowest modules by self time, and fails (exit code 1) when the median
+exceeds ``--max-ms`` or when modules that should load lazily were imported:
+backend drivers that are not configured, ``rich`` and admin-only modules.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+LAZY_MODULES = ("psycopg2", "rich", "modules.member_import", "modules.bulk_moderation")
+PROBE = (
+    "import sys; sys.path.insert(0, {root!r}); import telegram_bot; "
+    "print('LOADED', ','.join(sorted(sys.modules)))"
+)
+
+
+def run_once(cwd: str) -> tuple[dict[str, tuple[int, int]], set[str]]:
+    env = dict(os.environ, DB_BACKEND=os.getenv("DB_BACKEND", "sqlite"), METRICS_PORT="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(root=str(ROOT))],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    loaded = set()
+    for line in proc.stdout.splitlines():
+        if line.startswith("LOADED "):
+            loaded = set(line[len("LOADED "):].split(","))
+    return times, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import time is higher")
+    args = parser.parse_args()
+
+    totals = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(args.runs):
+            times, loaded = run_once(cwd)
+            totals.append(times["telegram_bot"][1] / 1000)
+
+    median = statistics.median(totals)
+    print(f"import telegram_bot: median {median:.0f} ms, min {min(totals):.0f} ms over {args.runs} runs")
+    print("\nslowest modules by self time (last run):")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda kv: kv[1][0], reverse=True)[: args.top]:
+        print(f"  {self_us / 1000:7.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    failed = False
+    eager = sorted(m for m in loaded if m.split(".")[0] in LAZY_MODULES or m in LAZY_MODULES)
+    if os.getenv("DB_BACKEND", "sqlite") != "postgres" and eager:
+        print(f"\nFAIL: loaded at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nFAIL: median {median:.0f} ms exceeds --max-ms {args.max_ms:.0f}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Benchmark SQLiteAdapter.upsert_member under concurrent writers.
+
+Run from the project root::
+
+    python benchmarks/bench_upsert_member.py [--ops 2000] [--threads 4]
+
+Each thread performs a mix of new inserts, re-submissions of the same ID,
+rebinds (same Telegram ID, new membership ID) and swaps (membership ID
+taken over by another Telegram account). Reported latency includes the
+time spent waiting for the SQLite write lock.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.db_sqlite_adapter import SQLiteAdapter  # noqa: E402
+
+
+def worker(db: SQLiteAdapter, thread_no: int, ops: int, latencies: list[float]) -> None:
+    base = thread_no * 1_000_000
+    for i in range(ops):
+        tid = base + i % 500
+        kind = i % 4
+        if kind == 0:
+            args = (f"{base + i}", tid)           # new membership
+        elif kind == 1:
+            args = (f"{base + i - 1}", tid)       # same pair again
+        elif kind == 2:
+            args = (f"{base + i + 10**6}", tid)   # rebind telegram to new membership
+        else:
+            args = (f"{base + i - 3}", tid + 1)   # swap: membership taken by another account
+        start = time.perf_counter()
+        db.upsert_member(args[0], args[1], f"user{tid}", "Bench User")
+        latencies.append(time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000, help="upserts per thread")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteAdapter(str(Path(tmp) / "bench.sqlite3"))
+        db.init()
+        db.execute("PRAGMA journal_mode=WAL")
+        latencies: list[float] = []
+        threads = [
+            threading.Thread(target=worker, args=(db, n, args.ops, latencies))
+            for n in range(args.threads)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"upserts: {total} in {elapsed:.2f}s ({total / elapsed:.0f} ops/s)")
+    print(
+        "latency ms: p50={:.2f} p95={:.2f} p99={:.2f} max={:.2f}".format(
+            statistics.median(latencies) * 1000,
+            latencies[int(total * 0.95)] * 1000,
+            latencies[int(total * 0.99)] * 1000,
+            latencies[-1] * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,128 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Dict, Any
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from modules.logging_config import logger
+from modules.metrics import CACHE_HITS, CACHE_MISSES
+from modules.rate_limiter import api_limiter
+from modules.settings import get_settings
 
-ACCESS_CHATS = [int(cid.strip()) for cid in os.getenv("ACCESS_CHATS", "").split(",") if cid.strip()]
+MEMBER_STATUS_TTL = float(os.getenv("MEMBER_STATUS_TTL", "60"))
+MEMBER_PROBE_TIMEOUT = float(os.getenv("MEMBER_PROBE_TIMEOUT", "3"))
+MEMBER_STATUS_CACHE_SIZE = int(os.getenv("MEMBER_STATUS_CACHE_SIZE", "100000"))
 
-async def ban_in_all_access_chats(bot, user_id: int) -> Dict[str, Any]:
+# (chat_id, user_id) -> (status, monotonic timestamp), oldest first
+_member_status_cache: dict[tuple[int, int], tuple[str, float]] = {}
+
+
+def remember_member_status(chat_id: int, user_id: int, status: str) -> None:
+    """Store the latest known chat member status for a user.
+
+    Every chat member update of a large chat lands here, so expired and,
+    above ``MEMBER_STATUS_CACHE_SIZE``, the oldest entries are evicted.
+    """
+    now = time.monotonic()
+    key = (chat_id, user_id)
+    cache = _member_status_cache
+    # re-insert so that the dict stays ordered by timestamp
+    cache.pop(key, None)
+    cache[key] = (str(status), now)
+    while cache:
+        oldest = next(iter(cache))
+        if len(cache) <= MEMBER_STATUS_CACHE_SIZE and now - cache[oldest][1] <= MEMBER_STATUS_TTL:
+            break
+        del cache[oldest]
+
+
+def cached_member_status(chat_id: int, user_id: int) -> Optional[str]:
+    """Return cached status if it is younger than MEMBER_STATUS_TTL."""
+    entry = _member_status_cache.get((chat_id, user_id))
+    if entry is None:
+        CACHE_MISSES.inc("member_status")
+        return None
+    status, ts = entry
+    if time.monotonic() - ts > MEMBER_STATUS_TTL:
+        _member_status_cache.pop((chat_id, user_id), None)
+        CACHE_MISSES.inc("member_status")
+        return None
+    CACHE_HITS.inc("member_status")
+    return status
+
+
+async def _probe_chat(bot, chat_id: int, user_id: int) -> Optional[str]:
+    try:
+        m = await asyncio.wait_for(
+            api_limiter.call(bot.get_chat_member, chat_id, user_id), MEMBER_PROBE_TIMEOUT
+        )
+    except Exception as e:  # pragma: no cover - network errors
+        logger.debug("get_chat_member fail %s: %s", chat_id, e)
+        return None
+    remember_member_status(chat_id, user_id, m.status)
+    return str(m.status)
+
+
+async def probe_member_statuses(bot, user_id: int) -> Dict[int, Optional[str]]:
+    """Return status of user in every access chat.
+
+    Cached statuses are reused, the rest are requested concurrently. Chats
+    that failed or timed out map to None.
+    """
+    statuses: Dict[int, Optional[str]] = {}
+    missing = []
+    for chat_id in get_settings().access_chats:
+        status = cached_member_status(chat_id, user_id)
+        if status is None:
+            missing.append(chat_id)
+        else:
+            statuses[chat_id] = status
+    if missing:
+        results = await asyncio.gather(*(_probe_chat(bot, chat_id, user_id) for chat_id in missing))
+        statuses.update(zip(missing, results))
+    return statuses
+
+
+def is_in_any_chat(statuses: Dict[int, Optional[str]]) -> bool:
+    return any(s is not None and s not in ("left", "kicked") for s in statuses.values())
+
+
+async def _in_all_access_chats(action: str, op: Callable[[int], Awaitable[Any]]) -> Dict[str, Any]:
+    """Run ``op(chat_id)`` for every access chat concurrently and collect a summary."""
     summary = {"ok": [], "errors": {}}
-    for chat_id in ACCESS_CHATS:
-        try:
-            await bot.ban_chat_member(chat_id, user_id)
+    chats = get_settings().access_chats
+    results = await asyncio.gather(*(op(chat_id) for chat_id in chats), return_exceptions=True)
+    for chat_id, res in zip(chats, results):
+        if isinstance(res, Exception):  # pragma: no cover - network errors
+            logger.warning("%s fail %s: %s", action, chat_id, res)
+            summary["errors"][chat_id] = str(res)
+        else:
             summary["ok"].append(chat_id)
-        except Exception as e:  # pragma: no cover - network errors
-            logger.warning("ban fail %s: %s", chat_id, e)
-            summary["errors"][chat_id] = str(e)
     return summary
 
+
+async def ban_in_all_access_chats(bot, user_id: int) -> Dict[str, Any]:
+    async def op(chat_id: int) -> None:
+        await api_limiter.call(bot.ban_chat_member, chat_id, user_id)
+        remember_member_status(chat_id, user_id, "kicked")
+
+    return await _in_all_access_chats("ban", op)
+
+
 async def unban_in_all_access_chats(bot, user_id: int) -> Dict[str, Any]:
-    summary = {"ok": [], "errors": {}}
-    for chat_id in ACCESS_CHATS:
-        try:
-            await bot.unban_chat_member(chat_id, user_id, only_if_banned=False)
-            summary["ok"].append(chat_id)
-        except Exception as e:  # pragma: no cover - network errors
-            logger.warning("unban fail %s: %s", chat_id, e)
-            summary["errors"][chat_id] = str(e)
-    return summary
+    async def op(chat_id: int) -> None:
+        await api_limiter.call(bot.unban_chat_member, chat_id, user_id, only_if_banned=False)
+        remember_member_status(chat_id, user_id, "left")
+
+    return await _in_all_access_chats("unban", op)
+
 
 async def kick_in_all_access_chats(bot, user_id: int) -> Dict[str, Any]:
-    summary = {"ok": [], "errors": {}}
-    for chat_id in ACCESS_CHATS:
-        try:
-            await bot.ban_chat_member(chat_id, user_id)
-            await bot.unban_chat_member(chat_id, user_id)
-            summary["ok"].append(chat_id)
-        except Exception as e:  # pragma: no cover
-            logger.warning("kick fail %s: %s", chat_id, e)
-            summary["errors"][chat_id] = str(e)
-    return summary
+    async def op(chat_id: int) -> None:
+        # ban + unban must stay ordered within a chat, chats run in parallel
+        await api_limiter.call(bot.ban_chat_member, chat_id, user_id)
+        await api_limiter.call(bot.unban_chat_member, chat_id, user_id)
+        remember_member_status(chat_id, user_id, "left")
+
+    return await _in_all_access_chats("kick", op)
@@ -1,33 +1,37 @@
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
 import csv
 import io
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
 from modules.auth_utils import is_admin
 from modules.template_engine import render_template
-from modules.config import admin_ui
+from modules.settings import SettingsError, get_settings, reload_settings
 from modules.storage import (
     db_get_member_by_membership_id,
     db_get_member_by_telegram,
     db_get_member_by_username,
-    db_set_ban,
-    db_set_confirmation,
-    db_iter_members,
-    db_delete_member_by_id,
-    db_delete_user_by_telegram_id,
+    db_set_ban_async,
+    db_set_confirmation_async,
+    db_iter_members_async,
+    db_delete_member_by_id_async,
+    db_delete_user_by_telegram_id_async,
     db_get_user_locale,
 )
 from modules.access_control import (
     ban_in_all_access_chats,
     unban_in_all_access_chats,
     kick_in_all_access_chats,
-    ACCESS_CHATS,
+    probe_member_statuses,
+    is_in_any_chat,
 )
-from modules.time_utils import humanize_period
+from modules.db_base import Member
+from modules.metrics import DB_SLOW_QUERIES, db_stats
+from modules.time_utils import from_epoch, humanize_period, now_epoch
 from modules.log_utils import log_async_call
 from modules.i18n import get_button_text, DEFAULT_LANG
 
@@ -49,72 +53,61 @@ def resolve_member_by_key(key: str | int) -> dict | None:
     return None
 
 
-def _calc_status(member: dict) -> tuple[str, str, str]:
-    now = datetime.utcnow()
+def _calc_status(member: Member) -> tuple[str, str, str]:
+    now = now_epoch()
     expires = member.get("expires_at")
-    expires_dt = None
-    if expires:
-        expires_dt = datetime.fromisoformat(expires) if isinstance(expires, str) else expires
     remaining = ""
     status = "none"
     if member.get("is_banned"):
         status = "banned"
     elif member.get("is_confirmed"):
-        if not expires_dt:
+        if not expires:
             status = "lifetime"
-        elif expires_dt > now:
+        elif expires > now:
             status = "active"
-            remaining = str(int((expires_dt - now).total_seconds()))
+            remaining = str(expires - now)
         else:
             status = "expired"
             remaining = "0"
-    return status, remaining, expires_dt.isoformat() if expires_dt else ""
+    return status, remaining, from_epoch(expires).isoformat() if expires else ""
 
 
-async def _ban_member(bot, member: dict):
+async def _ban_member(bot, member: Member):
     user_id = member["telegram_id"]
     summary = await ban_in_all_access_chats(bot, user_id)
-    db_set_ban(member["membership_id"], True)
-    db_set_confirmation(member["membership_id"], False, None)
+    await db_set_ban_async(member["membership_id"], True)
+    await db_set_confirmation_async(member["membership_id"], False, None)
     member.update(is_banned=1, is_confirmed=0, expires_at=None)
     return summary
 
 
-async def _unban_member(bot, member: dict):
+async def _unban_member(bot, member: Member):
     user_id = member["telegram_id"]
     summary = await unban_in_all_access_chats(bot, user_id)
-    db_set_ban(member["membership_id"], False)
+    await db_set_ban_async(member["membership_id"], False)
     member.update(is_banned=0)
     return summary
 
 
-async def _kick_member(bot, member: dict):
+async def _kick_member(bot, member: Member):
     user_id = member["telegram_id"]
     summary = await kick_in_all_access_chats(bot, user_id)
-    db_set_confirmation(member["membership_id"], False, None)
+    await db_set_confirmation_async(member["membership_id"], False, None)
     member.update(is_confirmed=0, expires_at=None)
     return summary
 
 
-async def _remove_member(bot, member: dict):
+async def _remove_member(bot, member: Member):
     summary = await _kick_member(bot, member)
-    db_delete_member_by_id(member["id"])
-    db_delete_user_by_telegram_id(member["telegram_id"])
+    await db_delete_member_by_id_async(member["id"])
+    await db_delete_user_by_telegram_id_async(member["telegram_id"])
     return summary
 
 
-async def _build_user_card(bot, member: dict):
+async def _build_user_card(bot, member: Member):
     status, remaining_sec, expires_at = _calc_status(member)
-    remaining_human = humanize_period(int(remaining_sec)) if remaining_sec else ""
-    in_channels = False
-    for chat_id in ACCESS_CHATS:
-        try:
-            m = await bot.get_chat_member(chat_id, member["telegram_id"])
-            if m.status not in ("left", "kicked"):
-                in_channels = True
-                break
-        except Exception:
-            continue
+    remaining_human = humanize_period(int(remaining_sec), DEFAULT_LANG) if remaining_sec else ""
+    in_channels = is_in_any_chat(await probe_member_statuses(bot, member["telegram_id"]))
     user_locale = db_get_user_locale(member["telegram_id"])
     text = render_template(
         "admin_user_card.txt",
@@ -133,19 +126,19 @@ async def _build_user_card(bot, member: dict):
         [
             [
                 InlineKeyboardButton(
-                    get_button_text(admin_ui.get("ban_text"), DEFAULT_LANG, "Ban"),
+                    get_button_text(get_settings().admin_ui.get("ban_text"), DEFAULT_LANG, "Ban"),
                     callback_data=f"admin:ban:{member['membership_id']}",
                 ),
                 InlineKeyboardButton(
-                    get_button_text(admin_ui.get("unban_text"), DEFAULT_LANG, "Unban"),
+                    get_button_text(get_settings().admin_ui.get("unban_text"), DEFAULT_LANG, "Unban"),
                     callback_data=f"admin:unban:{member['membership_id']}",
                 ),
                 InlineKeyboardButton(
-                    get_button_text(admin_ui.get("kick_text"), DEFAULT_LANG, "Kick"),
+                    get_button_text(get_settings().admin_ui.get("kick_text"), DEFAULT_LANG, "Kick"),
                     callback_data=f"admin:kick:{member['membership_id']}",
                 ),
                 InlineKeyboardButton(
-                    get_button_text(admin_ui.get("remove_text"), DEFAULT_LANG, "Remove"),
+                    get_button_text(get_settings().admin_ui.get("remove_text"), DEFAULT_LANG, "Remove"),
                     callback_data=f"admin:remove:{member['membership_id']}",
                 ),
             ]
@@ -265,7 +258,7 @@ async def handle_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(render_template("not_authorized.txt"))
         return
     scope = context.args[0] if context.args else "all"
-    members = db_iter_members(scope)
+    members = await db_iter_members_async(scope)
     output = io.StringIO()
     fieldnames = [
         "membership_id",
@@ -358,3 +351,124 @@ async def handle_user_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
     text, keyboard = await _build_user_card(context.bot, member)
     await query.message.edit_text(text, reply_markup=keyboard)
     await query.answer()
+
+
+@log_async_call
+async def handle_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /ban_bulk, /kick_bulk and /remove_bulk.
+
+    Targets come from an attached (or replied-to) CSV/text document and/or a
+    filter expression: ``expired_before:YYYY-MM-DD``, ``never_joined``.
+    """
+    from modules.bulk_moderation import BULK_ACTIONS, parse_filter, parse_keys, resolve_bulk_targets, run_bulk_action
+
+    message = update.message
+    if not is_admin(update.effective_user.id):
+        await message.reply_text(render_template("not_authorized.txt"))
+        return
+    tokens = (message.text or message.caption or "").split()
+    action = tokens[0].lstrip("/").split("@")[0].removesuffix("_bulk") if tokens else ""
+    try:
+        filters = parse_filter(tokens[1:])
+    except ValueError:
+        filters = None
+    document = message.document
+    if document is None and message.reply_to_message:
+        document = message.reply_to_message.document
+    if action not in BULK_ACTIONS or filters is None or (document is None and not filters):
+        await message.reply_text(render_template("admin_bulk_usage.txt"))
+        return
+    keys = None
+    if document is not None:
+        tg_file = await document.get_file()
+        keys = parse_keys(bytes(await tg_file.download_as_bytearray()))
+        if not keys:
+            await message.reply_text(render_template("admin_bulk_usage.txt"))
+            return
+    members = await resolve_bulk_targets(keys, **filters)
+    if not members:
+        await message.reply_text(render_template("admin_user_not_found.txt"))
+        return
+    status = await message.reply_text(
+        render_template("admin_bulk_progress.txt", action=action, done=0, total=len(members), failed=0)
+    )
+
+    async def report(done: int, failed: int) -> None:
+        try:
+            await status.edit_text(
+                render_template("admin_bulk_progress.txt", action=action, done=done, total=len(members), failed=failed)
+            )
+        except TelegramError:
+            pass
+
+    result = await run_bulk_action(context.bot, action, members, report)
+    await status.edit_text(
+        render_template(
+            "admin_bulk_done.txt",
+            action=action,
+            total=result["total"],
+            failed=len(result["failed"]),
+            errors=list(result["failed"])[:20],
+        )
+    )
+
+
+@log_async_call
+async def handle_import_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Import pre-approved members from an attached (or replied-to) CSV/JSONL file."""
+    from modules.member_import import detect_format, import_members
+
+    message = update.message
+    if not is_admin(update.effective_user.id):
+        await message.reply_text(render_template("not_authorized.txt"))
+        return
+    document = message.document
+    if document is None and message.reply_to_message:
+        document = message.reply_to_message.document
+    if document is None:
+        await message.reply_text(render_template("admin_import_usage.txt"))
+        return
+    tg_file = await document.get_file()
+    data = io.BytesIO(bytes(await tg_file.download_as_bytearray()))
+    stream = io.TextIOWrapper(data, encoding="utf-8-sig", newline="")
+    summary = await asyncio.to_thread(import_members, stream, detect_format(document.file_name))
+    await message.reply_text(
+        render_template(
+            "admin_import_done.txt",
+            rows=summary["rows"],
+            imported=summary["imported"],
+            rejected=len(summary["errors"]),
+            errors=summary["errors"][:20],
+        )
+    )
+
+
+@log_async_call
+async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show DB call latency and slow query counters collected since start."""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(render_template("not_authorized.txt"))
+        return
+    slow = sorted(DB_SLOW_QUERIES.values.items(), key=lambda kv: kv[1], reverse=True)
+    await update.message.reply_text(
+        render_template(
+            "admin_stats.txt",
+            rows=db_stats(),
+            slow=sum(n for _, n in slow),
+            slow_by_statement=slow[:10],
+        )
+    )
+
+
+@log_async_call
+async def handle_reload_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Re-read ui_config.yaml, membership.yaml and ACCESS_CHATS without a restart."""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(render_template("not_authorized.txt"))
+        return
+    try:
+        reload_settings()
+    except SettingsError as e:
+        await update.message.reply_text(render_template("admin_reload_failed.txt", problems=e.problems))
+        return
+    await update.message.reply_text(render_template("admin_reload_ok.txt"))
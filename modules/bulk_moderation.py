@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from modules.access_control import ban_in_all_access_chats, kick_in_all_access_chats
+from modules.db_base import Member
+from modules.storage import db_bulk_moderate_async, db_find_members_async, db_get_members_by_keys_async
+from modules.time_utils import to_epoch
+from modules.logging_config import logger
+
+BULK_ACTIONS = ("ban", "kick", "remove")
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "4"))
+PROGRESS_INTERVAL = 2.0
+
+_EXPIRED_BEFORE_RE = re.compile(r"^expired_before[:=](\d{4}-\d{2}-\d{2})$")
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+@dataclass
+class BulkKeys:
+    membership_ids: list[str] = field(default_factory=list)
+    telegram_ids: list[int] = field(default_factory=list)
+    usernames: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.membership_ids or self.telegram_ids or self.usernames)
+
+
+def parse_keys(data: bytes) -> BulkKeys:
+    """Parse uploaded CSV/text file into member keys.
+
+    A CSV with ``membership_id``/``telegram_id`` columns (e.g. /export_users
+    output) is read by column, otherwise the first field of every line is a
+    key: ``@username`` or membership ID. Empty lines and ``#`` comments are
+    skipped.
+    """
+    text = data.decode("utf-8-sig", errors="replace")
+    keys = BulkKeys()
+    rows = [
+        r for r in csv.reader(io.StringIO(text))
+        if any(f.strip() for f in r) and not r[0].startswith("#")
+    ]
+    if not rows:
+        return keys
+    header = [h.strip().lower() for h in rows[0]]
+    if "membership_id" in header or "telegram_id" in header:
+        mid_col = header.index("membership_id") if "membership_id" in header else None
+        tid_col = header.index("telegram_id") if "telegram_id" in header else None
+        for r in rows[1:]:
+            mid = r[mid_col].strip() if mid_col is not None and mid_col < len(r) else ""
+            tid = r[tid_col].strip() if tid_col is not None and tid_col < len(r) else ""
+            if mid:
+                keys.membership_ids.append(mid)
+            elif tid.lstrip("-").isdigit():
+                keys.telegram_ids.append(int(tid))
+        return keys
+    for r in rows:
+        key = r[0].strip()
+        if not key:
+            continue
+        if key.startswith("@"):
+            keys.usernames.append(key[1:])
+        else:
+            keys.membership_ids.append(key)
+    return keys
+
+
+def parse_filter(args: list[str]) -> dict:
+    """Parse filter expression ``expired_before:YYYY-MM-DD`` and/or ``never_joined``."""
+    filters: dict = {}
+    for arg in args:
+        m = _EXPIRED_BEFORE_RE.match(arg)
+        if m:
+            filters["expired_before"] = datetime.strptime(m.group(1), "%Y-%m-%d")
+        elif arg == "never_joined":
+            filters["never_joined"] = True
+        else:
+            raise ValueError(arg)
+    return filters
+
+
+async def resolve_bulk_targets(keys: Optional[BulkKeys] = None, **filters) -> list[Member]:
+    if keys is not None:
+        members = await db_get_members_by_keys_async(keys.membership_ids, keys.telegram_ids, keys.usernames)
+        if filters.get("never_joined"):
+            members = [m for m in members if not m.get("post_join_sent_at")]
+        if filters.get("expired_before"):
+            cutoff = to_epoch(filters["expired_before"])
+            members = [m for m in members if m.get("expires_at") and m["expires_at"] < cutoff]
+        return members
+    return await db_find_members_async(**filters)
+
+
+async def run_bulk_action(
+    bot,
+    action: str,
+    members: list[Member],
+    progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """Apply action to members: DB changes in one transaction, then Telegram fan-out.
+
+    Returns ``{"total", "done", "failed"}`` where failed maps telegram_id to
+    the per-chat errors.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    await db_bulk_moderate_async(action, [m["membership_id"] for m in members])
+
+    op = ban_in_all_access_chats if action == "ban" else kick_in_all_access_chats
+    queue: asyncio.Queue = asyncio.Queue()
+    for m in members:
+        if m.get("telegram_id"):
+            queue.put_nowait(m["telegram_id"])
+    result = {"total": len(members), "done": len(members) - queue.qsize(), "failed": {}}
+    last_report = time.monotonic()
+
+    async def worker() -> None:
+        nonlocal last_report
+        while True:
+            try:
+                telegram_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                summary = await op(bot, telegram_id)
+                if summary["errors"]:
+                    result["failed"][telegram_id] = summary["errors"]
+            except Exception as e:  # pragma: no cover - network errors
+                logger.warning("bulk %s fail %s: %s", action, telegram_id, e)
+                result["failed"][telegram_id] = str(e)
+            result["done"] += 1
+            now = time.monotonic()
+            if progress and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                await progress(result["done"], len(result["failed"]))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, BULK_WORKERS))))
+    logger.info(
+        "bulk %s finished: %s members, %s with errors", action, result["total"], len(result["failed"])
+    )
+    return result
@@ -5,7 +5,8 @@ from telegram.ext import ContextTypes
 
 from modules.template_engine import render_template
 from modules.states import UserState
-from modules.config import telegram_start, start_language_prompt, i18n as i18n_cfg
+from modules.config import i18n as i18n_cfg
+from modules.settings import get_settings
 from modules.auth_utils import is_admin
 from modules.log_utils import log_async_call
 from modules.inactivity import clear_user_activity, update_user_activity
@@ -21,6 +22,7 @@ from modules.media_utils import send_localized_image_with_text
 
 @log_async_call
 async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    settings = get_settings()
     user = update.effective_user
     clear_user_activity(user.id)
     user_row = {"locale": db_get_user_locale(user.id)}
@@ -28,7 +30,7 @@ async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYP
         await send_language_prompt(
             update,
             context,
-            start_language_prompt,
+            settings.start_language_prompt,
             asset_prefix="start_language_prompt",
             default_template="start_language_prompt.txt",
         )
@@ -36,18 +38,18 @@ async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     lang = resolve_user_lang(update, user_row)
     username = make_username(user, lang)
-    text = render_template(telegram_start.get("template", "start_user.txt"), username=username, lang=lang)
-    button_text = get_button_text(telegram_start.get("action_button_text"), lang, "Get access")
+    text = render_template(settings.start.template, username=username, lang=lang)
+    button_text = get_button_text(settings.start.button_text, lang, "Get access")
     keyboard = InlineKeyboardMarkup(
         [[InlineKeyboardButton(text=button_text, callback_data="request_access")]]
     )
     context.user_data["state"] = UserState.WAITING_FOR_REQUEST_BUTTON
-    if telegram_start.get("enabled_image", True):
+    if settings.start.enabled_image:
         await send_localized_image_with_text(
             bot=context.bot,
             chat_id=update.effective_chat.id,
             asset_key="start.image",
-            cfg_section=telegram_start,
+            cfg_section=settings.start.section,
             lang=lang,
             text=text,
             reply_markup=keyboard,
@@ -1,13 +1,36 @@
+import os
+from pathlib import Path
+
 import yaml
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# project root, so that the bot can be started from any working directory
+BASE_DIR = Path(__file__).resolve().parents[1]
+CONFIG_DIR = Path(os.getenv("CONFIG_DIR", BASE_DIR / "config"))
+TEMPLATES_DIR = BASE_DIR / "templates"
+
+# libyaml parser when available, it is several times faster than the pure Python one
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _load(name: str) -> dict:
+    with open(CONFIG_DIR / name, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=_Loader) or {}
+
 
-with open("config/ui_config.yaml", "r", encoding="utf-8") as f:
-    _ui = yaml.safe_load(f)
+def load_raw() -> tuple[dict, dict]:
+    """Parse ui_config.yaml and membership.yaml again (for settings reload)."""
+    return _load("ui_config.yaml"), _load("membership.yaml")
 
-with open("config/membership.yaml", "r", encoding="utf-8") as f:
-    _mb = yaml.safe_load(f)
 
-with open("config/i18n.yaml", "r", encoding="utf-8") as f:
-    _i18n = yaml.safe_load(f)
+# Raw files as parsed at startup. Runtime code reads the validated, reloadable
+# view from modules.settings instead.
+_ui, _mb = load_raw()
+_i18n = _load("i18n.yaml")
+ui_raw = _ui
+membership_raw = _mb
 
 # User interface
 telegram_start = _ui.get("start", {})
@@ -30,3 +53,5 @@ renewal = _mb.get("renewal", {})
 # i18n
 i18n = _i18n.get("i18n", {})
 i18n_buttons = _i18n.get("i18n_buttons", {})
+durations = _i18n.get("durations", {})
+DEFAULT_LANG = i18n.get("default_lang", "en")
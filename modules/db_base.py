@@ -1,9 +1,142 @@
 """Database adapter interface for membership management."""
 from __future__ import annotations
 
+import functools
+import json
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Iterable, Optional
+from time import perf_counter
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from .metrics import DB_CALL_SECONDS, DB_ERRORS
+from .migrations import Migration
+
+
+class Member:
+    """Member row returned by adapters.
+
+    A slotted record is several times smaller than a dict per row, which
+    matters for exports and in-memory indexes. Dict-style access (``m["id"]``,
+    ``m.get()``, ``m.update()``, ``dict(m)``) is kept for existing callers.
+
+    ``expires_at`` is UTC epoch seconds (``None`` for lifetime access) on all
+    backends, so callers compare it with ``time.time()`` without parsing.
+    """
+
+    __slots__ = (
+        "id",
+        "membership_id",
+        "telegram_id",
+        "is_confirmed",
+        "is_banned",
+        "expires_at",
+        "warn_sent_at",
+        "grace_notified_at",
+        "post_join_sent_at",
+        "created_at",
+        "updated_at",
+        "username",
+        "full_name",
+    )
+
+    def __init__(self, **fields: Any) -> None:
+        self.update(**fields)
+
+    @classmethod
+    def from_row(cls, row: Any) -> "Member":
+        """Build from a DB row (``sqlite3.Row`` or dict-like cursor row).
+
+        Columns the query did not select stay unset, like missing dict keys.
+        """
+        member = cls.__new__(cls)
+        items = row.items() if isinstance(row, dict) else zip(row.keys(), row)
+        for name, value in items:
+            if name in _MEMBER_FIELDS:
+                setattr(member, name, value)
+        return member
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _MEMBER_FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _MEMBER_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _MEMBER_FIELDS and hasattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in _MEMBER_FIELDS else default
+
+    def update(self, **fields: Any) -> None:
+        for key, value in fields.items():
+            self[key] = value
+
+    def keys(self) -> list[str]:
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Member):
+            return NotImplemented
+        return dict(self) == dict(other)
+
+    def __repr__(self) -> str:
+        return f"Member({', '.join(f'{k}={self[k]!r}' for k in self.keys())})"
+
+
+_MEMBER_FIELDS = frozenset(Member.__slots__)
+
+
+@dataclass(frozen=True, slots=True)
+class OutboxItem:
+    """Telegram message or action queued in the ``outbox`` table.
+
+    ``action`` is ``"message"`` (render ``template`` in ``lang`` and send it
+    to ``chat_id``) or ``"kick"`` (remove user ``chat_id`` from the access
+    chats). ``dedup_key`` is unique: enqueueing the same key again is a
+    no-op while the earlier row is kept. See :mod:`modules.outbox` for the
+    payload keys.
+    """
+
+    dedup_key: str
+    action: str
+    chat_id: int
+    template: str | None = None
+    lang: str | None = None
+    payload: dict[str, Any] = field(default_factory=dict)
+
+    def params(self, now: int) -> tuple:
+        """Parameters of the ``enqueue_outbox`` statement."""
+        return (
+            self.dedup_key, self.action, self.chat_id, self.template, self.lang,
+            json.dumps(self.payload), now, now,
+        )
+
+
+def dedupe_import_rows(
+    rows: Iterable[tuple[str, int | None, datetime | None]],
+) -> list[tuple[str, int | None, datetime | None]]:
+    """Collapse duplicates in a bulk import chunk.
+
+    The last row wins for a membership ID, and a Telegram ID repeated across
+    memberships stays bound only to the last one, so that a single batch
+    never violates the unique constraints.
+    """
+    by_mid: dict[str, tuple[str, int | None, datetime | None]] = {}
+    for row in rows:
+        by_mid[row[0]] = row
+    owner = {tid: mid for mid, tid, _ in by_mid.values() if tid is not None}
+    return [
+        (mid, tid if tid is None or owner[tid] == mid else None, exp)
+        for mid, tid, exp in by_mid.values()
+    ]
 
 
 class DatabaseAdapter(ABC):
@@ -15,17 +148,32 @@ class DatabaseAdapter(ABC):
     def init(self) -> None:
         """Initialize database schema."""
 
+    def close(self) -> None:
+        """Release pooled connections; adapters reconnect on next use."""
+
+    @abstractmethod
+    def schema_version(self) -> int:
+        """Return the last applied migration version, 0 for a fresh database."""
+
+    @abstractmethod
+    def apply_migration(self, migration: Migration) -> bool:
+        """Apply ``migration`` and record it in schema_version.
+
+        Return False without changes if it was already applied, e.g. by
+        another instance that started at the same time.
+        """
+
     # -- Member operations -------------------------------------------------
     @abstractmethod
-    def get_member_by_telegram(self, telegram_id: int) -> Optional[dict[str, Any]]:
+    def get_member_by_telegram(self, telegram_id: int) -> Optional[Member]:
         """Return member row by Telegram ID."""
 
     @abstractmethod
-    def get_member_by_membership_id(self, membership_id: str) -> Optional[dict[str, Any]]:
+    def get_member_by_membership_id(self, membership_id: str) -> Optional[Member]:
         """Return member row by membership ID."""
 
     @abstractmethod
-    def get_member_by_username(self, username: str) -> Optional[dict[str, Any]]:
+    def get_member_by_username(self, username: str) -> Optional[Member]:
         """Return member row by username."""
 
     @abstractmethod
@@ -36,23 +184,32 @@ class DatabaseAdapter(ABC):
         username: str | None,
         full_name: str | None,
         is_confirmed: bool = False,
-    ) -> None:
-        """Insert or update member information."""
+    ) -> int:
+        """Insert or update member information and return the member row ID."""
 
     @abstractmethod
-    def set_confirmation(self, membership_id: str, is_confirmed: bool, expires_at: datetime | None = None) -> None:
-        """Set confirmation status and expiration time for member."""
+    def set_confirmation(
+        self,
+        membership_id: str,
+        is_confirmed: bool,
+        expires_at: datetime | None = None,
+        outbox: Sequence[OutboxItem] = (),
+    ) -> None:
+        """Set confirmation status and expiration time for member.
+
+        ``outbox`` items are enqueued in the same transaction.
+        """
 
     @abstractmethod
-    def set_ban(self, membership_id: str, is_banned: bool) -> None:
-        """Set ban flag for member."""
+    def set_ban(self, membership_id: str, is_banned: bool, outbox: Sequence[OutboxItem] = ()) -> None:
+        """Set ban flag for member, enqueueing ``outbox`` with it."""
 
     @abstractmethod
     def update_expiration(self, membership_id: str, expires_at: datetime | None) -> None:
         """Update member expiration timestamp."""
 
     @abstractmethod
-    def get_member_by_id_or_username(self, key: int | str) -> Optional[dict[str, Any]]:
+    def get_member_by_id_or_username(self, key: int | str) -> Optional[Member]:
         """Return member by Telegram ID or username."""
 
     @abstractmethod
@@ -72,20 +229,55 @@ class DatabaseAdapter(ABC):
         """Remove user row by Telegram ID."""
 
     @abstractmethod
-    def iter_members(self, scope: str) -> Iterable[dict[str, Any]]:
+    def iter_members(self, scope: str) -> Iterable[Member]:
         """Iterate members for export with optional scope filter."""
 
     @abstractmethod
-    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[dict[str, Any]]:
+    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[Member]:
         """Return members whose expiration is within threshold seconds and warning not sent."""
 
     @abstractmethod
-    def fetch_expired_members(self, now: datetime) -> list[dict[str, Any]]:
+    def fetch_expired_members(self, now: datetime) -> list[Member]:
         """Return members whose expiration has passed."""
 
     @abstractmethod
-    def mark_warning_sent(self, telegram_id: int) -> None:
-        """Mark that expiration warning was sent to member."""
+    def mark_warning_sent(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        """Mark that expiration warning was sent to member, enqueueing ``outbox`` with it."""
+
+    # -- Bulk moderation ---------------------------------------------------
+    @abstractmethod
+    def get_members_by_keys(
+        self,
+        membership_ids: Sequence[str] = (),
+        telegram_ids: Sequence[int] = (),
+        usernames: Sequence[str] = (),
+    ) -> list[Member]:
+        """Return members matching any of the given keys."""
+
+    @abstractmethod
+    def find_members(
+        self, expired_before: datetime | None = None, never_joined: bool = False
+    ) -> list[Member]:
+        """Return members with telegram_id matching all given filters."""
+
+    @abstractmethod
+    def bulk_moderate(self, action: str, membership_ids: Sequence[str]) -> int:
+        """Apply ban/kick/remove to members in one transaction, return affected count."""
+
+    # -- Bulk import -------------------------------------------------------
+    @abstractmethod
+    def bulk_upsert_members(self, rows: Sequence[tuple[str, int | None, datetime | None]]) -> int:
+        """Insert or update pre-approved members in one transaction.
+
+        Rows are ``(membership_id, telegram_id, expires_at)``. Returns the
+        number of rows written.
+        """
+
+    # -- Eligibility index -------------------------------------------------
+    @abstractmethod
+    def fetch_eligibility(self) -> list[tuple[int, int, str, bool, bool, int | None]]:
+        """Return ``(telegram_id, id, membership_id, is_confirmed, is_banned, expires_epoch)``
+        for every member bound to a Telegram account."""
 
     # -- Post-join helpers -------------------------------------------------
     @abstractmethod
@@ -96,6 +288,19 @@ class DatabaseAdapter(ABC):
     def mark_post_join_sent(self, member_id: int) -> None:
         """Mark that post-join message has been sent."""
 
+    @abstractmethod
+    def claim_post_join(self, member_id: int, outbox: Sequence[OutboxItem] = ()) -> tuple[bool, Optional[str]]:
+        """Atomically mark post-join as sent if it was not yet.
+
+        Returns ``(claimed, locale)``; only the caller that got
+        ``claimed=True`` may send the message. ``outbox`` items are
+        enqueued only when the claim succeeds.
+        """
+
+    @abstractmethod
+    def release_post_join(self, member_id: int) -> None:
+        """Undo a claim after the post-join message could not be sent."""
+
     # -- Join request links ----------------------------------------------
     @abstractmethod
     def get_join_link(self, chat_id: int) -> Optional[dict[str, Any]]:
@@ -107,12 +312,12 @@ class DatabaseAdapter(ABC):
 
     # -- Renewal helpers -------------------------------------------------
     @abstractmethod
-    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[dict[str, Any]]:
+    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[Member]:
         """Members whose expiration passed but still within grace period."""
 
     @abstractmethod
-    def mark_grace_notified(self, telegram_id: int) -> None:
-        """Mark that user has been notified about grace period."""
+    def mark_grace_notified(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        """Mark that user has been notified about grace period, enqueueing ``outbox`` with it."""
 
     # -- Admin management --------------------------------------------------
     @abstractmethod
@@ -154,3 +359,79 @@ class DatabaseAdapter(ABC):
     def upsert_media_cache(self, asset_key: str, lang: str, file_hash: str, file_id: str) -> None:
         """Update or insert cache entry for asset."""
 
+    # -- Leases -------------------------------------------------------------
+    @abstractmethod
+    def acquire_lease(self, name: str, holder: str, ttl_sec: int) -> bool:
+        """Take or renew lease ``name`` for ``ttl_sec``; False if another holder owns it."""
+
+    @abstractmethod
+    def release_lease(self, name: str, holder: str) -> None:
+        """Drop lease ``name`` if ``holder`` owns it."""
+
+    @abstractmethod
+    def live_leases(self) -> list[tuple[str, str]]:
+        """Return ``(name, holder)`` of all unexpired leases."""
+
+    # -- Outbox -------------------------------------------------------------
+    @abstractmethod
+    def enqueue_outbox(self, items: Sequence[OutboxItem]) -> int:
+        """Insert outbox items, skipping known dedup keys; return how many were added."""
+
+    @abstractmethod
+    def record_expiry_pass(
+        self,
+        warned: Sequence[int],
+        graced: Sequence[int],
+        revoked: Sequence[str],
+        outbox: Sequence[OutboxItem] = (),
+    ) -> None:
+        """Mark warnings and grace notices sent, revoke ``revoked`` memberships
+        and enqueue ``outbox`` in one transaction."""
+
+    @abstractmethod
+    def claim_outbox(self, now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+        """Take up to ``limit`` due items for ``lease_sec`` and count the attempt."""
+
+    @abstractmethod
+    def finish_outbox(self, results: Sequence[tuple[int, Optional[str], Optional[int]]]) -> None:
+        """Record ``(id, error, retry_at)`` outcomes in one transaction.
+
+        No error marks the item sent; an error with ``retry_at`` schedules
+        another attempt, without it the item is given up as failed.
+        """
+
+    @abstractmethod
+    def purge_outbox(self, before: int) -> int:
+        """Delete sent and failed items created before ``before``."""
+
+
+def _row_count(result: Any) -> int:
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1 if isinstance(result, (Member, dict)) else 0
+
+
+def _timed(name: str, func: Callable) -> Callable:
+    hist = DB_CALL_SECONDS.labels(name)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(name)
+            raise
+        hist.observe(perf_counter() - start, _row_count(result))
+        return result
+
+    return wrapper
+
+
+def instrumented(cls: type[DatabaseAdapter]) -> type[DatabaseAdapter]:
+    """Class decorator recording latency and row count of every interface method."""
+    for name in DatabaseAdapter.__abstractmethods__:
+        func = cls.__dict__.get(name)
+        if func is not None:
+            setattr(cls, name, _timed(name, func))
+    return cls
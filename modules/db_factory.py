@@ -1,17 +1,20 @@
 from __future__ import annotations
 
 import os
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 from dotenv import load_dotenv
 
+from .config import BASE_DIR
 from .db_base import DatabaseAdapter
-from .db_postgres_adapter import PostgresAdapter
-from .db_sqlite_adapter import SQLiteAdapter
+
+if TYPE_CHECKING:
+    from .db_writer import SQLiteWriter
 
 load_dotenv()
 
 _DB: Optional[DatabaseAdapter] = None
+_WRITER: Optional[SQLiteWriter] = None
 
 
 def _read_backend() -> str:
@@ -24,7 +27,11 @@ def get_db() -> DatabaseAdapter:
     if _DB is None:
         backend = _read_backend().lower()
         log_queries = os.getenv("DB_LOG_QUERIES", "false").lower() == "true"
+        slow_query_ms = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+        # adapters are imported here so that only the configured driver loads
         if backend == "postgres":
+            from .db_postgres_adapter import PostgresAdapter
+
             _DB = PostgresAdapter(
                 host=os.getenv("PG_HOST", "127.0.0.1"),
                 port=int(os.getenv("PG_PORT", "5432")),
@@ -33,10 +40,49 @@ def get_db() -> DatabaseAdapter:
                 password=os.getenv("PG_PASSWORD", ""),
                 sslmode=os.getenv("PG_SSLMODE", "disable"),
                 log_queries=log_queries,
+                pool_size=int(os.getenv("PG_POOL_SIZE", "8")),
+                prepare=os.getenv("PG_PREPARE", "true").lower() == "true",
+                slow_query_ms=slow_query_ms,
             )
         else:
+            from .db_sqlite_adapter import SQLiteAdapter
+
             _DB = SQLiteAdapter(
-                db_path=os.getenv("SQLITE_DB_PATH", "database/db.sqlite3"),
+                db_path=os.getenv("SQLITE_DB_PATH", str(BASE_DIR / "database" / "db.sqlite3")),
                 log_queries=log_queries,
+                cached_statements=int(os.getenv("SQLITE_STATEMENT_CACHE", "256")),
+                read_pool_size=int(os.getenv("SQLITE_READ_POOL", "4")),
+                slow_query_ms=slow_query_ms,
             )
     return _DB
+
+
+def get_writer() -> Optional[SQLiteWriter]:
+    """Return the SQLite writer thread, or None when writes go straight to the adapter.
+
+    Postgres handles concurrent writers itself; SQLITE_WRITER=false turns
+    the queue off for SQLite too.
+    """
+    global _WRITER
+    db = get_db()
+    if _WRITER is not None and _WRITER.db is db:
+        return _WRITER
+    if _read_backend().lower() == "postgres" or os.getenv("SQLITE_WRITER", "true").lower() != "true":
+        return None
+    from .db_writer import SQLiteWriter
+
+    close_writer()
+    _WRITER = SQLiteWriter(
+        db,
+        window_ms=float(os.getenv("SQLITE_WRITE_WINDOW_MS", "20")),
+        max_batch=int(os.getenv("SQLITE_WRITE_BATCH", "256")),
+    )
+    return _WRITER
+
+
+def close_writer() -> None:
+    """Commit queued writes and stop the writer; the next write starts a new one."""
+    global _WRITER
+    writer, _WRITER = _WRITER, None
+    if writer is not None:
+        writer.close()
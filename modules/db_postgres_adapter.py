@@ -1,18 +1,55 @@
 from __future__ import annotations
 
-import time
-from datetime import datetime
-from typing import Any, Iterable, Optional
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Iterable, Iterator, Optional, Sequence
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
-
-from .db_base import DatabaseAdapter
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from . import queries as Q
+from .db_base import DatabaseAdapter, Member, OutboxItem, dedupe_import_rows, instrumented
+from .metrics import DB_SLOW_QUERIES
+from .migrations import Migration, discover, migrate
+from .queries import Query
+from .time_utils import now_epoch, to_epoch
 from .logging_config import logger
 
-SCHEMA_PATH = __file__.rsplit('/', 2)[0] + '/schema/postgres.sql'
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# pg_advisory_lock key serialising migrations of instances sharing a database
+MIGRATION_LOCK_ID = 0x74676D67
+
+MEMBER_RESET = "is_confirmed=FALSE, expires_at=NULL, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL"
+
+
+def _member_row(row: dict[str, Any]) -> Member:
+    member = Member.from_row(row)
+    member.expires_at = to_epoch(row["expires_at"])
+    return member
 
 
+class _PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which catalogue statements it has prepared."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+
+
+@instrumented
 class PostgresAdapter(DatabaseAdapter):
     """PostgreSQL implementation of the database adapter."""
 
@@ -25,92 +62,189 @@ class PostgresAdapter(DatabaseAdapter):
         password: str,
         sslmode: str = "disable",
         log_queries: bool = False,
+        pool_size: int = 8,
+        prepare: bool = True,
+        slow_query_ms: float = 0,
     ) -> None:
-        self.conn_params = dict(host=host, port=port, dbname=db, user=user, password=password, sslmode=sslmode)
+        # a unique application_name marks this instance's changes in NOTIFY payloads
+        self.application_name = f"tg-gate-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.conn_params = dict(
+            host=host, port=port, dbname=db, user=user, password=password, sslmode=sslmode,
+            application_name=self.application_name,
+        )
         self.log_queries = log_queries
+        self.slow_query_ms = slow_query_ms
+        self.pool_size = pool_size
+        # server-side prepared statements do not survive transaction-level
+        # poolers such as PgBouncer; PG_PREPARE=false falls back to plain SQL
+        self.prepare = prepare
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
 
     # Internal helpers -------------------------------------------------
-    def _run(self, sql: str, params: Iterable[Any] | None = None,
-             fetchone: bool = False, fetchall: bool = False) -> Any:
-        params = params or []
-        start = time.time()
-        with psycopg2.connect(**self.conn_params) as conn:
+    def _get_pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        1, max(1, self.pool_size), connection_factory=_PreparingConnection, **self.conn_params
+                    )
+        return self._pool
+
+    @contextmanager
+    def _connection(self) -> Iterator[_PreparingConnection]:
+        """Borrow a pooled connection; commit on success, roll back on error."""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                    if conn.prepared:
+                        # a PREPARE issued in the failed transaction may not exist
+                        with conn.cursor() as cur:
+                            cur.execute("DEALLOCATE ALL")
+                        conn.commit()
+                        conn.prepared.clear()
+                except psycopg2.Error:
+                    conn.close()
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def _execute(self, conn: _PreparingConnection, cur, sql: str | Query, params: Sequence[Any]) -> None:
+        if not isinstance(sql, Query):
+            cur.execute(sql, params)
+        elif not self.prepare:
+            cur.execute(sql.postgres, params)
+        else:
+            if sql.name not in conn.prepared:
+                cur.execute(f"PREPARE {sql.name} AS {sql.prepared}")
+                conn.prepared.add(sql.name)
+            args = f" ({', '.join(['%s'] * sql.nparams)})" if sql.nparams else ""
+            cur.execute(f"EXECUTE {sql.name}{args}", params)
+
+    def listen(self, channel: str) -> psycopg2.extensions.connection:
+        """Open a dedicated autocommit connection subscribed to ``channel``."""
+        # keepalives let the listener notice a dead server instead of idling forever
+        conn = psycopg2.connect(keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3, **self.conn_params)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {channel}")
+        return conn
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+
+    def _run(self, sql: str | Query, params: Iterable[Any] | None = None,
+             fetchone: bool = False, fetchall: bool = False, outbox: Sequence[OutboxItem] = ()) -> Any:
+        """Execute a statement in its own transaction.
+
+        ``outbox`` items are inserted in the same transaction; with
+        ``fetchone`` only if the statement returned a row.
+        """
+        params = list(params or [])
+        with self._connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(sql, params)
+                # timed after the pool hands out a connection
+                start = perf_counter()
+                self._execute(conn, cur, sql, params)
                 res = None
                 if fetchone:
                     res = cur.fetchone()
                 elif fetchall:
                     res = cur.fetchall()
-                conn.commit()
+                if outbox and (not fetchone or res is not None):
+                    now = now_epoch()
+                    for item in outbox:
+                        self._execute(conn, cur, Q.ENQUEUE_OUTBOX, item.params(now))
+                duration = (perf_counter() - start) * 1000
+                if self.slow_query_ms and duration >= self.slow_query_ms:
+                    self._log_slow(cur, sql, params, duration)
         if self.log_queries:
-            duration = (time.time() - start) * 1000
             logger.debug("SQL: %s params=%s %.1fms", sql, params, duration)
         return res
 
+    def _log_slow(self, cur, sql: str | Query, params: list, duration: float) -> None:
+        name = sql.name if isinstance(sql, Query) else "adhoc"
+        text = sql.postgres if isinstance(sql, Query) else sql
+        DB_SLOW_QUERIES.inc(name)
+        # savepoint keeps a failing EXPLAIN from aborting the caller's transaction
+        cur.execute("SAVEPOINT slow_query_explain")
+        try:
+            cur.execute(f"EXPLAIN {text}", params)
+            plan = "\n".join(r["QUERY PLAN"] for r in cur.fetchall())
+            cur.execute("RELEASE SAVEPOINT slow_query_explain")
+        except psycopg2.Error as exc:
+            cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            plan = f"EXPLAIN failed: {exc}"
+        logger.warning("Slow query %s %.1fms: %s params=%s\n%s", name, duration, " ".join(text.split()), params, plan)
+
     # Schema -----------------------------------------------------------
     def init(self) -> None:
-        with psycopg2.connect(**self.conn_params) as conn:
-            with conn.cursor() as cur:
-                with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
-                    cur.execute(f.read())
-            conn.commit()
+        migrate(self, discover("postgres"))
         logger.info("Database initialized")
 
+    def schema_version(self) -> int:
+        # to_regclass avoids an error (and a catalogue lock) when the table is missing
+        if self._run("SELECT to_regclass('schema_version') AS t", fetchone=True)["t"] is None:
+            return 0
+        return self._run("SELECT COALESCE(MAX(version), 0) AS v FROM schema_version", fetchone=True)["v"]
+
+    def apply_migration(self, migration: Migration) -> bool:
+        with self._connection() as conn:
+            # autocommit lets no-transaction migrations run CREATE INDEX
+            # CONCURRENTLY; transactional ones open their own BEGIN
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_lock(%s)", [MIGRATION_LOCK_ID])
+                    try:
+                        return self._apply_locked(cur, migration)
+                    finally:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", [MIGRATION_LOCK_ID])
+            finally:
+                conn.autocommit = False
+
+    def _apply_locked(self, cur, migration: Migration) -> bool:
+        cur.execute(SCHEMA_VERSION_DDL)
+        cur.execute("SELECT 1 FROM schema_version WHERE version=%s", [migration.version])
+        if cur.fetchone():
+            return False
+        record = ("INSERT INTO schema_version (version, name) VALUES (%s, %s)", [migration.version, migration.name])
+        if not migration.transactional:
+            for statement in migration.statements():
+                cur.execute(statement)
+            cur.execute(*record)
+            return True
+        cur.execute("BEGIN")
+        try:
+            cur.execute(migration.sql)
+            cur.execute(*record)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return True
+
     # Member operations ------------------------------------------------
-    def get_member_by_telegram(self, telegram_id: int) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            LEFT JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE m.telegram_id=%s
-            """,
-            [telegram_id],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = exp.isoformat()
-            return res
-        return None
-
-    def get_member_by_membership_id(self, membership_id: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            LEFT JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE m.membership_id=%s
-            """,
-            [membership_id],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = exp.isoformat()
-            return res
-        return None
-
-    def get_member_by_username(self, username: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE u.username=%s
-            """,
-            [username],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = exp.isoformat()
-            return res
-        return None
+    def get_member_by_telegram(self, telegram_id: int) -> Optional[Member]:
+        row = self._run(Q.MEMBER_BY_TELEGRAM, [telegram_id], fetchone=True)
+        return _member_row(row) if row else None
+
+    def get_member_by_membership_id(self, membership_id: str) -> Optional[Member]:
+        row = self._run(Q.MEMBER_BY_MEMBERSHIP_ID, [membership_id], fetchone=True)
+        return _member_row(row) if row else None
+
+    def get_member_by_username(self, username: str) -> Optional[Member]:
+        row = self._run(Q.MEMBER_BY_USERNAME, [username], fetchone=True)
+        return _member_row(row) if row else None
 
     def upsert_member(
         self,
@@ -119,307 +253,238 @@ class PostgresAdapter(DatabaseAdapter):
         username: str | None,
         full_name: str | None,
         is_confirmed: bool = False,
-    ) -> None:
+    ) -> int:
+        # Two statements instead of SELECT ... FOR UPDATE + branching. The CTE
+        # parts share one snapshot, so rebind and release never hit the same row.
         try:
-            with psycopg2.connect(**self.conn_params) as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    # upsert user row --------------------------------------------
-                    cur.execute(
-                        """
-                        INSERT INTO users (telegram_id, username, full_name)
-                        VALUES (%s,%s,%s)
-                        ON CONFLICT(telegram_id) DO UPDATE SET
-                            username=EXCLUDED.username,
-                            full_name=EXCLUDED.full_name
-                        """,
-                        (telegram_id, username, full_name),
-                    )
-
-                    # fetch member rows with lock --------------------------------
-                    cur.execute(
-                        "SELECT * FROM members WHERE membership_id=%s FOR UPDATE",
-                        (membership_id,),
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    self._execute(
+                        conn, cur, Q.UPSERT_USER_REBIND,
+                        (telegram_id, username, full_name, membership_id, telegram_id,
+                         membership_id, telegram_id, membership_id, membership_id),
                     )
-                    row_mid = cur.fetchone()
-                    cur.execute(
-                        "SELECT * FROM members WHERE telegram_id=%s FOR UPDATE",
-                        (telegram_id,),
-                    )
-                    row_tid = cur.fetchone()
-
-                    ic = bool(is_confirmed)
-
-                    if row_mid and not row_tid:
-                        # A. membership exists, telegram not bound yet
-                        cur.execute(
-                            "UPDATE members SET telegram_id=%s, is_confirmed=COALESCE(is_confirmed, %s) WHERE id=%s",
-                            (telegram_id, ic, row_mid["id"]),
-                        )
-                    elif not row_mid and row_tid:
-                        # B. telegram has other membership -> rebind
-                        cur.execute(
-                            "UPDATE members SET membership_id=%s, is_confirmed=COALESCE(is_confirmed, %s) WHERE id=%s",
-                            (membership_id, ic, row_tid["id"]),
-                        )
-                    elif row_mid and row_tid and row_mid["id"] != row_tid["id"]:
-                        # C. conflicting pairs
-                        cur.execute(
-                            "UPDATE members SET telegram_id=NULL WHERE id=%s",
-                            (row_tid["id"],),
-                        )
-                        cur.execute(
-                            "UPDATE members SET telegram_id=%s, is_confirmed=COALESCE(is_confirmed, %s) WHERE id=%s",
-                            (telegram_id, ic, row_mid["id"]),
-                        )
-                    elif row_mid and row_tid and row_mid["id"] == row_tid["id"]:
-                        # existing mapping, ensure confirmed
-                        cur.execute(
-                            "UPDATE members SET is_confirmed=COALESCE(is_confirmed, %s) WHERE id=%s",
-                            (ic, row_mid["id"]),
-                        )
-                    else:
-                        # D. create new row
-                        cur.execute(
-                            "INSERT INTO members (membership_id, telegram_id, is_confirmed) VALUES (%s,%s,%s)",
-                            (membership_id, telegram_id, ic),
-                        )
-                    conn.commit()
+                    self._execute(conn, cur, Q.UPSERT_MEMBER, (membership_id, telegram_id, bool(is_confirmed)))
+                    return cur.fetchone()[0]
         except Exception as exc:
             logger.error("Database error in db_upsert_member: %s", exc)
             raise
 
-    def set_confirmation(self, membership_id: str, is_confirmed: bool, expires_at: datetime | None = None) -> None:
-        self._run(
-            "UPDATE members SET is_confirmed=%s, expires_at=%s, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE membership_id=%s",
-            [is_confirmed, expires_at, membership_id],
-        )
+    def set_confirmation(
+        self,
+        membership_id: str,
+        is_confirmed: bool,
+        expires_at: datetime | None = None,
+        outbox: Sequence[OutboxItem] = (),
+    ) -> None:
+        self._run(Q.SET_CONFIRMATION, [is_confirmed, expires_at, membership_id], outbox=outbox)
 
-    def set_ban(self, membership_id: str, is_banned: bool) -> None:
-        self._run(
-            "UPDATE members SET is_banned=%s WHERE membership_id=%s",
-            [is_banned, membership_id],
-        )
+    def set_ban(self, membership_id: str, is_banned: bool, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.SET_BAN, [is_banned, membership_id], outbox=outbox)
 
     # New helpers using telegram_id -----------------------------------
-    def get_member_by_id_or_username(self, key: int | str) -> Optional[dict[str, Any]]:
+    def get_member_by_id_or_username(self, key: int | str) -> Optional[Member]:
         try:
             key_int = int(key)
             return self.get_member_by_telegram(key_int)
         except (ValueError, TypeError):
-            username = str(key).lstrip("@")
-            row = self._run(
-                """
-                SELECT m.*, u.username, u.full_name FROM members m
-                JOIN users u ON m.telegram_id=u.telegram_id
-                WHERE u.username=%s
-                """,
-                [username],
-                fetchone=True,
-            )
-            if row:
-                res = dict(row)
-                exp = res.get("expires_at")
-                if exp is not None:
-                    res["expires_at"] = exp.isoformat()
-                return res
-            return None
+            return self.get_member_by_username(str(key).lstrip("@"))
 
     def set_banned(self, member_id: int, banned: bool) -> None:
-        self._run(
-            "UPDATE members SET is_banned=%s WHERE telegram_id=%s",
-            [banned, member_id],
-        )
+        self._run(Q.SET_BANNED, [banned, member_id])
 
     def set_confirmed(
         self, member_id: int, confirmed: bool, expires_at: datetime | None = None
     ) -> None:
-        self._run(
-            "UPDATE members SET is_confirmed=%s, expires_at=%s, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE telegram_id=%s",
-            [confirmed, expires_at, member_id],
-        )
+        self._run(Q.SET_CONFIRMED, [confirmed, expires_at, member_id])
 
     def delete_member_by_id(self, member_id: int) -> None:
-        self._run("DELETE FROM members WHERE id=%s", [member_id])
+        self._run(Q.DELETE_MEMBER, [member_id])
 
     def delete_user_by_telegram_id(self, telegram_id: int) -> None:
-        self._run("DELETE FROM users WHERE telegram_id=%s", [telegram_id])
+        self._run(Q.DELETE_USER, [telegram_id])
 
-    def iter_members(self, scope: str) -> Iterable[dict[str, Any]]:
-        now = datetime.utcnow()
+    def iter_members(self, scope: str) -> Iterable[Member]:
         if scope == "active":
-            rows = self._run(
-                """
-                SELECT m.*, u.username, u.full_name FROM members m
-                LEFT JOIN users u ON m.telegram_id=u.telegram_id
-                WHERE m.is_banned=FALSE AND m.is_confirmed=TRUE
-                """,
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                exp = r["expires_at"]
-                if not exp or exp > now:
-                    row = dict(r)
-                    if exp:
-                        row["expires_at"] = exp.isoformat()
-                    result.append(row)
-            return result
-        if scope == "expired":
-            rows = self._run(
-                """
-                SELECT m.*, u.username, u.full_name FROM members m
-                LEFT JOIN users u ON m.telegram_id=u.telegram_id
-                WHERE m.is_confirmed=TRUE AND m.expires_at IS NOT NULL
-                """,
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                exp = r["expires_at"]
-                if exp and exp <= now:
-                    row = dict(r)
-                    row["expires_at"] = exp.isoformat()
-                    result.append(row)
-            return result
-        if scope == "banned":
-            rows = self._run(
-                """
-                SELECT m.*, u.username, u.full_name FROM members m
-                LEFT JOIN users u ON m.telegram_id=u.telegram_id
-                WHERE m.is_banned=TRUE
-                """,
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                row = dict(r)
-                exp = r["expires_at"]
-                if exp:
-                    row["expires_at"] = exp.isoformat()
-                result.append(row)
-            return result
-        rows = self._run(
-            "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id",
-            fetchall=True,
-        )
-        result = []
-        for r in rows:
-            row = dict(r)
-            exp = r["expires_at"]
-            if exp:
-                row["expires_at"] = exp.isoformat()
-            result.append(row)
-        return result
+            rows = self._run(Q.MEMBERS_ACTIVE, [datetime.utcnow()], fetchall=True)
+        elif scope == "expired":
+            rows = self._run(Q.MEMBERS_EXPIRED, [datetime.utcnow()], fetchall=True)
+        elif scope == "banned":
+            rows = self._run(Q.MEMBERS_BANNED, fetchall=True)
+        else:
+            rows = self._run(Q.MEMBERS_ALL, fetchall=True)
+        return [_member_row(r) for r in rows]
 
     def update_expiration(self, membership_id: str, expires_at: datetime | None) -> None:
-        self._run(
-            "UPDATE members SET expires_at=%s, warn_sent_at=NULL, grace_notified_at=NULL WHERE membership_id=%s",
-            [expires_at, membership_id],
-        )
+        self._run(Q.UPDATE_EXPIRATION, [expires_at, membership_id])
 
-    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[dict[str, Any]]:
-        rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=TRUE AND expires_at IS NOT NULL AND warn_sent_at IS NULL",
-            fetchall=True,
-        )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            if 0 < (r["expires_at"] - now).total_seconds() <= threshold:
-                row = dict(r)
-                row["expires_at"] = r["expires_at"].isoformat()
-                result.append(row)
-        return result
-
-    def fetch_expired_members(self, now: datetime) -> list[dict[str, Any]]:
+    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[Member]:
+        rows = self._run(Q.MEMBERS_FOR_WARNING, [now, now + timedelta(seconds=threshold)], fetchall=True)
+        return [_member_row(r) for r in rows]
+
+    def fetch_expired_members(self, now: datetime) -> list[Member]:
+        rows = self._run(Q.EXPIRED_MEMBERS, [now], fetchall=True)
+        return [_member_row(r) for r in rows]
+
+    def mark_warning_sent(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.MARK_WARNING_SENT, [telegram_id], outbox=outbox)
+
+    # Bulk moderation --------------------------------------------------
+    def get_members_by_keys(
+        self,
+        membership_ids: Sequence[str] = (),
+        telegram_ids: Sequence[int] = (),
+        usernames: Sequence[str] = (),
+    ) -> list[Member]:
         rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=TRUE AND expires_at IS NOT NULL",
+            """
+            SELECT m.*, u.username, u.full_name FROM members m
+            LEFT JOIN users u ON m.telegram_id=u.telegram_id
+            WHERE m.membership_id = ANY(%s) OR m.telegram_id = ANY(%s) OR u.username = ANY(%s)
+            """,
+            [list(membership_ids), list(telegram_ids), list(usernames)],
             fetchall=True,
         )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            if r["expires_at"] <= now:
-                row = dict(r)
-                row["expires_at"] = r["expires_at"].isoformat()
-                result.append(row)
-        return result
+        return [_member_row(r) for r in rows]
+
+    def find_members(
+        self, expired_before: datetime | None = None, never_joined: bool = False
+    ) -> list[Member]:
+        sql = """
+            SELECT m.*, u.username, u.full_name FROM members m
+            LEFT JOIN users u ON m.telegram_id=u.telegram_id
+            WHERE m.telegram_id IS NOT NULL
+        """
+        params: list[Any] = []
+        if expired_before is not None:
+            sql += " AND m.expires_at IS NOT NULL AND m.expires_at < %s"
+            params.append(expired_before)
+        if never_joined:
+            sql += " AND m.post_join_sent_at IS NULL"
+        rows = self._run(sql, params, fetchall=True)
+        return [_member_row(r) for r in rows]
+
+    def bulk_moderate(self, action: str, membership_ids: Sequence[str]) -> int:
+        if action not in ("ban", "kick", "remove"):
+            raise ValueError(f"Unknown bulk action: {action}")
+        ids = list(membership_ids)
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    if action == "remove":
+                        cur.execute(
+                            "DELETE FROM members WHERE membership_id = ANY(%s) RETURNING telegram_id",
+                            (ids,),
+                        )
+                        telegram_ids = [r[0] for r in cur.fetchall() if r[0] is not None]
+                        affected = cur.rowcount
+                        cur.execute("DELETE FROM users WHERE telegram_id = ANY(%s)", (telegram_ids,))
+                    else:
+                        banned = "is_banned=TRUE, " if action == "ban" else ""
+                        cur.execute(
+                            f"UPDATE members SET {banned}{MEMBER_RESET} WHERE membership_id = ANY(%s)",
+                            (ids,),
+                        )
+                        affected = cur.rowcount
+            return affected
+        except Exception as exc:
+            logger.error("Database error in bulk_moderate: %s", exc)
+            raise
 
-    def mark_warning_sent(self, telegram_id: int) -> None:
-        self._run("UPDATE members SET warn_sent_at=NOW() WHERE telegram_id=%s", [telegram_id])
+    # Bulk import ------------------------------------------------------
+    def bulk_upsert_members(self, rows: Sequence[tuple[str, int | None, datetime | None]]) -> int:
+        rows = dedupe_import_rows(rows)
+        bound = [(tid, mid) for mid, tid, _ in rows if tid is not None]
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    if bound:
+                        execute_values(
+                            cur,
+                            "INSERT INTO users (telegram_id) VALUES %s ON CONFLICT (telegram_id) DO NOTHING",
+                            [(tid,) for tid, _ in bound],
+                        )
+                        # release telegram IDs bound to other memberships before rebinding
+                        execute_values(
+                            cur,
+                            """
+                            UPDATE members m SET telegram_id=NULL
+                            FROM (VALUES %s) AS v(telegram_id, membership_id)
+                            WHERE m.telegram_id=v.telegram_id AND m.membership_id<>v.membership_id
+                            """,
+                            bound,
+                        )
+                    execute_values(
+                        cur,
+                        """
+                        INSERT INTO members (membership_id, telegram_id, expires_at, is_confirmed)
+                        VALUES %s
+                        ON CONFLICT (membership_id) DO UPDATE SET
+                            telegram_id=COALESCE(EXCLUDED.telegram_id, members.telegram_id),
+                            is_confirmed=TRUE,
+                            expires_at=EXCLUDED.expires_at,
+                            warn_sent_at=NULL,
+                            grace_notified_at=NULL
+                        """,
+                        rows,
+                        template="(%s, %s::BIGINT, %s::TIMESTAMP, TRUE)",
+                    )
+            return len(rows)
+        except Exception as exc:
+            logger.error("Database error in bulk_upsert_members: %s", exc)
+            raise
+
+    # Eligibility index ------------------------------------------------
+    def fetch_eligibility(self) -> list[tuple[int, int, str, bool, bool, int | None]]:
+        rows = self._run(Q.FETCH_ELIGIBILITY, fetchall=True)
+        return [
+            (r["telegram_id"], r["id"], r["membership_id"], r["is_confirmed"], r["is_banned"], r["expires_at"])
+            for r in rows
+        ]
 
     # Post-join helpers -------------------------------------------------
     def was_post_join_sent(self, member_id: int) -> bool:
-        row = self._run(
-            "SELECT post_join_sent_at FROM members WHERE id=%s",
-            [member_id],
-            fetchone=True,
-        )
+        row = self._run(Q.WAS_POST_JOIN_SENT, [member_id], fetchone=True)
         return bool(row and row["post_join_sent_at"])
 
     def mark_post_join_sent(self, member_id: int) -> None:
-        self._run("UPDATE members SET post_join_sent_at=NOW() WHERE id=%s", [member_id])
+        self._run(Q.MARK_POST_JOIN_SENT, [member_id])
+
+    def claim_post_join(self, member_id: int, outbox: Sequence[OutboxItem] = ()) -> tuple[bool, Optional[str]]:
+        row = self._run(Q.CLAIM_POST_JOIN, [member_id], fetchone=True, outbox=outbox)
+        return (True, row["locale"]) if row else (False, None)
+
+    def release_post_join(self, member_id: int) -> None:
+        self._run(Q.RELEASE_POST_JOIN, [member_id])
 
     # Join links -------------------------------------------------------
     def get_join_link(self, chat_id: int) -> Optional[dict[str, Any]]:
-        row = self._run(
-            "SELECT * FROM join_invite_links WHERE chat_id=%s",
-            [chat_id],
-            fetchone=True,
-        )
+        row = self._run(Q.GET_JOIN_LINK, [chat_id], fetchone=True)
         return dict(row) if row else None
 
     def upsert_join_link(self, chat_id: int, invite_link: str) -> None:
-        self._run(
-            """
-            INSERT INTO join_invite_links (chat_id, invite_link)
-            VALUES (%s,%s)
-            ON CONFLICT(chat_id) DO UPDATE SET invite_link=EXCLUDED.invite_link
-            """,
-            [chat_id, invite_link],
-        )
+        self._run(Q.UPSERT_JOIN_LINK, [chat_id, invite_link])
 
     # Renewal helpers --------------------------------------------------
-    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[dict[str, Any]]:
-        rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=TRUE AND expires_at IS NOT NULL AND grace_notified_at IS NULL",
-            fetchall=True,
-        )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            diff = (now - r["expires_at"]).total_seconds()
-            if 0 <= diff <= grace_sec:
-                row = dict(r)
-                row["expires_at"] = r["expires_at"].isoformat()
-                result.append(row)
-        return result
-
-    def mark_grace_notified(self, telegram_id: int) -> None:
-        self._run("UPDATE members SET grace_notified_at=NOW() WHERE telegram_id=%s", [telegram_id])
+    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[Member]:
+        rows = self._run(Q.RECENTLY_EXPIRED, [now, now - timedelta(seconds=grace_sec)], fetchall=True)
+        return [_member_row(r) for r in rows]
+
+    def mark_grace_notified(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.MARK_GRACE_NOTIFIED, [telegram_id], outbox=outbox)
 
     # Admin operations --------------------------------------------------
     def is_admin(self, telegram_id: int) -> bool:
-        row = self._run(
-            "SELECT 1 FROM admins WHERE telegram_id=%s",
-            [telegram_id],
-            fetchone=True,
-        )
-        return row is not None
+        return self._run(Q.IS_ADMIN, [telegram_id], fetchone=True) is not None
 
     def add_admin(self, telegram_id: int, is_top_level: bool = False) -> None:
-        self._run(
-            """
-            INSERT INTO admins (telegram_id, is_top_level)
-            VALUES (%s,%s)
-            ON CONFLICT(telegram_id) DO UPDATE SET is_top_level=EXCLUDED.is_top_level
-            """,
-            [telegram_id, is_top_level],
-        )
+        self._run(Q.ADD_ADMIN, [telegram_id, is_top_level])
 
     def remove_admin(self, telegram_id: int) -> None:
-        self._run("DELETE FROM admins WHERE telegram_id=%s", [telegram_id])
+        self._run(Q.REMOVE_ADMIN, [telegram_id])
 
     def list_admins(self) -> list[dict[str, Any]]:
-        rows = self._run("SELECT * FROM admins", fetchall=True)
-        return [dict(r) for r in rows]
+        return [dict(r) for r in self._run(Q.LIST_ADMINS, fetchall=True)]
 
     # Testing helper ---------------------------------------------------
     def execute(self, sql: str, params: Iterable[Any] | None = None) -> None:
@@ -427,42 +492,94 @@ class PostgresAdapter(DatabaseAdapter):
 
     # User preferences -------------------------------------------------
     def get_user_locale(self, telegram_id: int) -> Optional[str]:
-        row = self._run(
-            "SELECT locale FROM users WHERE telegram_id=%s",
-            [telegram_id],
-            fetchone=True,
-        )
+        row = self._run(Q.GET_USER_LOCALE, [telegram_id], fetchone=True)
         return row["locale"] if row else None
 
     def set_user_locale(self, telegram_id: int, lang: str) -> None:
-        self._run(
-            """
-            INSERT INTO users (telegram_id, locale)
-            VALUES (%s,%s)
-            ON CONFLICT (telegram_id) DO UPDATE SET locale=EXCLUDED.locale
-            """,
-            [telegram_id, lang],
-        )
+        self._run(Q.SET_USER_LOCALE, [telegram_id, lang])
 
     # Media cache ------------------------------------------------------
     def get_media_cache(self, asset_key: str, lang: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            "SELECT file_hash, file_id FROM media_cache WHERE asset_key=%s AND lang=%s",
-            [asset_key, lang],
-            fetchone=True,
-        )
+        row = self._run(Q.GET_MEDIA_CACHE, [asset_key, lang], fetchone=True)
         return dict(row) if row else None
 
     def upsert_media_cache(self, asset_key: str, lang: str, file_hash: str, file_id: str) -> None:
-        self._run(
-            """
-            INSERT INTO media_cache (asset_key, lang, file_hash, file_id)
-            VALUES (%s,%s,%s,%s)
-            ON CONFLICT (asset_key, lang) DO UPDATE SET
-                file_hash=EXCLUDED.file_hash,
-                file_id=EXCLUDED.file_id,
-                updated_at=CURRENT_TIMESTAMP
-            """,
-            [asset_key, lang, file_hash, file_id],
-        )
+        self._run(Q.UPSERT_MEDIA_CACHE, [asset_key, lang, file_hash, file_id])
 
+    # Leases -----------------------------------------------------------
+    def acquire_lease(self, name: str, holder: str, ttl_sec: int) -> bool:
+        return self._run(Q.ACQUIRE_LEASE, [name, holder, ttl_sec], fetchone=True) is not None
+
+    def release_lease(self, name: str, holder: str) -> None:
+        self._run(Q.RELEASE_LEASE, [name, holder])
+
+    def live_leases(self) -> list[tuple[str, str]]:
+        return [(r["name"], r["holder"]) for r in self._run(Q.LIVE_LEASES, fetchall=True)]
+
+    # Outbox -----------------------------------------------------------
+    def enqueue_outbox(self, items: Sequence[OutboxItem]) -> int:
+        now = now_epoch()
+        added = 0
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    for item in items:
+                        self._execute(conn, cur, Q.ENQUEUE_OUTBOX, item.params(now))
+                        added += cur.rowcount
+            return added
+        except Exception as exc:
+            logger.error("Database error in enqueue_outbox: %s", exc)
+            raise
+
+    def record_expiry_pass(
+        self,
+        warned: Sequence[int],
+        graced: Sequence[int],
+        revoked: Sequence[str],
+        outbox: Sequence[OutboxItem] = (),
+    ) -> None:
+        now = now_epoch()
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    for tid in warned:
+                        self._execute(conn, cur, Q.MARK_WARNING_SENT, (tid,))
+                    for tid in graced:
+                        self._execute(conn, cur, Q.MARK_GRACE_NOTIFIED, (tid,))
+                    for mid in revoked:
+                        self._execute(conn, cur, Q.SET_CONFIRMATION, (False, None, mid))
+                    for item in outbox:
+                        self._execute(conn, cur, Q.ENQUEUE_OUTBOX, item.params(now))
+        except Exception as exc:
+            logger.error("Database error in record_expiry_pass: %s", exc)
+            raise
+
+    def claim_outbox(self, now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+        rows = self._run(Q.CLAIM_OUTBOX, [now + lease_sec, now, limit], fetchall=True)
+        return sorted((dict(r) for r in rows), key=lambda r: r["id"])
+
+    def finish_outbox(self, results: Sequence[tuple[int, Optional[str], Optional[int]]]) -> None:
+        now = now_epoch()
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    for item_id, error, retry_at in results:
+                        if error is None:
+                            self._execute(conn, cur, Q.OUTBOX_SENT, (now, item_id))
+                        elif retry_at is not None:
+                            self._execute(conn, cur, Q.OUTBOX_RETRY, (retry_at, error, item_id))
+                        else:
+                            self._execute(conn, cur, Q.OUTBOX_FAILED, (error, item_id))
+        except Exception as exc:
+            logger.error("Database error in finish_outbox: %s", exc)
+            raise
+
+    def purge_outbox(self, before: int) -> int:
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    self._execute(conn, cur, Q.PURGE_OUTBOX, (before,))
+                    return cur.rowcount
+        except Exception as exc:
+            logger.error("Database error in purge_outbox: %s", exc)
+            raise
@@ -2,105 +2,298 @@ from __future__ import annotations
 
 import os
 import sqlite3
-import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable, Optional
-
-from .db_base import DatabaseAdapter
+from time import perf_counter
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from . import queries as Q
+from .db_base import DatabaseAdapter, Member, OutboxItem, dedupe_import_rows, instrumented
+from .metrics import DB_SLOW_QUERIES
+from .migrations import Migration, discover, migrate
+from .queries import Query
+from .time_utils import now_epoch, to_epoch
 from .logging_config import logger
 
-SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema" / "sqlite.sql"
+
+# keep IN (...) lists well below SQLITE_MAX_VARIABLE_NUMBER
+CHUNK_SIZE = 500
+
+MEMBER_RESET = "is_confirmed=0, expires_at=NULL, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL"
+
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def _statements(script: str) -> Iterable[str]:
+    """Split a script into statements; trigger bodies contain ``;`` too."""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf
+            buf = ""
+    if buf.strip() and not all(ln.lstrip().startswith("--") for ln in buf.splitlines() if ln.strip()):
+        yield buf
+
+
+def _chunks(items: Sequence[Any], size: int = CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 
+@instrumented
 class SQLiteAdapter(DatabaseAdapter):
     """SQLite implementation of the database adapter."""
 
-    def __init__(self, db_path: str, log_queries: bool = False) -> None:
+    def __init__(
+        self,
+        db_path: str,
+        log_queries: bool = False,
+        cached_statements: int = 256,
+        slow_query_ms: float = 0,
+        read_pool_size: int = 4,
+    ) -> None:
         self.db_path = db_path
         self.log_queries = log_queries
+        self.slow_query_ms = slow_query_ms
+        self.cached_statements = cached_statements
+        self.read_pool_size = max(1, read_pool_size)
+        # Under WAL readers do not block the writer nor each other. SELECTs
+        # use a pool of read-only connections and never commit; all writes
+        # share one connection serialised by _write_lock. Connections are
+        # long-lived to keep sqlite3's statement cache warm; close() bumps
+        # the generation to reopen them.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        # idle readers; deque append/pop are atomic, the condition is only
+        # used when every reader is busy
+        self._readers: deque[tuple[sqlite3.Connection, int]] = deque()
+        self._reader_count = 0
+        self._readers_cond = threading.Condition(self._lock)
+        self._connections: list[sqlite3.Connection] = []
+        self._generation = 0
 
     # Internal helpers -------------------------------------------------
+    def _open(self, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=self.cached_statements, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+        else:
+            conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements, check_same_thread=False)
+            conn.execute("PRAGMA foreign_keys=ON")
+        conn.row_factory = sqlite3.Row
+        return conn
+
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("PRAGMA foreign_keys=ON")
+        """Return the write connection; callers hold ``_write_lock``."""
+        conn = self._writer
+        if conn is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = self._open(read_only=False)
+                    self._connections.append(self._writer)
+                conn = self._writer
         return conn
 
-    def _run(self, sql: str, params: Iterable[Any] | None = None,
-             fetchone: bool = False, fetchall: bool = False) -> Any:
-        params = params or []
-        conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        start = time.time()
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            yield self._connect()
+
+    def _acquire_reader(self) -> tuple[sqlite3.Connection, int]:
         try:
-            cur = conn.cursor()
-            cur.execute(sql, tuple(params))
-            if fetchone:
-                res = cur.fetchone()
-            elif fetchall:
-                res = cur.fetchall()
-            else:
-                res = None
+            return self._readers.pop()
+        except IndexError:
+            pass
+        with self._readers_cond:
+            while True:
+                if self._readers:
+                    return self._readers.pop()
+                if self._reader_count < self.read_pool_size:
+                    self._reader_count += 1
+                    conn = self._open(read_only=True)
+                    self._connections.append(conn)
+                    return conn, self._generation
+                # the timeout covers a release that raced past notify()
+                self._readers_cond.wait(0.05)
+
+    def _release_reader(self, conn: sqlite3.Connection, generation: int) -> None:
+        if generation != self._generation:
+            return
+        self._readers.append((conn, generation))
+        if self._reader_count >= self.read_pool_size:
+            with self._readers_cond:
+                self._readers_cond.notify()
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection, waiting if all of them are busy."""
+        conn, generation = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn, generation)
+
+    def close(self) -> None:
+        with self._write_lock, self._lock:
+            connections, self._connections = self._connections, []
+            self._writer = None
+            self._readers.clear()
+            self._reader_count = 0
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection) -> None:
+        # inside transaction() the batch owner commits
+        if not getattr(self._local, "batch", False):
             conn.commit()
-            if self.log_queries:
-                duration = (time.time() - start) * 1000
-                logger.debug("SQL: %s params=%s %.1fms", sql, params, duration)
-            return res
-        except Exception as exc:
+
+    def _rollback(self, conn: sqlite3.Connection) -> None:
+        if not getattr(self._local, "batch", False):
             conn.rollback()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run this thread's adapter calls in one IMMEDIATE transaction.
+
+        Used by :class:`modules.db_writer.SQLiteWriter` to commit a batch of
+        writes at once; the methods called inside skip their own commit.
+        """
+        with self._writing() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.batch = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.batch = False
+
+    def _run(self, sql: str | Query, params: Iterable[Any] | None = None,
+             fetchone: bool = False, fetchall: bool = False, outbox: Sequence[OutboxItem] = ()) -> Any:
+        """Execute a write on the write connection and commit it.
+
+        ``outbox`` items are inserted in the same transaction; with
+        ``fetchone`` only if the statement returned a row.
+        """
+        with self._writing() as conn:
+            start = perf_counter()
+            try:
+                res = self._fetch(conn, sql, params, fetchone, fetchall)
+                if outbox and (not fetchone or res is not None):
+                    now = now_epoch()
+                    conn.executemany(Q.ENQUEUE_OUTBOX.sqlite, [item.params(now) for item in outbox])
+                self._commit(conn)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("DB error: %s", exc)
+                raise
+            self._finish(conn, sql, params, start)
+        return res
+
+    def _query(self, sql: str | Query, params: Iterable[Any] | None = None,
+               fetchone: bool = False, fetchall: bool = False) -> Any:
+        """Execute a SELECT on a pooled read-only connection."""
+        # no context manager on this hot path
+        conn, generation = self._acquire_reader()
+        try:
+            start = perf_counter()
+            res = self._fetch(conn, sql, params, fetchone, fetchall)
+            self._finish(conn, sql, params, start)
+        except Exception as exc:
             logger.error("DB error: %s", exc)
             raise
         finally:
-            conn.close()
+            self._release_reader(conn, generation)
+        return res
+
+    @staticmethod
+    def _fetch(conn: sqlite3.Connection, sql: str | Query, params: Iterable[Any] | None,
+               fetchone: bool, fetchall: bool) -> Any:
+        cur = conn.execute(sql.sqlite if isinstance(sql, Query) else sql, tuple(params or ()))
+        if fetchone:
+            return cur.fetchone()
+        if fetchall:
+            return cur.fetchall()
+        return None
+
+    def _finish(self, conn: sqlite3.Connection, sql: str | Query, params: Iterable[Any] | None, start: float) -> None:
+        duration = (perf_counter() - start) * 1000
+        if not (self.log_queries or self.slow_query_ms and duration >= self.slow_query_ms):
+            return
+        name = sql.name if isinstance(sql, Query) else "adhoc"
+        text = sql.sqlite if isinstance(sql, Query) else sql
+        params = tuple(params or ())
+        if self.log_queries:
+            logger.debug("SQL: %s params=%s %.1fms", text, params, duration)
+        if self.slow_query_ms and duration >= self.slow_query_ms:
+            self._log_slow(conn, name, text, params, duration)
+
+    def _log_slow(self, conn: sqlite3.Connection, name: str, sql: str, params: tuple, duration: float) -> None:
+        DB_SLOW_QUERIES.inc(name)
+        try:
+            plan = "\n".join(r["detail"] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        except sqlite3.Error as exc:
+            plan = f"EXPLAIN failed: {exc}"
+        logger.warning("Slow query %s %.1fms: %s params=%s\n%s", name, duration, " ".join(sql.split()), params, plan)
 
     # Schema -----------------------------------------------------------
     def init(self) -> None:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        conn = self._connect()
-        try:
-            with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
-                conn.executescript(f.read())
-            conn.commit()
-            logger.info("Database initialized")
-        finally:
-            conn.close()
+        with self._writing() as conn:
+            # persistent; lets the read pool run alongside the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+        migrate(self, discover("sqlite"))
+        logger.info("Database initialized")
+
+    def schema_version(self) -> int:
+        if self._query("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'", fetchone=True) is None:
+            return 0
+        return self._query("SELECT COALESCE(MAX(version), 0) FROM schema_version", fetchone=True)[0]
+
+    def apply_migration(self, migration: Migration) -> bool:
+        with self._writing() as conn:
+            # SQLite DDL is transactional, so every migration runs in one
+            # write transaction; IMMEDIATE takes the write lock up front
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(SCHEMA_VERSION_DDL)
+                if conn.execute("SELECT 1 FROM schema_version WHERE version=?", (migration.version,)).fetchone():
+                    conn.rollback()
+                    return False
+                for statement in _statements(migration.sql):
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (migration.version, migration.name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return True
 
     # Member operations ------------------------------------------------
-    def get_member_by_telegram(self, telegram_id: int) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            LEFT JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE m.telegram_id=?
-            """,
-            [telegram_id],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-            return res
-        return None
+    def get_member_by_telegram(self, telegram_id: int) -> Optional[Member]:
+        row = self._query(Q.MEMBER_BY_TELEGRAM, [telegram_id], fetchone=True)
+        return Member.from_row(row) if row else None
 
-    def get_member_by_membership_id(self, membership_id: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            LEFT JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE m.membership_id=?
-            """,
-            [membership_id],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-            return res
-        return None
+    def get_member_by_membership_id(self, membership_id: str) -> Optional[Member]:
+        row = self._query(Q.MEMBER_BY_MEMBERSHIP_ID, [membership_id], fetchone=True)
+        return Member.from_row(row) if row else None
 
     def upsert_member(
         self,
@@ -109,327 +302,245 @@ class SQLiteAdapter(DatabaseAdapter):
         username: str | None,
         full_name: str | None,
         is_confirmed: bool = False,
+    ) -> int:
+        # Set-based statements instead of SELECT + branching: the write lock
+        # is taken by the first INSERT and held only for these four statements.
+        with self._writing() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(Q.UPSERT_USER.sqlite, (telegram_id, username, full_name))
+                cur.execute(Q.REBIND_MEMBER.sqlite, (membership_id, telegram_id, membership_id))
+                cur.execute(Q.RELEASE_TELEGRAM.sqlite, (telegram_id, membership_id))
+                cur.execute(Q.UPSERT_MEMBER.sqlite, (membership_id, telegram_id, int(is_confirmed)))
+                member_id = cur.fetchone()[0]
+                self._commit(conn)
+                return member_id
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in db_upsert_member: %s", exc)
+                raise
+
+    def set_confirmation(
+        self,
+        membership_id: str,
+        is_confirmed: bool,
+        expires_at: datetime | None = None,
+        outbox: Sequence[OutboxItem] = (),
     ) -> None:
-        conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        try:
-            conn.execute("BEGIN IMMEDIATE")
-            cur = conn.cursor()
-            # upsert user row -------------------------------------------------
-            cur.execute(
-                """
-                INSERT INTO users (telegram_id, username, full_name)
-                VALUES (?,?,?)
-                ON CONFLICT(telegram_id) DO UPDATE SET
-                    username=excluded.username,
-                    full_name=excluded.full_name
-                """,
-                (telegram_id, username, full_name),
-            )
-
-            # fetch existing member rows -----------------------------------
-            cur.execute(
-                "SELECT * FROM members WHERE membership_id=?",
-                (membership_id,),
-            )
-            row_mid = cur.fetchone()
-            cur.execute(
-                "SELECT * FROM members WHERE telegram_id=?",
-                (telegram_id,),
-            )
-            row_tid = cur.fetchone()
-
-            ic = 1 if is_confirmed else 0
-
-            if row_mid and not row_tid:
-                # A. membership exists, telegram not yet bound
-                cur.execute(
-                    "UPDATE members SET telegram_id=?, is_confirmed=COALESCE(is_confirmed, ?) WHERE id=?",
-                    (telegram_id, ic, row_mid["id"]),
-                )
-            elif not row_mid and row_tid:
-                # B. telegram bound to different membership -> rebind
-                cur.execute(
-                    "UPDATE members SET membership_id=?, is_confirmed=COALESCE(is_confirmed, ?) WHERE id=?",
-                    (membership_id, ic, row_tid["id"]),
-                )
-            elif row_mid and row_tid and row_mid["id"] != row_tid["id"]:
-                # C. conflicting membership/telegram pairs
-                cur.execute(
-                    "UPDATE members SET telegram_id=NULL WHERE id=?",
-                    (row_tid["id"],),
-                )
-                cur.execute(
-                    "UPDATE members SET telegram_id=?, is_confirmed=COALESCE(is_confirmed, ?) WHERE id=?",
-                    (telegram_id, ic, row_mid["id"]),
-                )
-            elif row_mid and row_tid and row_mid["id"] == row_tid["id"]:
-                # existing mapping, ensure confirmation field is set
-                cur.execute(
-                    "UPDATE members SET is_confirmed=COALESCE(is_confirmed, ?) WHERE id=?",
-                    (ic, row_mid["id"]),
-                )
-            else:
-                # D. no records yet
-                cur.execute(
-                    "INSERT INTO members (membership_id, telegram_id, is_confirmed) VALUES (?,?,?)",
-                    (membership_id, telegram_id, ic),
-                )
-            conn.commit()
-        except Exception as exc:
-            conn.rollback()
-            logger.error("Database error in db_upsert_member: %s", exc)
-            raise
-        finally:
-            conn.close()
-
-    def set_confirmation(self, membership_id: str, is_confirmed: bool, expires_at: datetime | None = None) -> None:
-        expires = int(expires_at.timestamp()) if expires_at else None
-        self._run(
-            "UPDATE members SET is_confirmed=?, expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE membership_id=?",
-            [int(is_confirmed), expires, membership_id],
-        )
+        self._run(Q.SET_CONFIRMATION, [int(is_confirmed), to_epoch(expires_at), membership_id], outbox=outbox)
 
-    def set_ban(self, membership_id: str, is_banned: bool) -> None:
-        self._run(
-            "UPDATE members SET is_banned=? WHERE membership_id=?",
-            [int(is_banned), membership_id],
-        )
+    def set_ban(self, membership_id: str, is_banned: bool, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.SET_BAN, [int(is_banned), membership_id], outbox=outbox)
 
     # New helpers using telegram_id -----------------------------------
-    def get_member_by_id_or_username(self, key: int | str) -> Optional[dict[str, Any]]:
+    def get_member_by_id_or_username(self, key: int | str) -> Optional[Member]:
         try:
             key_int = int(key)
             return self.get_member_by_telegram(key_int)
         except (ValueError, TypeError):
-            username = str(key).lstrip("@")
-            row = self._run(
-                """
-                SELECT m.*, u.username, u.full_name FROM members m
-                JOIN users u ON m.telegram_id=u.telegram_id
-                WHERE u.username=?
-                """,
-                [username],
-                fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-            return res
-        return None
+            return self.get_member_by_username(str(key).lstrip("@"))
 
-    def get_member_by_username(self, username: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            """
-            SELECT m.*, u.username, u.full_name FROM members m
-            JOIN users u ON m.telegram_id=u.telegram_id
-            WHERE u.username=?
-            """,
-            [username],
-            fetchone=True,
-        )
-        if row:
-            res = dict(row)
-            exp = res.get("expires_at")
-            if exp is not None:
-                res["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-            return res
-        return None
+    def get_member_by_username(self, username: str) -> Optional[Member]:
+        row = self._query(Q.MEMBER_BY_USERNAME, [username], fetchone=True)
+        return Member.from_row(row) if row else None
 
     def set_banned(self, member_id: int, banned: bool) -> None:
-        self._run(
-            "UPDATE members SET is_banned=? WHERE telegram_id=?",
-            [int(banned), member_id],
-        )
+        self._run(Q.SET_BANNED, [int(banned), member_id])
 
     def set_confirmed(
         self, member_id: int, confirmed: bool, expires_at: datetime | None = None
     ) -> None:
-        expires = int(expires_at.timestamp()) if expires_at else None
-        self._run(
-            "UPDATE members SET is_confirmed=?, expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE telegram_id=?",
-            [int(confirmed), expires, member_id],
-        )
+        self._run(Q.SET_CONFIRMED, [int(confirmed), to_epoch(expires_at), member_id])
 
     def delete_member_by_id(self, member_id: int) -> None:
-        self._run("DELETE FROM members WHERE id=?", [member_id])
+        self._run(Q.DELETE_MEMBER, [member_id])
 
     def delete_user_by_telegram_id(self, telegram_id: int) -> None:
-        self._run("DELETE FROM users WHERE telegram_id=?", [telegram_id])
+        self._run(Q.DELETE_USER, [telegram_id])
 
-    def iter_members(self, scope: str) -> Iterable[dict[str, Any]]:
-        now = datetime.utcnow()
+    def iter_members(self, scope: str) -> Iterable[Member]:
         if scope == "active":
-            rows = self._run(
-                "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id WHERE m.is_banned=0 AND m.is_confirmed=1",
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                exp = r["expires_at"]
-                if not exp or datetime.utcfromtimestamp(exp) > now:
-                    row = dict(r)
-                    if exp:
-                        row["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-                    result.append(row)
-            return result
-        if scope == "expired":
-            rows = self._run(
-                "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id WHERE m.is_confirmed=1 AND m.expires_at IS NOT NULL",
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                exp = r["expires_at"]
-                if exp and datetime.utcfromtimestamp(exp) <= now:
-                    row = dict(r)
-                    row["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-                    result.append(row)
-            return result
-        if scope == "banned":
-            rows = self._run(
-                "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id WHERE m.is_banned=1",
-                fetchall=True,
-            )
-            result = []
-            for r in rows:
-                exp = r["expires_at"]
-                row = dict(r)
-                if exp:
-                    row["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-                result.append(row)
-            return result
-        rows = self._run(
-            "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id",
-            fetchall=True,
-        )
-        result = []
-        for r in rows:
-            exp = r["expires_at"]
-            row = dict(r)
-            if exp:
-                row["expires_at"] = datetime.utcfromtimestamp(exp).isoformat()
-            result.append(row)
-        return result
+            rows = self._query(Q.MEMBERS_ACTIVE, [now_epoch()], fetchall=True)
+        elif scope == "expired":
+            rows = self._query(Q.MEMBERS_EXPIRED, [now_epoch()], fetchall=True)
+        elif scope == "banned":
+            rows = self._query(Q.MEMBERS_BANNED, fetchall=True)
+        else:
+            rows = self._query(Q.MEMBERS_ALL, fetchall=True)
+        return [Member.from_row(r) for r in rows]
 
     def update_expiration(self, membership_id: str, expires_at: datetime | None) -> None:
-        expires = int(expires_at.timestamp()) if expires_at else None
-        self._run(
-            "UPDATE members SET expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL WHERE membership_id=?",
-            [expires, membership_id],
-        )
-
-    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[dict[str, Any]]:
-        rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=1 AND expires_at IS NOT NULL AND warn_sent_at IS NULL",
-            fetchall=True,
-        )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            expires = datetime.utcfromtimestamp(r["expires_at"])
-            if 0 < (expires - now).total_seconds() <= threshold:
-                row = dict(r)
-                row["expires_at"] = expires.isoformat()
-                result.append(row)
-        return result
-
-    def fetch_expired_members(self, now: datetime) -> list[dict[str, Any]]:
-        rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=1 AND expires_at IS NOT NULL",
-            fetchall=True,
-        )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            expires = datetime.utcfromtimestamp(r["expires_at"])
-            if expires <= now:
-                row = dict(r)
-                row["expires_at"] = expires.isoformat()
-                result.append(row)
-        return result
-
-    def mark_warning_sent(self, telegram_id: int) -> None:
-        now = datetime.utcnow().isoformat()
-        self._run("UPDATE members SET warn_sent_at=? WHERE telegram_id=?", [now, telegram_id])
+        self._run(Q.UPDATE_EXPIRATION, [to_epoch(expires_at), membership_id])
+
+    def fetch_members_for_warning(self, now: datetime, threshold: int) -> list[Member]:
+        now_ts = to_epoch(now)
+        rows = self._query(Q.MEMBERS_FOR_WARNING, [now_ts, now_ts + threshold], fetchall=True)
+        return [Member.from_row(r) for r in rows]
+
+    def fetch_expired_members(self, now: datetime) -> list[Member]:
+        rows = self._query(Q.EXPIRED_MEMBERS, [to_epoch(now)], fetchall=True)
+        return [Member.from_row(r) for r in rows]
+
+    def mark_warning_sent(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.MARK_WARNING_SENT, [datetime.utcnow().isoformat(), telegram_id], outbox=outbox)
+
+    # Bulk moderation --------------------------------------------------
+    def get_members_by_keys(
+        self,
+        membership_ids: Sequence[str] = (),
+        telegram_ids: Sequence[int] = (),
+        usernames: Sequence[str] = (),
+    ) -> list[Member]:
+        base = "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id WHERE "
+        found: dict[int, Member] = {}
+        for column, keys in (
+            ("m.membership_id", list(membership_ids)),
+            ("m.telegram_id", list(telegram_ids)),
+            ("u.username", list(usernames)),
+        ):
+            for chunk in _chunks(keys):
+                marks = ",".join("?" * len(chunk))
+                for r in self._query(f"{base}{column} IN ({marks})", chunk, fetchall=True):
+                    found.setdefault(r["id"], Member.from_row(r))
+        return list(found.values())
+
+    def find_members(
+        self, expired_before: datetime | None = None, never_joined: bool = False
+    ) -> list[Member]:
+        sql = "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id WHERE m.telegram_id IS NOT NULL"
+        params: list[Any] = []
+        if expired_before is not None:
+            sql += " AND m.expires_at IS NOT NULL AND m.expires_at < ?"
+            params.append(to_epoch(expired_before))
+        if never_joined:
+            sql += " AND m.post_join_sent_at IS NULL"
+        rows = self._query(sql, params, fetchall=True)
+        return [Member.from_row(r) for r in rows]
+
+    def bulk_moderate(self, action: str, membership_ids: Sequence[str]) -> int:
+        if action not in ("ban", "kick", "remove"):
+            raise ValueError(f"Unknown bulk action: {action}")
+        ids = list(membership_ids)
+        with self._writing() as conn:
+            try:
+                cur = conn.cursor()
+                if action == "remove":
+                    telegram_ids: list[int] = []
+                    for chunk in _chunks(ids):
+                        marks = ",".join("?" * len(chunk))
+                        cur.execute(
+                            f"SELECT telegram_id FROM members WHERE membership_id IN ({marks}) AND telegram_id IS NOT NULL",
+                            chunk,
+                        )
+                        telegram_ids.extend(r[0] for r in cur.fetchall())
+                    cur.executemany("DELETE FROM members WHERE membership_id=?", [(mid,) for mid in ids])
+                    affected = cur.rowcount
+                    cur.executemany("DELETE FROM users WHERE telegram_id=?", [(tid,) for tid in telegram_ids])
+                else:
+                    banned = "is_banned=1, " if action == "ban" else ""
+                    cur.executemany(
+                        f"UPDATE members SET {banned}{MEMBER_RESET} WHERE membership_id=?",
+                        [(mid,) for mid in ids],
+                    )
+                    affected = cur.rowcount
+                self._commit(conn)
+                return affected
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in bulk_moderate: %s", exc)
+                raise
+
+    # Bulk import ------------------------------------------------------
+    def bulk_upsert_members(self, rows: Sequence[tuple[str, int | None, datetime | None]]) -> int:
+        rows = [
+            (mid, tid, to_epoch(exp))
+            for mid, tid, exp in dedupe_import_rows(rows)
+        ]
+        bound = [(tid, mid) for mid, tid, _ in rows if tid is not None]
+        with self._writing() as conn:
+            try:
+                cur = conn.cursor()
+                cur.executemany(
+                    "INSERT INTO users (telegram_id) VALUES (?) ON CONFLICT(telegram_id) DO NOTHING",
+                    [(tid,) for tid, _ in bound],
+                )
+                # release telegram IDs bound to other memberships before rebinding
+                cur.executemany(
+                    "UPDATE members SET telegram_id=NULL WHERE telegram_id=? AND membership_id<>?",
+                    bound,
+                )
+                cur.executemany(
+                    """
+                    INSERT INTO members (membership_id, telegram_id, is_confirmed, expires_at)
+                    VALUES (?,?,1,?)
+                    ON CONFLICT(membership_id) DO UPDATE SET
+                        telegram_id=COALESCE(excluded.telegram_id, members.telegram_id),
+                        is_confirmed=1,
+                        expires_at=excluded.expires_at,
+                        warn_sent_at=NULL,
+                        grace_notified_at=NULL
+                    """,
+                    rows,
+                )
+                self._commit(conn)
+                return len(rows)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in bulk_upsert_members: %s", exc)
+                raise
+
+    # Eligibility index ------------------------------------------------
+    def fetch_eligibility(self) -> list[tuple[int, int, str, bool, bool, int | None]]:
+        rows = self._query(Q.FETCH_ELIGIBILITY, fetchall=True)
+        return [
+            (r["telegram_id"], r["id"], r["membership_id"], bool(r["is_confirmed"]), bool(r["is_banned"]), r["expires_at"])
+            for r in rows
+        ]
 
     # Post-join helpers -------------------------------------------------
     def was_post_join_sent(self, member_id: int) -> bool:
-        row = self._run(
-            "SELECT post_join_sent_at FROM members WHERE id=?",
-            [member_id],
-            fetchone=True,
-        )
+        row = self._query(Q.WAS_POST_JOIN_SENT, [member_id], fetchone=True)
         return bool(row and row["post_join_sent_at"])
 
     def mark_post_join_sent(self, member_id: int) -> None:
-        now = datetime.utcnow().isoformat()
-        self._run("UPDATE members SET post_join_sent_at=? WHERE id=?", [now, member_id])
+        self._run(Q.MARK_POST_JOIN_SENT, [datetime.utcnow().isoformat(), member_id])
+
+    def claim_post_join(self, member_id: int, outbox: Sequence[OutboxItem] = ()) -> tuple[bool, Optional[str]]:
+        row = self._run(Q.CLAIM_POST_JOIN, [datetime.utcnow().isoformat(), member_id], fetchone=True, outbox=outbox)
+        return (True, row["locale"]) if row else (False, None)
+
+    def release_post_join(self, member_id: int) -> None:
+        self._run(Q.RELEASE_POST_JOIN, [member_id])
 
     # Join links -------------------------------------------------------
     def get_join_link(self, chat_id: int) -> Optional[dict[str, Any]]:
-        row = self._run(
-            "SELECT * FROM join_invite_links WHERE chat_id=?",
-            [chat_id],
-            fetchone=True,
-        )
+        row = self._query(Q.GET_JOIN_LINK, [chat_id], fetchone=True)
         return dict(row) if row else None
 
     def upsert_join_link(self, chat_id: int, invite_link: str) -> None:
-        self._run(
-            """
-            INSERT INTO join_invite_links (chat_id, invite_link)
-            VALUES (?,?)
-            ON CONFLICT(chat_id) DO UPDATE SET invite_link=excluded.invite_link
-            """,
-            [chat_id, invite_link],
-        )
+        self._run(Q.UPSERT_JOIN_LINK, [chat_id, invite_link])
 
     # Renewal helpers --------------------------------------------------
-    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[dict[str, Any]]:
-        rows = self._run(
-            "SELECT * FROM members WHERE is_confirmed=1 AND expires_at IS NOT NULL AND grace_notified_at IS NULL",
-            fetchall=True,
-        )
-        result: list[dict[str, Any]] = []
-        for r in rows:
-            expires = datetime.utcfromtimestamp(r["expires_at"])
-            diff = (now - expires).total_seconds()
-            if 0 <= diff <= grace_sec:
-                row = dict(r)
-                row["expires_at"] = expires.isoformat()
-                result.append(row)
-        return result
-
-    def mark_grace_notified(self, telegram_id: int) -> None:
-        now = datetime.utcnow().isoformat()
-        self._run("UPDATE members SET grace_notified_at=? WHERE telegram_id=?", [now, telegram_id])
+    def fetch_recently_expired(self, now: datetime, grace_sec: int) -> list[Member]:
+        now_ts = to_epoch(now)
+        rows = self._query(Q.RECENTLY_EXPIRED, [now_ts, now_ts - grace_sec], fetchall=True)
+        return [Member.from_row(r) for r in rows]
+
+    def mark_grace_notified(self, telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> None:
+        self._run(Q.MARK_GRACE_NOTIFIED, [datetime.utcnow().isoformat(), telegram_id], outbox=outbox)
 
     # Admin operations --------------------------------------------------
     def is_admin(self, telegram_id: int) -> bool:
-        row = self._run(
-            "SELECT 1 FROM admins WHERE telegram_id=?",
-            [telegram_id],
-            fetchone=True,
-        )
-        return row is not None
+        return self._query(Q.IS_ADMIN, [telegram_id], fetchone=True) is not None
 
     def add_admin(self, telegram_id: int, is_top_level: bool = False) -> None:
-        self._run(
-            """
-            INSERT INTO admins (telegram_id, is_top_level)
-            VALUES (?,?)
-            ON CONFLICT(telegram_id) DO UPDATE SET is_top_level=excluded.is_top_level
-            """,
-            [telegram_id, int(is_top_level)],
-        )
+        self._run(Q.ADD_ADMIN, [telegram_id, int(is_top_level)])
 
     def remove_admin(self, telegram_id: int) -> None:
-        self._run("DELETE FROM admins WHERE telegram_id=?", [telegram_id])
+        self._run(Q.REMOVE_ADMIN, [telegram_id])
 
     def list_admins(self) -> list[dict[str, Any]]:
-        rows = self._run("SELECT * FROM admins", fetchall=True)
-        return [dict(r) for r in rows]
+        return [dict(r) for r in self._query(Q.LIST_ADMINS, fetchall=True)]
 
     # Testing helper ---------------------------------------------------
     def execute(self, sql: str, params: Iterable[Any] | None = None) -> None:
@@ -437,42 +548,92 @@ class SQLiteAdapter(DatabaseAdapter):
 
     # User preferences -------------------------------------------------
     def get_user_locale(self, telegram_id: int) -> Optional[str]:
-        row = self._run(
-            "SELECT locale FROM users WHERE telegram_id=?",
-            [telegram_id],
-            fetchone=True,
-        )
+        row = self._query(Q.GET_USER_LOCALE, [telegram_id], fetchone=True)
         return row["locale"] if row else None
 
     def set_user_locale(self, telegram_id: int, lang: str) -> None:
-        self._run(
-            """
-            INSERT INTO users (telegram_id, locale)
-            VALUES (?,?)
-            ON CONFLICT(telegram_id) DO UPDATE SET locale=excluded.locale
-            """,
-            [telegram_id, lang],
-        )
+        self._run(Q.SET_USER_LOCALE, [telegram_id, lang])
 
     # Media cache ------------------------------------------------------
     def get_media_cache(self, asset_key: str, lang: str) -> Optional[dict[str, Any]]:
-        row = self._run(
-            "SELECT file_hash, file_id FROM media_cache WHERE asset_key=? AND lang=?",
-            [asset_key, lang],
-            fetchone=True,
-        )
+        row = self._query(Q.GET_MEDIA_CACHE, [asset_key, lang], fetchone=True)
         return dict(row) if row else None
 
     def upsert_media_cache(self, asset_key: str, lang: str, file_hash: str, file_id: str) -> None:
-        self._run(
-            """
-            INSERT INTO media_cache (asset_key, lang, file_hash, file_id)
-            VALUES (?,?,?,?)
-            ON CONFLICT(asset_key, lang) DO UPDATE SET
-                file_hash=excluded.file_hash,
-                file_id=excluded.file_id,
-                updated_at=CURRENT_TIMESTAMP
-            """,
-            [asset_key, lang, file_hash, file_id],
-        )
-
+        self._run(Q.UPSERT_MEDIA_CACHE, [asset_key, lang, file_hash, file_id])
+
+    # Leases -----------------------------------------------------------
+    def acquire_lease(self, name: str, holder: str, ttl_sec: int) -> bool:
+        return self._run(Q.ACQUIRE_LEASE, [name, holder, ttl_sec], fetchone=True) is not None
+
+    def release_lease(self, name: str, holder: str) -> None:
+        self._run(Q.RELEASE_LEASE, [name, holder])
+
+    def live_leases(self) -> list[tuple[str, str]]:
+        return [(r["name"], r["holder"]) for r in self._query(Q.LIVE_LEASES, fetchall=True)]
+
+    # Outbox -----------------------------------------------------------
+    def enqueue_outbox(self, items: Sequence[OutboxItem]) -> int:
+        now = now_epoch()
+        with self._writing() as conn:
+            try:
+                cur = conn.executemany(Q.ENQUEUE_OUTBOX.sqlite, [item.params(now) for item in items])
+                self._commit(conn)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in enqueue_outbox: %s", exc)
+                raise
+        return cur.rowcount
+
+    def record_expiry_pass(
+        self,
+        warned: Sequence[int],
+        graced: Sequence[int],
+        revoked: Sequence[str],
+        outbox: Sequence[OutboxItem] = (),
+    ) -> None:
+        now = now_epoch()
+        stamp = datetime.utcnow().isoformat()
+        with self._writing() as conn:
+            try:
+                conn.executemany(Q.MARK_WARNING_SENT.sqlite, [(stamp, tid) for tid in warned])
+                conn.executemany(Q.MARK_GRACE_NOTIFIED.sqlite, [(stamp, tid) for tid in graced])
+                conn.executemany(Q.SET_CONFIRMATION.sqlite, [(0, None, mid) for mid in revoked])
+                conn.executemany(Q.ENQUEUE_OUTBOX.sqlite, [item.params(now) for item in outbox])
+                self._commit(conn)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in record_expiry_pass: %s", exc)
+                raise
+
+    def claim_outbox(self, now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+        rows = self._run(Q.CLAIM_OUTBOX, [now + lease_sec, now, limit], fetchall=True)
+        return sorted((dict(r) for r in rows), key=lambda r: r["id"])
+
+    def finish_outbox(self, results: Sequence[tuple[int, Optional[str], Optional[int]]]) -> None:
+        now = now_epoch()
+        with self._writing() as conn:
+            try:
+                for item_id, error, retry_at in results:
+                    if error is None:
+                        conn.execute(Q.OUTBOX_SENT.sqlite, (now, item_id))
+                    elif retry_at is not None:
+                        conn.execute(Q.OUTBOX_RETRY.sqlite, (retry_at, error, item_id))
+                    else:
+                        conn.execute(Q.OUTBOX_FAILED.sqlite, (error, item_id))
+                self._commit(conn)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in finish_outbox: %s", exc)
+                raise
+
+    def purge_outbox(self, before: int) -> int:
+        with self._writing() as conn:
+            try:
+                cur = conn.execute(Q.PURGE_OUTBOX.sqlite, (before,))
+                self._commit(conn)
+            except Exception as exc:
+                self._rollback(conn)
+                logger.error("Database error in purge_outbox: %s", exc)
+                raise
+        return cur.rowcount
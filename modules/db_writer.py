@@ -0,0 +1,169 @@
+"""Single writer thread in front of :class:`SQLiteAdapter`.
+
+SQLite lets one connection write at a time; handlers, the expiry loop and
+admin commands writing from different threads waited on the file lock or
+failed with ``database is locked``. :class:`SQLiteWriter` owns the only
+writing connection and commits whatever queued up while the previous
+batch was running in one transaction, so a burst costs one fsync instead
+of one per statement.
+
+Writes submitted with a ``key`` are write-behind: a newer write with the
+same method and key replaces the queued one (e.g. repeated
+``set_user_locale`` for the same user) and the caller does not wait for
+it. Each write runs under a savepoint, so one failing call does not
+discard the rest of the batch; its future gets the exception.
+"""
+from __future__ import annotations
+
+import itertools
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Hashable, Optional
+
+from .db_sqlite_adapter import SQLiteAdapter
+from .logging_config import logger
+from .metrics import DB_WRITE_BATCH_SECONDS, DB_WRITE_QUEUE, DB_WRITES_COALESCED
+
+
+@dataclass(slots=True)
+class _Write:
+    method: str
+    args: tuple
+    futures: list[Future] = field(default_factory=list)
+
+    def resolve(self, result: Any = None, exc: Optional[BaseException] = None) -> None:
+        for future in self.futures:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+class SQLiteWriter:
+    """Queue of adapter writes drained by one thread in batched transactions."""
+
+    def __init__(self, db: SQLiteAdapter, window_ms: float = 20, max_batch: int = 256) -> None:
+        self.db = db
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        # insertion ordered; keyed writes use (method, key), others a sequence number
+        self._queue: dict[Hashable, _Write] = {}
+        # keyed writes taken by the thread but not committed yet
+        self._inflight: dict[Hashable, _Write] = {}
+        self._seq = itertools.count()
+        self._urgent = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(target=self._loop, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, method: str, *args: Any, key: Hashable = None) -> Future:
+        """Queue ``db.<method>(*args)`` and return a future with its result.
+
+        Without ``key`` the writer starts the batch right away, because the
+        caller is expected to wait. Keyed writes wait up to ``window_ms`` for
+        more work and replace a queued write with the same method and key.
+        """
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SQLite writer is closed")
+            write = _Write(method, args)
+            if key is None:
+                slot: Hashable = next(self._seq)
+                self._urgent = True
+            else:
+                slot = (method, key)
+                previous = self._queue.pop(slot, None)
+                if previous is not None:
+                    write.futures.extend(previous.futures)
+                    DB_WRITES_COALESCED.inc(method)
+            write.futures.append(future)
+            # re-inserted at the end so it still runs after earlier writes
+            self._queue[slot] = write
+            self._idle.clear()
+            DB_WRITE_QUEUE.set("", len(self._queue))
+            self._cond.notify()
+        return future
+
+    def pending(self, method: str, key: Hashable) -> Optional[tuple]:
+        """Arguments of a queued keyed write, for read-your-writes lookups."""
+        with self._cond:
+            write = self._queue.get((method, key)) or self._inflight.get((method, key))
+            return write.args if write else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is committed."""
+        with self._cond:
+            self._urgent = True
+            self._cond.notify()
+        return self._idle.wait(timeout)
+
+    def close(self) -> None:
+        """Commit the remaining writes and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _take(self) -> list[_Write]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._idle.set()
+                self._cond.wait()
+            if not self._urgent and not self._closed:
+                # let a burst of write-behind updates accumulate
+                self._cond.wait_for(
+                    lambda: self._urgent or self._closed or len(self._queue) >= self.max_batch, self.window
+                )
+            batch = []
+            while self._queue and len(batch) < self.max_batch:
+                slot = next(iter(self._queue))
+                write = self._queue.pop(slot)
+                if not isinstance(slot, int):
+                    self._inflight[slot] = write
+                batch.append(write)
+            self._urgent = any(isinstance(slot, int) for slot in self._queue)
+            DB_WRITE_QUEUE.set("", len(self._queue))
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._take()
+            if not batch:
+                self._idle.set()
+                return
+            try:
+                self._write(batch)
+            finally:
+                # committed (or failed): reads see the database again
+                with self._cond:
+                    self._inflight.clear()
+
+    def _write(self, batch: list[_Write]) -> None:
+        start = perf_counter()
+        results: list[tuple[Any, Optional[BaseException]]] = []
+        try:
+            with self.db.transaction() as conn:
+                for write in batch:
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        results.append((getattr(self.db, write.method)(*write.args), None))
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO queued_write")
+                        logger.error("Queued %s%r failed: %s", write.method, write.args, exc)
+                        results.append((None, exc))
+                    conn.execute("RELEASE queued_write")
+        except Exception as exc:
+            # BEGIN or COMMIT failed, nothing from this batch was stored
+            logger.exception("SQLite writer batch of %d failed", len(batch))
+            for write in batch:
+                write.resolve(exc=exc)
+            return
+        DB_WRITE_BATCH_SECONDS.labels("").observe(perf_counter() - start, len(batch))
+        for write, (result, exc) in zip(batch, results):
+            write.resolve(result, exc)
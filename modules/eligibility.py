@@ -0,0 +1,222 @@
+"""In-memory join eligibility index.
+
+Maps telegram_id to ``(is_confirmed, is_banned, expires_epoch)`` so that join
+requests are decided without database I/O. The index is loaded at startup
+and kept current through storage write listeners, so once it is loaded a
+Telegram ID missing from it is not a member. Before that, a miss falls back
+to a single DB lookup whose result, found or not, is then cached.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from modules.db_base import dedupe_import_rows
+from modules.storage import (
+    add_write_listener,
+    db_fetch_eligibility,
+    db_get_member_by_membership_id,
+    db_get_member_by_telegram,
+)
+from modules.logging_config import logger
+from modules.metrics import CACHE_HITS, CACHE_MISSES
+from modules.time_utils import to_epoch
+
+ELIGIBILITY_INDEX = os.getenv("ELIGIBILITY_INDEX", "true").lower() == "true"
+
+Entry = tuple[bool, bool, Optional[int]]
+
+
+class _Index:
+    """Eligibility entries plus reverse lookups used to apply writes."""
+
+    __slots__ = ("entries", "owner", "by_membership", "by_row", "missing")
+
+    def __init__(self) -> None:
+        self.entries: dict[int, Entry] = {}
+        self.owner: dict[int, tuple[int, str]] = {}
+        self.by_membership: dict[str, int] = {}
+        self.by_row: dict[int, int] = {}
+        # looked up before the index was loaded and not found
+        self.missing: set[int] = set()
+
+    def set(self, telegram_id: int, row_id: int, membership_id: str, entry: Entry) -> None:
+        self.forget(telegram_id)
+        self.entries[telegram_id] = entry
+        self.owner[telegram_id] = (row_id, membership_id)
+        self.by_membership[membership_id] = telegram_id
+        self.by_row[row_id] = telegram_id
+
+    def forget(self, telegram_id: int) -> None:
+        self.entries.pop(telegram_id, None)
+        self.missing.discard(telegram_id)
+        owner = self.owner.pop(telegram_id, None)
+        if owner is None:
+            return
+        row_id, membership_id = owner
+        if self.by_row.get(row_id) == telegram_id:
+            del self.by_row[row_id]
+        if self.by_membership.get(membership_id) == telegram_id:
+            del self.by_membership[membership_id]
+
+
+_index = _Index()
+_loaded = False
+# Remote changes are applied from a worker thread (modules.pg_listener),
+# local ones on the event loop; the lock makes each read-and-update atomic.
+_lock = threading.RLock()
+# write events seen while load_eligibility_index() builds a new index
+_replay: Optional[list[tuple[str, Any]]] = None
+
+
+def load_eligibility_index() -> int:
+    """(Re)load the whole index with one query and swap it in atomically.
+
+    The query runs without the lock; writes applied meanwhile are replayed
+    on the new index before it is swapped in.
+    """
+    global _index, _loaded, _replay
+    with _lock:
+        _replay = []
+    try:
+        index = _Index()
+        for telegram_id, row_id, membership_id, confirmed, banned, expires in db_fetch_eligibility():
+            index.set(telegram_id, row_id, membership_id, (bool(confirmed), bool(banned), expires))
+    except Exception:
+        with _lock:
+            _replay = None
+        raise
+    with _lock:
+        replay, _replay = _replay, None
+        _index = index
+        _loaded = True
+        for kind, key in replay:
+            _apply(kind, key)
+    logger.info("Eligibility index loaded: %s members", len(index.entries))
+    return len(index.entries)
+
+
+def reset_eligibility_index() -> None:
+    """Drop all entries, e.g. after changes of other instances may have been missed."""
+    global _index
+    if _loaded:
+        load_eligibility_index()
+    else:
+        with _lock:
+            _index = _Index()
+
+
+def refresh_telegram(telegram_id: int) -> Optional[Entry]:
+    """Re-read one member by Telegram ID and update the index."""
+    with _lock:
+        row = db_get_member_by_telegram(telegram_id)
+        if row is None:
+            _index.forget(telegram_id)
+            return None
+        membership_id = row["membership_id"]
+        previous = _index.by_membership.get(membership_id)
+        entry = (bool(row.get("is_confirmed")), bool(row.get("is_banned")), row.get("expires_at"))
+        _index.set(telegram_id, row["id"], membership_id, entry)
+        if previous is not None and previous != telegram_id:
+            # membership moved to another Telegram account
+            refresh_telegram(previous)
+        return entry
+
+
+def refresh_membership(membership_id: str) -> None:
+    telegram_ids = {_index.by_membership.get(membership_id)}
+    row = db_get_member_by_membership_id(membership_id)
+    if row:
+        telegram_ids.add(row.get("telegram_id"))
+    for telegram_id in telegram_ids:
+        if telegram_id is not None:
+            refresh_telegram(telegram_id)
+
+
+def _apply_bulk(action: str, membership_ids: list[str]) -> None:
+    for membership_id in membership_ids:
+        telegram_id = _index.by_membership.get(membership_id)
+        if telegram_id is None:
+            continue
+        if action == "remove":
+            _index.forget(telegram_id)
+        else:
+            _, banned, _ = _index.entries[telegram_id]
+            _index.entries[telegram_id] = (False, banned or action == "ban", None)
+
+
+def _apply_import(rows) -> None:
+    for membership_id, telegram_id, expires_at in dedupe_import_rows(rows):
+        current = _index.by_membership.get(membership_id)
+        if current is not None and telegram_id in (None, current):
+            _, banned, _ = _index.entries[current]
+            _index.entries[current] = (True, banned, to_epoch(expires_at))
+            continue
+        # new or rebound: a loaded index must hold every member, so read
+        # the rows now; otherwise the next lookup reads and caches them
+        for tid in (telegram_id, current):
+            if tid is None:
+                continue
+            if _loaded:
+                refresh_telegram(tid)
+            else:
+                _index.forget(tid)
+
+
+def _apply(kind: str, key: Any) -> None:
+    if kind == "membership":
+        refresh_membership(key)
+    elif kind == "telegram":
+        refresh_telegram(key)
+    elif kind == "row":
+        telegram_id = _index.by_row.get(key)
+        if telegram_id is not None:
+            refresh_telegram(telegram_id)
+    elif kind == "bulk":
+        _apply_bulk(*key)
+    elif kind == "import":
+        _apply_import(key)
+
+
+def _on_write(kind: str, key: Any) -> None:
+    if kind == "reset":
+        reset_eligibility_index()
+        return
+    with _lock:
+        if _replay is not None:
+            _replay.append((kind, key))
+        _apply(kind, key)
+
+
+def is_eligible(telegram_id: int, now: float | None = None) -> bool:
+    """Return True if the user may join access chats right now."""
+    entry = None
+    if ELIGIBILITY_INDEX:
+        entry = _index.entries.get(telegram_id)
+        if entry is None and (_loaded or telegram_id in _index.missing):
+            # a known non-member, the common case in a join request flood
+            CACHE_HITS.inc("eligibility")
+            return False
+    if entry is None:
+        CACHE_MISSES.inc("eligibility")
+        with _lock:
+            entry = refresh_telegram(telegram_id)
+            if entry is None:
+                if ELIGIBILITY_INDEX:
+                    _index.missing.add(telegram_id)
+                return False
+    else:
+        CACHE_HITS.inc("eligibility")
+    confirmed, banned, expires = entry
+    if not confirmed or banned:
+        return False
+    return expires is None or expires > (time.time() if now is None else now)
+
+
+def eligibility_index_size() -> int:
+    return len(_index.entries)
+
+
+add_write_listener(_on_write)
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
-from modules.config import i18n, i18n_buttons, language_prompt
+from modules.config import durations, i18n, i18n_buttons
 from modules.storage import db_set_user_locale
 from modules.log_utils import log_async_call
 from modules.media_utils import send_localized_image_with_text
+from modules.settings import get_settings
 from modules.states import UserState
+from modules.time_utils import plural_form
 
 SUPPORTED = set(i18n.get("supported_langs", []))
 DEFAULT_LANG = i18n.get("default_lang", "en")
@@ -55,15 +57,8 @@ def resolve_user_lang(update, user_row) -> str:
 
 
 def plural_days(n: int, lang: str) -> str:
-    if lang == "ru":
-        n10 = n % 10
-        n100 = n % 100
-        if n10 == 1 and n100 != 11:
-            return "день"
-        if 2 <= n10 <= 4 and not 12 <= n100 <= 14:
-            return "дня"
-        return "дней"
-    return "day" if n == 1 else "days"
+    lang = normalize_lang(lang)
+    return plural_form(n, lang, durations.get(lang, {}).get("units", {}).get("day", ["day", "days"]))
 
 
 async def send_language_prompt(update, context, cfg, *, asset_prefix: str, default_template: str):
@@ -98,7 +93,7 @@ async def cmd_language(update, context):
     await send_language_prompt(
         update,
         context,
-        language_prompt,
+        get_settings().language_prompt,
         asset_prefix="language_prompt",
         default_template="language_prompt.txt",
     )
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from telegram.ext import ContextTypes
 
 from modules.template_engine import render_template
-from modules.config import session_timeout, templates
+from modules.settings import get_settings
 from modules.storage import db_get_user_locale, db_get_member_by_telegram
 from modules.i18n import normalize_lang
 from modules.states import UserState
@@ -35,22 +35,18 @@ def clear_user_activity(user_id: int) -> None:
 
 @log_async_call
 async def check_user_inactivity_loop(app) -> None:
-    timeout_seconds = int(session_timeout.get("seconds", 900))
-    send_message = session_timeout.get("send_message", False)
-    check_interval = min(timeout_seconds, 60)
     while True:
-        await asyncio.sleep(check_interval)
+        settings = get_settings()
+        timeout_seconds = settings.session_timeout_sec
+        await asyncio.sleep(min(timeout_seconds, 60))
         now = datetime.utcnow()
         expired = [uid for uid, ts in list(user_last_activity.items()) if now - ts > timedelta(seconds=timeout_seconds)]
         for uid in expired:
             context = ContextTypes.DEFAULT_TYPE(application=app)
             try:
-                if send_message:
+                if settings.session_timeout_message:
                     lang = normalize_lang(db_get_user_locale(uid))
-                    text = render_template(
-                        templates.get("session_timeout", "session_timeout.txt"),
-                        lang=lang,
-                    )
+                    text = render_template(settings.templates.session_timeout, lang=lang)
                     await context.bot.send_message(
                         chat_id=uid, text=text, parse_mode="HTML"
                     )
@@ -1,36 +1,60 @@
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
+import os
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from modules.storage import db_get_member_by_telegram
 from modules.post_join import maybe_send_post_join
+from modules.access_control import remember_member_status
+from modules.eligibility import is_eligible
+from modules.rate_limiter import api_limiter
 from modules.log_utils import log_async_call
+from modules.logging_config import logger
+
+JOIN_APPROVAL_WORKERS = int(os.getenv("JOIN_APPROVAL_WORKERS", "8"))
+
+_approval_queue: asyncio.Queue | None = None
+
+
+async def _apply_join_decision(bot, chat_id: int, user, approve: bool) -> None:
+    if approve:
+        await api_limiter.call(bot.approve_chat_join_request, chat_id, user.id)
+        member = db_get_member_by_telegram(user.id)
+        if member:
+            await maybe_send_post_join(bot, member, user)
+    else:
+        await api_limiter.call(bot.decline_chat_join_request, chat_id, user.id)
+
+
+async def _approval_worker(bot) -> None:
+    while True:
+        chat_id, user, approve = await _approval_queue.get()
+        try:
+            await _apply_join_decision(bot, chat_id, user, approve)
+        except Exception as e:
+            logger.warning("Join decision for %s in %s failed: %s", user.id, chat_id, e)
+        finally:
+            _approval_queue.task_done()
+
+
+def start_join_approval_workers(app) -> list[asyncio.Task]:
+    """Start workers that send join request decisions concurrently."""
+    global _approval_queue
+    _approval_queue = asyncio.Queue()
+    return [asyncio.create_task(_approval_worker(app.bot)) for _ in range(max(1, JOIN_APPROVAL_WORKERS))]
 
 
 @log_async_call
 async def on_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
     req = update.chat_join_request
-    user_id = req.from_user.id
-    chat_id = req.chat.id
-    member = db_get_member_by_telegram(user_id)
-    ok = False
-    if member and member.get("is_confirmed") and not member.get("is_banned"):
-        expires = member.get("expires_at")
-        if not expires:
-            ok = True
-        else:
-            if isinstance(expires, str):
-                expires_dt = datetime.fromisoformat(expires)
-            else:
-                expires_dt = expires
-            ok = expires_dt > datetime.utcnow()
-    if ok:
-        await context.bot.approve_chat_join_request(chat_id, user_id)
-        await maybe_send_post_join(context.bot, member, req.from_user)
+    approve = is_eligible(req.from_user.id)
+    if _approval_queue is None:
+        await _apply_join_decision(context.bot, req.chat.id, req.from_user, approve)
     else:
-        await context.bot.decline_chat_join_request(chat_id, user_id)
+        _approval_queue.put_nowait((req.chat.id, req.from_user, approve))
 
 
 @log_async_call
@@ -39,6 +63,7 @@ async def on_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
     old_s = cmu.old_chat_member.status
     new_s = cmu.new_chat_member.status
     user = cmu.new_chat_member.user
+    remember_member_status(cmu.chat.id, user.id, new_s)
     if new_s in ("member", "administrator") and old_s in ("left", "kicked"):
         member = db_get_member_by_telegram(user.id)
         if member and member.get("is_confirmed"):
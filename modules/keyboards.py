@@ -0,0 +1,91 @@
+"""Inline keyboards built from config once per language.
+
+Button texts depend only on configuration and language, so the layouts are
+computed on first use and cached. A layout row holds ``(text, prefix,
+suffix)`` triples; per send only the membership ID is spliced into
+``callback_data``.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from modules.settings import add_reload_listener, get_settings
+from modules.i18n import DEFAULT_LANG, get_button_text
+from modules.time_utils import humanize_period
+
+Layout = tuple[tuple[tuple[str, str, str], ...], ...]
+
+
+def _markup(layout: Layout, membership_id: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton(text, callback_data=f"{prefix}{membership_id}{suffix}") for text, prefix, suffix in row]
+            for row in layout
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def period_label(seconds: int, lang: str = DEFAULT_LANG) -> str:
+    """Approve period as shown to admins ("lifetime" for 0)."""
+    if seconds == 0:
+        return get_button_text(get_settings().admin_ui.get("lifetime_text"), lang, "lifetime")
+    return humanize_period(seconds, lang)
+
+
+def _approve_text(seconds: int, lang: str) -> str:
+    tmpl = get_button_text(get_settings().admin_ui.get("approve_template"), lang, "Approve for {period}")
+    return tmpl.format(period=period_label(seconds, lang))
+
+
+@lru_cache(maxsize=None)
+def _admin_layout(lang: str) -> Layout:
+    settings = get_settings()
+    rows = [((_approve_text(sec, lang), "approve:", f":{sec}"),) for sec in settings.approve_durations]
+    row = []
+    if settings.enable_decline:
+        row.append((get_button_text(settings.admin_ui.get("decline_text"), lang, "Decline"), "decline:", ""))
+    if settings.enable_ban:
+        row.append((get_button_text(settings.admin_ui.get("ban_text"), lang, "Ban"), "ban:", ""))
+    if row:
+        rows.append(tuple(row))
+    return tuple(rows)
+
+
+@lru_cache(maxsize=None)
+def _renewal_admin_layout(seconds: int, lang: str) -> Layout:
+    return (
+        ((_approve_text(seconds, lang), "approve:", f":{seconds}"),),
+        ((get_button_text(get_settings().admin_ui.get("decline_text"), lang, "Decline"), "decline:", ""),),
+    )
+
+
+@lru_cache(maxsize=None)
+def _renewal_layout(lang: str) -> Layout:
+    return tuple(((get_button_text(p.label, lang), "renew:", f":{p.id}"),) for p in get_settings().plans)
+
+
+def admin_keyboard(membership_id: str, lang: str = DEFAULT_LANG) -> InlineKeyboardMarkup:
+    """Approve/decline/ban buttons for a new access request."""
+    return _markup(_admin_layout(lang), membership_id)
+
+
+def renewal_admin_keyboard(membership_id: str, seconds: int, lang: str = DEFAULT_LANG) -> InlineKeyboardMarkup:
+    """Approve/decline buttons for a renewal request of ``seconds``."""
+    return _markup(_renewal_admin_layout(seconds, lang), membership_id)
+
+
+def renewal_keyboard(membership_id: str, lang: str) -> InlineKeyboardMarkup:
+    """One button per renewal plan, sent with expiry warnings."""
+    return _markup(_renewal_layout(lang), membership_id)
+
+
+def clear_keyboard_cache(*_) -> None:
+    """Drop cached layouts after the configuration changed."""
+    for cached in (period_label, _admin_layout, _renewal_admin_layout, _renewal_layout):
+        cached.cache_clear()
+
+
+add_reload_listener(clear_keyboard_cache)
@@ -0,0 +1,109 @@
+"""Lease-based ownership of the membership expiry work across replicas.
+
+Several bot instances may share one database. The expiry loop sends
+warnings and bans users, so each member must be handled by one instance
+only. Work is split into ``EXPIRY_PARTITIONS`` partitions by
+``telegram_id % N``. Each partition is a row in the ``leases`` table that
+one instance holds and renews every ``LEADER_LEASE_SEC / 3`` seconds.
+With the default single partition this is plain leader election.
+
+Every instance also keeps a ``replica:<id>`` lease, so all of them know
+how many replicas are alive. An instance takes free partitions up to its
+fair share ``ceil(N / replicas)`` and releases the extra ones when a new
+replica appears. When an instance dies, its partitions are taken over
+once their leases expire, i.e. within ``LEADER_LEASE_SEC``.
+
+Leases are compared against the database clock. A replica that stalls
+for longer than the lease may still finish a pass it started; the
+warning and grace marks keep such overlaps from re-sending messages on
+the next pass.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import socket
+import uuid
+import zlib
+from typing import Any, Mapping
+
+from modules.logging_config import logger
+from modules.storage import db_acquire_lease, db_live_leases, db_release_lease
+
+EXPIRY_PARTITIONS = max(1, int(os.getenv("EXPIRY_PARTITIONS", "1")))
+LEADER_LEASE_SEC = max(3, int(os.getenv("LEADER_LEASE_SEC", "15")))
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def partition_of(member: Mapping[str, Any], partitions: int) -> int:
+    """Stable partition of a member row; crc32 because str hash() is salted per process."""
+    telegram_id = member.get("telegram_id")
+    if telegram_id is not None:
+        return int(telegram_id) % partitions
+    return zlib.crc32(str(member.get("membership_id")).encode()) % partitions
+
+
+class ExpiryLeases:
+    """Partitions of the expiry work held by this instance."""
+
+    def __init__(
+        self, partitions: int = EXPIRY_PARTITIONS, ttl_sec: int = LEADER_LEASE_SEC, holder: str = INSTANCE_ID
+    ) -> None:
+        self.partitions = partitions
+        self.ttl_sec = ttl_sec
+        self.holder = holder
+        self.held: frozenset[int] = frozenset()
+
+    def owns(self, member: Mapping[str, Any]) -> bool:
+        return partition_of(member, self.partitions) in self.held
+
+    def tick(self) -> frozenset[int]:
+        """Renew presence and held partitions, rebalance, take free ones."""
+        db_acquire_lease(f"replica:{self.holder}", self.holder, self.ttl_sec)
+        leases = db_live_leases()
+        replicas = {holder for name, holder in leases if name.startswith("replica:")} | {self.holder}
+        share = math.ceil(self.partitions / len(replicas))
+        owners = {int(name.split(":", 1)[1]): holder for name, holder in leases if name.startswith("expiry:")}
+
+        held = set()
+        for part in sorted(p for p, holder in owners.items() if holder == self.holder):
+            if part >= self.partitions or len(held) >= share:
+                # hand over to a replica that joined, or drop a stale partition
+                db_release_lease(f"expiry:{part}", self.holder)
+            elif db_acquire_lease(f"expiry:{part}", self.holder, self.ttl_sec):
+                held.add(part)
+        for part in range(self.partitions):
+            if len(held) >= share:
+                break
+            if part not in owners and db_acquire_lease(f"expiry:{part}", self.holder, self.ttl_sec):
+                held.add(part)
+
+        held = frozenset(held)
+        if held != self.held:
+            logger.info(
+                "Expiry partitions held by %s: %s of %d (%d replicas)",
+                self.holder, sorted(held) or "none", self.partitions, len(replicas),
+            )
+        self.held = held
+        return held
+
+    async def run(self) -> None:
+        interval = self.ttl_sec / 3
+        while True:
+            try:
+                # lease writes wait for the writer, which must not stall the loop
+                await asyncio.to_thread(self.tick)
+            except Exception:
+                # unable to renew: assume the leases are lost rather than
+                # risk running alongside their new holder
+                logger.exception("Lease renewal failed, pausing expiry work")
+                self.held = frozenset()
+            await asyncio.sleep(interval)
+
+    def release_all(self) -> None:
+        """Give up all leases so another replica takes over immediately."""
+        for part in self.held:
+            db_release_lease(f"expiry:{part}", self.holder)
+        db_release_lease(f"replica:{self.holder}", self.holder)
+        self.held = frozenset()
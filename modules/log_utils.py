@@ -1,60 +1,86 @@
 import functools
-from rich.console import Console
+import logging
+import os
+import sqlite3
+from time import perf_counter
+
 from telegram.error import TelegramError
+
 from modules.logging_config import logger
-import sqlite3
+from modules.metrics import CALL_ERRORS, CALL_SECONDS, METRICS_PORT
+
+
+@functools.lru_cache(maxsize=None)
+def get_console():
+    """Shared rich console, imported on first use (rich adds ~50 ms to startup)."""
+    from rich.console import Console
 
-console = Console()
+    return Console()
+
+
+# Record the duration of every wrapped call into ``call_seconds``. Decided at
+# decoration time, so the disabled mode does not even read the clock.
+CALL_TIMING = os.getenv("LOG_CALL_TIMING", "true" if METRICS_PORT else "false").lower() == "true"
+
+
+def _report_error(name, exc):
+    CALL_ERRORS.inc(name)
+    if isinstance(exc, TelegramError):
+        logger.error("Telegram API error in %s: %s", name, exc)
+        get_console().print(f"[red]Telegram API error in {name}: {exc}[/red]")
+    elif isinstance(exc, sqlite3.DatabaseError):
+        logger.error("Database error in %s: %s", name, exc)
+        get_console().print(f"[red]Database error in {name}: {exc}[/red]")
+    else:
+        logger.exception("Unhandled exception in %s: %s", name, exc)
+        get_console().print(f"[red]Unexpected error in {name}: {exc}[/red]")
 
 
 def log_async_call(func):
+    name = func.__name__
+    hist = CALL_SECONDS.labels(name) if CALL_TIMING else None
+
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        logger.debug(f"{func.__name__} called")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("%s called", name)
+        start = perf_counter() if hist is not None else 0.0
         try:
             result = await func(*args, **kwargs)
-            logger.debug(f"{func.__name__} completed successfully")
-            return result
-
-        except TelegramError as te:
-            logger.error(f"Telegram API error in {func.__name__}: {te}")
-            console.print(f"[red]Telegram API error in {func.__name__}: {te}[/red]")
-            raise
-
-        except sqlite3.DatabaseError as db_err:
-            logger.error(f"Database error in {func.__name__}: {db_err}")
-            console.print(f"[red]Database error in {func.__name__}: {db_err}[/red]")
-            raise
-
         except Exception as e:
-            logger.exception(f"Unhandled exception in {func.__name__}: {e}")
-            console.print(f"[red]Unexpected error in {func.__name__}: {e}[/red]")
+            _report_error(name, e)
             raise
+        finally:
+            if hist is not None:
+                hist.observe(perf_counter() - start)
+        if debug:
+            logger.debug("%s completed successfully", name)
+        return result
 
     return wrapper
 
+
 def log_sync_call(func):
+    name = func.__name__
+    hist = CALL_SECONDS.labels(name) if CALL_TIMING else None
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        logger.debug(f"{func.__name__} called")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("%s called", name)
+        start = perf_counter() if hist is not None else 0.0
         try:
             result = func(*args, **kwargs)
-            logger.debug(f"{func.__name__} completed successfully")
-            return result
-
-        except TelegramError as te:
-            logger.error(f"Telegram API error in {func.__name__}: {te}")
-            console.print(f"[red]Telegram API error in {func.__name__}: {te}[/red]")
-            raise
-
-        except sqlite3.DatabaseError as db_err:
-            logger.error(f"Database error in {func.__name__}: {db_err}")
-            console.print(f"[red]Database error in {func.__name__}: {db_err}[/red]")
-            raise
-
         except Exception as e:
-            logger.exception(f"Unhandled exception in {func.__name__}: {e}")
-            console.print(f"[red]Unexpected error in {func.__name__}: {e}[/red]")
+            _report_error(name, e)
             raise
+        finally:
+            if hist is not None:
+                hist.observe(perf_counter() - start)
+        if debug:
+            logger.debug("%s completed successfully", name)
+        return result
 
-    return wrapper
\ No newline at end of file
+    return wrapper
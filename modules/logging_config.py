@@ -1,38 +1,99 @@
 from dotenv import load_dotenv
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import sys
 import colorlog
 import os
 
-os.makedirs("logs", exist_ok=True)
+from modules.config import BASE_DIR
 
 load_dotenv()
+# by default next to the code, not in the working directory the bot was started from
+LOG_DIR = os.getenv("LOG_DIR") or str(BASE_DIR / "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
 level = os.getenv("LOG_LEVEL", "INFO").upper()
+log_format = os.getenv("LOG_FORMAT", "text").lower()
+# auto: only when attached to a terminal, so services do not write to the console
+log_console = os.getenv("LOG_CONSOLE", "auto").lower()
+log_max_bytes = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+log_backups = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Format arguments in the caller, but keep the traceback as ``exc_text``
+    so that both formatters can render it their own way."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_exc_formatter = logging.Formatter()
 
 # Создаем логгер
 logger = logging.getLogger("tg_support_bot")
 logger.setLevel(getattr(logging, level, logging.INFO))
 
-# Обработчик логов в файл
-file_handler = logging.FileHandler("logs/bot.log", encoding="utf-8")
-file_formatter = logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
+# Обработчик логов в файл с ротацией
+file_handler = logging.handlers.RotatingFileHandler(
+    os.path.join(LOG_DIR, "bot.log"), maxBytes=log_max_bytes, backupCount=log_backups, encoding="utf-8"
 )
+if log_format == "json":
+    file_formatter = JsonFormatter()
+else:
+    file_formatter = logging.Formatter(
+        "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
 file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
+handlers = [file_handler]
 
 # Обработчик логов в цветную консоль
-console_handler = colorlog.StreamHandler()
-console_formatter = colorlog.ColoredFormatter(
-    "%(log_color)s[%(levelname)s]%(reset)s %(message)s",
-    log_colors={
-        'DEBUG':    'cyan',
-        'INFO':     'green',
-        'WARNING':  'yellow',
-        'ERROR':    'red',
-        'CRITICAL': 'bold_red',
-    }
-)
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
-logger.debug(f"Logging initialized at {level} level")
\ No newline at end of file
+if log_console == "true" or (log_console == "auto" and sys.stderr.isatty()):
+    console_handler = colorlog.StreamHandler()
+    console_formatter = colorlog.ColoredFormatter(
+        "%(log_color)s[%(levelname)s]%(reset)s %(message)s",
+        log_colors={
+            'DEBUG':    'cyan',
+            'INFO':     'green',
+            'WARNING':  'yellow',
+            'ERROR':    'red',
+            'CRITICAL': 'bold_red',
+        }
+    )
+    console_handler.setFormatter(console_formatter)
+    handlers.append(console_handler)
+
+# Запись на диск и в консоль идёт в фоновом потоке, вызывающий код только кладёт запись в очередь
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(_QueueHandler(log_queue))
+listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+logger.debug("Logging initialized at %s level", level)
@@ -0,0 +1,124 @@
+"""Optional profiler for work that blocks the asyncio event loop.
+
+Enabled with ``LOOP_PROFILER=true``. It combines two probes:
+
+* asyncio debug mode, which logs every callback slower than
+  ``LOOP_SLOW_CALLBACK_MS`` (the ``asyncio`` logger is routed into the bot
+  log and counted in ``event_loop_slow_callbacks_total``);
+* a heartbeat task plus a watchdog thread. When the heartbeat is late by
+  more than ``LOOP_LAG_WARN_MS`` the watchdog samples the loop thread's
+  stack and names the innermost ``modules.*`` function, so a stall is
+  attributed to e.g. ``modules.media_utils.file_sha256`` rather than to
+  "the loop".
+
+Debug mode adds overhead of its own; keep it off in normal operation.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import traceback
+from time import perf_counter
+from types import FrameType
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from modules.logging_config import logger
+from modules.metrics import EVENT_LOOP_LAG, LOOP_SLOW_CALLBACKS, LOOP_STALLS
+
+load_dotenv()
+LOOP_PROFILER = os.getenv("LOOP_PROFILER", "false").lower() == "true"
+LOOP_SLOW_CALLBACK_MS = float(os.getenv("LOOP_SLOW_CALLBACK_MS", "100"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "200"))
+HEARTBEAT_INTERVAL = 0.1
+STACK_LIMIT = 8
+
+
+class _SlowCallbackCounter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and record.msg.startswith("Executing "):
+            LOOP_SLOW_CALLBACKS.inc()
+        return True
+
+
+_slow_callback_counter = _SlowCallbackCounter()
+
+
+def _culprit(frame: Optional[FrameType], package: str) -> str:
+    """Innermost frame belonging to ``package``, as ``module.function``."""
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(package):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class LoopProfiler:
+    """Heartbeat task on the loop plus a watchdog thread sampling stalls."""
+
+    def __init__(
+        self,
+        slow_callback_ms: float = LOOP_SLOW_CALLBACK_MS,
+        lag_warn_ms: float = LOOP_LAG_WARN_MS,
+        interval: float = HEARTBEAT_INTERVAL,
+        package: str = "modules.",
+    ) -> None:
+        self.slow_callback = slow_callback_ms / 1000
+        self.lag_warn = lag_warn_ms / 1000
+        self.interval = interval
+        self.package = package
+        self.last_beat = perf_counter()
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> asyncio.Task:
+        """Enable the probes on ``loop`` (call from the loop thread)."""
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback
+        asyncio_logger = logging.getLogger("asyncio")
+        asyncio_logger.addFilter(_slow_callback_counter)
+        for handler in logger.handlers:
+            asyncio_logger.addHandler(handler)  # no-op if already attached
+        asyncio_logger.propagate = False
+
+        self._thread_id = threading.get_ident()
+        self.last_beat = perf_counter()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info(
+            "Loop profiler on: slow callbacks > %.0f ms, stalls > %.0f ms",
+            self.slow_callback * 1000,
+            self.lag_warn * 1000,
+        )
+        return loop.create_task(self._heartbeat())
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _heartbeat(self) -> None:
+        try:
+            while True:
+                start = perf_counter()
+                await asyncio.sleep(self.interval)
+                self.last_beat = perf_counter()
+                EVENT_LOOP_LAG.set("", max(0.0, self.last_beat - start - self.interval))
+        finally:
+            self.stop()
+
+    def _watch(self) -> None:
+        sampled_beat = None
+        while not self._stop.wait(self.interval / 2):
+            beat = self.last_beat
+            stalled = perf_counter() - beat - self.interval
+            if stalled < self.lag_warn or beat == sampled_beat:
+                continue
+            sampled_beat = beat  # one sample per stall
+            frame = sys._current_frames().get(self._thread_id)
+            culprit = _culprit(frame, self.package)
+            LOOP_STALLS.inc(culprit)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else ""
+            logger.warning("Event loop blocked for over %.0f ms in %s\n%s", stalled * 1000, culprit, stack)
@@ -9,6 +9,7 @@ from telegram.error import TelegramError
 
 from modules.storage import db_get_media_cache, db_upsert_media_cache
 from modules.logging_config import logger
+from modules.metrics import CACHE_HITS, CACHE_MISSES
 from modules.config import i18n
 
 DEFAULT_LANG = i18n.get("default_lang", "en")
@@ -48,7 +49,9 @@ async def ensure_file_id_for_asset(
     file_hash = file_sha256(path)
     cached = db_get_media_cache(asset_key, lang)
     if cached and cached.get("file_hash") == file_hash:
+        CACHE_HITS.inc("media_file_id")
         return cached["file_id"], False
+    CACHE_MISSES.inc("media_file_id")
     with open(path, "rb") as f:
         msg = await bot.send_photo(
             chat_id=chat_id,
@@ -0,0 +1,114 @@
+"""Bulk import of pre-approved members from CSV or JSONL.
+
+Usage from the project root::
+
+    python -m modules.member_import members.csv [--format jsonl] [--chunk-size 1000]
+
+Every record has ``membership_id`` and optional ``telegram_id`` and
+``expires_at`` (ISO 8601 or epoch seconds, empty for lifetime access).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+from datetime import datetime, timezone
+from typing import IO, Iterator, Optional
+
+from modules.settings import get_settings
+from modules.storage import db_bulk_upsert_members, db_init
+from modules.logging_config import logger
+
+IMPORT_CHUNK_SIZE = 1000
+
+ImportRow = tuple[str, Optional[int], Optional[datetime]]
+
+
+def _parse_expires(value) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or str(value).strip().isdigit():
+        return datetime.utcfromtimestamp(int(value))
+    dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_record(record: dict | str) -> ImportRow:
+    """Validate a raw record and convert it to ``(membership_id, telegram_id, expires_at)``.
+
+    JSONL lines are passed as strings and decoded here so that a broken line
+    is reported like any other invalid record.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    membership_id = str(record.get("membership_id") or "").strip()
+    if not get_settings().id_pattern.fullmatch(membership_id):
+        raise ValueError(f"invalid membership_id {membership_id!r}")
+    raw_tid = record.get("telegram_id")
+    telegram_id = int(raw_tid) if raw_tid not in (None, "") else None
+    return membership_id, telegram_id, _parse_expires(record.get("expires_at"))
+
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[tuple[int, dict | str]]:
+    """Yield ``(line_no, record)`` pairs without reading the whole file."""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if line:
+                yield line_no, line
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+
+
+def import_members(stream: IO[str], fmt: str = "csv", chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    """Stream records into the database in chunked transactions.
+
+    Returns ``{"rows", "imported", "errors"}`` where errors is a list of
+    ``(line_no, message)`` for rejected records.
+    """
+    summary = {"rows": 0, "imported": 0, "errors": []}
+    chunk: list[ImportRow] = []
+    for line_no, record in iter_records(stream, fmt):
+        summary["rows"] += 1
+        try:
+            chunk.append(parse_record(record))
+        except (ValueError, TypeError, AttributeError) as e:
+            summary["errors"].append((line_no, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            summary["imported"] += db_bulk_upsert_members(chunk)
+            chunk = []
+    if chunk:
+        summary["imported"] += db_bulk_upsert_members(chunk)
+    logger.info(
+        "Imported %s of %s member rows, %s rejected",
+        summary["imported"], summary["rows"], len(summary["errors"]),
+    )
+    return summary
+
+
+def detect_format(filename: str | None) -> str:
+    name = (filename or "").lower()
+    return "jsonl" if name.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Import pre-approved members from CSV/JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    db_init()
+    with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+        summary = import_members(f, args.format or detect_format(args.path), args.chunk_size)
+    print(f"rows: {summary['rows']}, imported: {summary['imported']}, rejected: {len(summary['errors'])}")
+    for line_no, message in summary["errors"]:
+        print(f"  line {line_no}: {message}")
+
+
+if __name__ == "__main__":
+    main()
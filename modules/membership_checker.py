@@ -1,91 +1,99 @@
 import asyncio
-import os
+import time
 from datetime import datetime, timedelta
 
-from dotenv import load_dotenv
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-from modules.template_engine import render_template
-from modules.config import expiration, templates, renewal
+from modules.db_base import OutboxItem
+from modules.settings import get_settings
 from modules.storage import (
-    db_fetch_members_for_warning,
-    db_fetch_expired_members,
-    db_fetch_recently_expired,
-    db_mark_warning_sent,
-    db_mark_grace_notified,
-    db_set_confirmation,
+    db_fetch_members_for_warning_async,
+    db_fetch_expired_members_async,
+    db_fetch_recently_expired_async,
+    db_record_expiry_pass_async,
     db_get_user_locale,
 )
-from modules.i18n import normalize_lang, get_button_text
-from modules.time_utils import humanize_period
+from modules.i18n import normalize_lang
 from modules.logging_config import logger
+from modules.metrics import EXPIRY_BACKLOG, EXPIRY_TICK_SECONDS
 
-load_dotenv()
-ACCESS_CHATS = [int(cid.strip()) for cid in os.getenv("ACCESS_CHATS", "").split(",") if cid.strip()]
+async def check_membership_expiry_loop(app, leases=None):
+    """Warn, remind and remove expiring members.
 
-
-async def check_membership_expiry_loop(app):
-    warn_before = int(renewal.get("warn_before_sec", expiration.get("warn_before_sec", 86400)))
-    check_interval = int(expiration.get("check_interval", 60))
-    grace_after = int(renewal.get("grace_after_expiry_sec", 86400))
-    warning_template = templates.get("renewal_warning", "renewal_warning.txt")
-    grace_template = templates.get("grace_warning", "grace_warning.txt")
-    expired_template = templates.get("expired", "expired.txt")
-    plans = renewal.get("user_plans", [])
+    Messages and removals are queued in the outbox together with the state
+    change and sent by :mod:`modules.outbox`. With ``leases`` (see
+    :mod:`modules.leadership`) only members of the partitions this
+    instance holds are handled, and a pass is skipped while it holds none.
+    """
+    owns = leases.owns if leases is not None else None
     while True:
-        await asyncio.sleep(check_interval)
+        # read every pass so that a settings reload applies to the next tick
+        settings = get_settings()
+        await asyncio.sleep(settings.check_interval)
+        if leases is not None and not leases.held:
+            continue
+        tick_started = time.perf_counter()
+        settings = get_settings()
+        warn_before = settings.warn_before_sec
+        grace_after = settings.grace_after_sec
         now = datetime.utcnow()
-        for member in db_fetch_members_for_warning(now, warn_before):
-            expires_at = member.get("expires_at")
-            if isinstance(expires_at, str):
-                expires_dt = datetime.fromisoformat(expires_at)
-            else:
-                expires_dt = expires_at
-            remaining = int((expires_dt - now).total_seconds())
-            user_lang = normalize_lang(db_get_user_locale(member["telegram_id"]))
-            text = render_template(warning_template, remaining=humanize_period(remaining), lang=user_lang)
-            keyboard = InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            get_button_text(p.get("label"), user_lang),
-                            callback_data=f"renew:{member['membership_id']}:{p['id']}",
-                        )
-                    ]
-                    for p in plans
-                ]
-            )
-            try:
-                await app.bot.send_message(chat_id=member["telegram_id"], text=text, reply_markup=keyboard)
-                db_mark_warning_sent(member["telegram_id"])
-            except Exception as e:
-                logger.exception("Failed to send warning to %s: %s", member["telegram_id"], e)
-        for member in db_fetch_recently_expired(now, grace_after):
-            expires_at = member.get("expires_at")
-            if isinstance(expires_at, str):
-                exp_dt = datetime.fromisoformat(expires_at)
-            else:
-                exp_dt = expires_at
-            remaining = grace_after - int((now - exp_dt).total_seconds())
-            user_lang = normalize_lang(db_get_user_locale(member["telegram_id"]))
-            text = render_template(grace_template, remaining=humanize_period(remaining), lang=user_lang)
-            try:
-                await app.bot.send_message(chat_id=member["telegram_id"], text=text)
-                db_mark_grace_notified(member["telegram_id"])
-            except Exception as e:
-                logger.exception("Failed to send grace warning to %s: %s", member["telegram_id"], e)
-
         cutoff = now - timedelta(seconds=grace_after)
-        for member in db_fetch_expired_members(cutoff):
-            user_lang = normalize_lang(db_get_user_locale(member["telegram_id"]))
-            text = render_template(expired_template, lang=user_lang)
-            try:
-                await app.bot.send_message(chat_id=member["telegram_id"], text=text)
-                for chat_id in ACCESS_CHATS:
-                    try:
-                        await app.bot.ban_chat_member(chat_id=chat_id, user_id=member["telegram_id"])
-                        await app.bot.unban_chat_member(chat_id=chat_id, user_id=member["telegram_id"])
-                    except Exception as e:
-                        logger.warning("Failed to remove %s from %s: %s", member["telegram_id"], chat_id, e)
-            finally:
-                db_set_confirmation(member["membership_id"], False, None)
+        # the three scans run on separate read connections, off the event loop
+        warning, grace, expired = await asyncio.gather(
+            db_fetch_members_for_warning_async(now, warn_before),
+            db_fetch_recently_expired_async(now, grace_after),
+            db_fetch_expired_members_async(cutoff),
+        )
+        # the pass is written as one writer job: a wave of expiries costs
+        # one commit, and the loop keeps serving updates meanwhile
+        warned: list[int] = []
+        graced: list[int] = []
+        revoked: list[str] = []
+        outbox: list[OutboxItem] = []
+        if owns:
+            warning = [m for m in warning if owns(m)]
+        EXPIRY_BACKLOG.set("warning", len(warning))
+        for member in warning:
+            tid, mid = member["telegram_id"], member["membership_id"]
+            user_lang = normalize_lang(db_get_user_locale(tid))
+            warned.append(tid)
+            outbox.append(OutboxItem(
+                f"warning:{mid}:{member['expires_at']}", "message", tid,
+                settings.templates.renewal_warning, user_lang,
+                {"until": member["expires_at"], "keyboard": "renewal", "membership_id": mid},
+            ))
+        if owns:
+            grace = [m for m in grace if owns(m)]
+        EXPIRY_BACKLOG.set("grace", len(grace))
+        for member in grace:
+            tid, mid = member["telegram_id"], member["membership_id"]
+            user_lang = normalize_lang(db_get_user_locale(tid))
+            graced.append(tid)
+            outbox.append(OutboxItem(
+                f"grace:{mid}:{member['expires_at']}", "message", tid,
+                settings.templates.grace_warning, user_lang,
+                {"until": member["expires_at"] + grace_after},
+            ))
 
+        if owns:
+            expired = [m for m in expired if owns(m)]
+        EXPIRY_BACKLOG.set("expired", len(expired))
+        for member in expired:
+            tid, mid = member["telegram_id"], member["membership_id"]
+            if tid is None:
+                revoked.append(mid)
+                continue
+            # confirmation is revoked by the kick item once the user is
+            # out of every access chat; until then the member is picked
+            # up again each pass and the dedup keys keep the queue as is
+            key = f"{mid}:{member['expires_at']}"
+            user_lang = normalize_lang(db_get_user_locale(tid))
+            outbox.append(OutboxItem(f"expired:{key}", "message", tid, settings.templates.expired, user_lang))
+            outbox.append(OutboxItem(
+                f"kick:{key}", "kick", tid, payload={"membership_id": mid, "expires_at": member["expires_at"]},
+            ))
+        if warned or graced or revoked or outbox:
+            try:
+                await db_record_expiry_pass_async(warned, graced, revoked, outbox)
+            except Exception as e:
+                # nothing was marked, the next pass selects the same members
+                logger.exception("Failed to record expiry pass: %s", e)
+        EXPIRY_TICK_SECONDS.labels("").observe(time.perf_counter() - tick_started)
@@ -0,0 +1,284 @@
+"""In-process metrics registry.
+
+Histograms, counters and gauges are keyed by a single label value (e.g.
+the adapter method name). They are cheap enough for hot paths: one
+``bisect`` and a lock per observation. ``/stats`` reads them through
+:func:`db_stats`; with ``METRICS_PORT`` set they are also served in the
+Prometheus text format by :func:`start_metrics_server`.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LOOP_LAG_INTERVAL = 0.5
+
+# seconds; the implicit last bucket is +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Latency histogram with an optional row counter."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "rows", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, rows: int = 0) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self.rows += rows
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if +Inf or empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+
+class HistogramFamily:
+    """Histograms sharing a name, one per label value.
+
+    ``rows_name`` exposes the per-child row counter as its own counter.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label: Optional[str],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        rows_name: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.rows_name = rows_name
+        self.children: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(value, Histogram(self.buckets))
+        return child
+
+
+class CounterFamily:
+    """Monotonic counters, one per label value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label: Optional[str]) -> None:
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: str = "", amount: float = 1) -> None:
+        with self._lock:
+            self.values[value] = self.values.get(value, 0) + amount
+
+
+class GaugeFamily(CounterFamily):
+    """Values that go up and down; ``callback`` is read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, label: Optional[str], callback: Optional[Callable[[], dict[str, float]]] = None
+    ) -> None:
+        super().__init__(name, help, label)
+        self.callback = callback
+
+    def set(self, value: str, amount: float) -> None:
+        self.values[value] = amount
+
+    def collect(self) -> dict[str, float]:
+        return self.callback() if self.callback else dict(self.values)
+
+
+REGISTRY: list[HistogramFamily | CounterFamily] = []
+
+
+def histogram(
+    name: str,
+    help: str,
+    label: Optional[str],
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    rows_name: Optional[str] = None,
+) -> HistogramFamily:
+    family = HistogramFamily(name, help, label, buckets, rows_name)
+    REGISTRY.append(family)
+    return family
+
+
+def counter(name: str, help: str, label: Optional[str]) -> CounterFamily:
+    family = CounterFamily(name, help, label)
+    REGISTRY.append(family)
+    return family
+
+
+def gauge(
+    name: str, help: str, label: Optional[str], callback: Optional[Callable[[], dict[str, float]]] = None
+) -> GaugeFamily:
+    family = GaugeFamily(name, help, label, callback)
+    REGISTRY.append(family)
+    return family
+
+
+DB_CALL_SECONDS = histogram(
+    "db_call_seconds", "DatabaseAdapter method latency", "method", rows_name="db_call_rows_total"
+)
+DB_ERRORS = counter("db_errors_total", "DatabaseAdapter calls that raised", "method")
+DB_SLOW_QUERIES = counter("db_slow_queries_total", "Statements slower than DB_SLOW_QUERY_MS", "statement")
+
+UPDATES = counter("tg_updates_total", "Updates received by type", "type")
+CALL_SECONDS = histogram(
+    "call_seconds", "Latency of handlers and storage calls wrapped by log_utils (LOG_CALL_TIMING)", "function"
+)
+CALL_ERRORS = counter("call_errors_total", "Calls wrapped by log_utils that raised", "function")
+TG_API_SECONDS = histogram("tg_api_seconds", "Telegram Bot API request latency", "method")
+TG_API_ERRORS = counter("tg_api_errors_total", "Telegram Bot API requests that failed", "method")
+TG_API_RETRY_AFTER = counter("tg_api_retry_after_total", "RetryAfter (flood control) responses", "method")
+EXPIRY_TICK_SECONDS = histogram("expiry_tick_seconds", "Duration of one membership expiry loop pass", None)
+EXPIRY_BACKLOG = gauge("expiry_backlog", "Members handled in the last expiry loop pass", "stage")
+CACHE_HITS = counter("cache_hits_total", "Cache lookups answered from memory", "cache")
+CACHE_MISSES = counter("cache_misses_total", "Cache lookups that fell through", "cache")
+EVENT_LOOP_LAG = gauge("event_loop_lag_seconds", "Extra delay of a timer on the asyncio loop", None)
+LOOP_STALLS = counter("event_loop_stalls_total", "Loop stalls above LOOP_LAG_WARN_MS by sampled function", "function")
+LOOP_SLOW_CALLBACKS = counter("event_loop_slow_callbacks_total", "Callbacks slower than LOOP_SLOW_CALLBACK_MS", None)
+DB_WRITE_BATCH_SECONDS = histogram(
+    "db_write_batch_seconds", "SQLite writer transaction latency", None, rows_name="db_write_batch_ops_total"
+)
+DB_WRITES_COALESCED = counter(
+    "db_writes_coalesced_total", "Queued SQLite writes replaced by a newer one for the same key", "method"
+)
+DB_WRITE_QUEUE = gauge("db_write_queue", "Writes waiting for the SQLite writer", None)
+OUTBOX_BATCH_SECONDS = histogram(
+    "outbox_batch_seconds", "Duration of one outbox dispatch batch", None, rows_name="outbox_batch_items_total"
+)
+OUTBOX_DELIVERIES = counter("outbox_deliveries_total", "Outbox items by outcome: sent, retry or failed", "result")
+
+
+def db_stats(limit: int = 15) -> list[dict]:
+    """Adapter methods ordered by total time spent, for ``/stats``."""
+    rows = []
+    for method, h in list(DB_CALL_SECONDS.children.items()):
+        if not h.count:
+            continue
+        rows.append(
+            {
+                "method": method,
+                "calls": h.count,
+                "total_ms": h.sum * 1000,
+                "avg_ms": h.sum * 1000 / h.count,
+                "p95_ms": (h.quantile(0.95) or float("inf")) * 1000,
+                "rows": h.rows,
+                "errors": DB_ERRORS.values.get(method, 0),
+            }
+        )
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows[:limit]
+
+
+# Exposition -------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(label: Optional[str], value: str, extra: str = "") -> str:
+    pairs = [f'{label}="{_escape(value)}"'] if label else []
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_prometheus() -> str:
+    """Render all registered metrics in the Prometheus text format (0.0.4)."""
+    lines: list[str] = []
+    for family in REGISTRY:
+        if isinstance(family, HistogramFamily):
+            lines += [f"# HELP {family.name} {family.help}", f"# TYPE {family.name} histogram"]
+            children = list(family.children.items())
+            for value, h in children:
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    le = _labels(family.label, value, 'le="%s"' % bound)
+                    lines.append(f"{family.name}_bucket{le} {cumulative}")
+                le = _labels(family.label, value, 'le="+Inf"')
+                lines.append(f"{family.name}_bucket{le} {h.count}")
+                lines.append(f"{family.name}_sum{_labels(family.label, value)} {h.sum}")
+                lines.append(f"{family.name}_count{_labels(family.label, value)} {h.count}")
+            if family.rows_name:
+                lines += [f"# HELP {family.rows_name} Rows returned ({family.help})", f"# TYPE {family.rows_name} counter"]
+                lines += [f"{family.rows_name}{_labels(family.label, value)} {h.rows}" for value, h in children]
+        else:
+            values = family.collect() if isinstance(family, GaugeFamily) else dict(family.values)
+            lines += [f"# HELP {family.name} {family.help}", f"# TYPE {family.name} {family.kind}"]
+            lines += [f"{family.name}{_labels(family.label, value)} {amount}" for value, amount in values.items()]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802 - http.server API
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # keep scrapes out of the bot log
+        pass
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` from a daemon thread; returns None when disabled."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+async def monitor_event_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Measure how late a sleep wakes up; a busy loop shows up as lag."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set("", max(0.0, time.perf_counter() - start - interval))
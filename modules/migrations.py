@@ -0,0 +1,91 @@
+"""Numbered schema migrations applied at startup.
+
+Migrations live in ``schema/<backend>/NNNN_name.sql`` and are applied in
+order by :func:`migrate`; applied versions are recorded in the
+``schema_version`` table. When the database is already current, startup
+costs a single query instead of re-running the whole schema script, which
+on a shared Postgres database took locks on every boot.
+
+A file starting with the ``-- migrate: no-transaction`` line is executed
+statement by statement outside a transaction. Postgres needs this for
+``CREATE INDEX CONCURRENTLY``, which builds an index without blocking
+writes. Such files are split on ``;`` at line ends, so they must not
+contain function bodies.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from .logging_config import logger
+
+if TYPE_CHECKING:
+    from .db_base import DatabaseAdapter
+
+SCHEMA_DIR = Path(__file__).resolve().parent.parent / "schema"
+
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION)
+
+    def statements(self) -> list[str]:
+        """Split a no-transaction migration into single statements."""
+        parts = re.split(r";[ \t]*(?:\n|$)", self.sql)
+        statements = []
+        for part in parts:
+            lines = [ln for ln in part.splitlines() if not ln.lstrip().startswith("--")]
+            stmt = "\n".join(lines).strip()
+            if stmt:
+                statements.append(stmt)
+        return statements
+
+
+def discover(backend: str, directory: Path | None = None) -> tuple[Migration, ...]:
+    """Load migrations for ``backend`` sorted by version."""
+    directory = directory or SCHEMA_DIR / backend
+    migrations = {}
+    for path in directory.glob("*.sql"):
+        match = _FILE_RE.match(path.name)
+        if not match:
+            raise ValueError(f"Migration file name must look like 0001_name.sql: {path}")
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version} in {directory}")
+        migrations[version] = Migration(version, match.group(2), path.read_text(encoding="utf-8"))
+    return tuple(migrations[v] for v in sorted(migrations))
+
+
+def migrate(db: DatabaseAdapter, migrations: tuple[Migration, ...]) -> int:
+    """Apply pending migrations; return how many were applied by this process."""
+    current = db.schema_version()
+    pending = [m for m in migrations if m.version > current]
+    if not pending:
+        logger.info("Database schema is up to date (version %d)", current)
+        return 0
+    applied = 0
+    for migration in pending:
+        start = perf_counter()
+        # another instance may be migrating the same database; the adapter
+        # re-checks under its lock and returns False if it lost the race
+        if db.apply_migration(migration):
+            applied += 1
+            logger.info(
+                "Applied migration %04d_%s in %.1fms",
+                migration.version, migration.name, (perf_counter() - start) * 1000,
+            )
+    logger.info("Database schema migrated to version %d", pending[-1].version)
+    return applied
@@ -0,0 +1,252 @@
+"""Durable delivery of outbound Telegram messages and removals.
+
+Producers do not call the Bot API themselves. They pass
+:class:`~modules.db_base.OutboxItem` rows to the storage write that
+records the state change (``db_mark_warning_sent``,
+``db_set_confirmation``, ...), so the change and the message commit
+together. :class:`OutboxDispatcher` then delivers them:
+
+* due items are claimed in batches of ``OUTBOX_BATCH``; a claim hides the
+  item for ``OUTBOX_LEASE_SEC``, so items of a crashed sender are picked
+  up again after a restart or by another replica;
+* sends go through :data:`~modules.rate_limiter.api_limiter`;
+* a ``"kick"`` item with a ``membership_id`` revokes the confirmation
+  only after the user is out of every access chat; when it is given up,
+  ``ROOT_ADMIN_ID`` is alerted and the member stays confirmed;
+* failures are retried after ``OUTBOX_BACKOFF_SEC * 2**(attempt-1)``
+  seconds (capped at ``OUTBOX_BACKOFF_MAX_SEC``) up to
+  ``OUTBOX_MAX_ATTEMPTS`` attempts; blocked users and unknown chats are
+  given up at once;
+* ``dedup_key`` is unique, so re-enqueueing the same notification within
+  ``OUTBOX_RETENTION_SEC`` is a no-op.
+
+Delivery is at least once: a message whose result could not be recorded
+is sent again when its lease runs out.
+
+Payload keys of ``"message"`` items: ``vars`` (template context),
+``until`` (epoch seconds, rendered as ``remaining`` at send time),
+``keyboard`` (``"renewal"`` with ``membership_id``), ``no_preview``
+(disable link previews) and ``prompt`` (name of a
+:class:`~modules.settings.Prompt` whose image is sent with the text).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+from time import perf_counter
+from typing import Any, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from modules.access_control import kick_in_all_access_chats
+from modules.db_base import OutboxItem
+from modules.keyboards import renewal_keyboard
+from modules.logging_config import logger
+from modules.media_utils import send_localized_image_with_text
+from modules.metrics import OUTBOX_BATCH_SECONDS, OUTBOX_DELIVERIES
+from modules.rate_limiter import api_limiter
+from modules.settings import get_settings
+from modules.storage import (
+    ROOT_ADMIN_ID,
+    add_write_listener,
+    db_claim_outbox_async,
+    db_enqueue_outbox_async,
+    db_finish_outbox_async,
+    db_get_member_by_membership_id,
+    db_purge_outbox_async,
+    db_set_confirmation_async,
+)
+from modules.template_engine import render_template
+from modules.time_utils import humanize_period, now_epoch
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "50"))
+OUTBOX_POLL_SEC = float(os.getenv("OUTBOX_POLL_SEC", "2"))
+OUTBOX_LEASE_SEC = int(os.getenv("OUTBOX_LEASE_SEC", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SEC = float(os.getenv("OUTBOX_BACKOFF_SEC", "10"))
+OUTBOX_BACKOFF_MAX_SEC = float(os.getenv("OUTBOX_BACKOFF_MAX_SEC", "3600"))
+OUTBOX_RETENTION_SEC = int(os.getenv("OUTBOX_RETENTION_SEC", str(7 * 24 * 3600)))
+
+# retrying cannot help: the user blocked the bot or the chat is gone
+PERMANENT_ERRORS = (Forbidden, BadRequest, FileNotFoundError)
+
+PURGE_INTERVAL = 3600
+
+
+async def _send_message(bot, item: dict[str, Any], payload: dict[str, Any]) -> None:
+    lang = item["lang"]
+    context = dict(payload.get("vars") or {})
+    if "until" in payload:
+        context["remaining"] = humanize_period(max(0, payload["until"] - now_epoch()), lang)
+    text = render_template(item["template"], lang=lang, **context)
+    keyboard = None
+    if payload.get("keyboard") == "renewal":
+        keyboard = renewal_keyboard(payload["membership_id"], lang)
+    if payload.get("prompt"):
+        prompt = getattr(get_settings(), payload["prompt"])
+        await api_limiter.call(
+            send_localized_image_with_text,
+            bot,
+            item["chat_id"],
+            asset_key=f"{payload['prompt']}.image",
+            cfg_section=prompt.section,
+            lang=lang,
+            text=text,
+            reply_markup=keyboard,
+        )
+    else:
+        await api_limiter.call(
+            bot.send_message,
+            chat_id=item["chat_id"],
+            text=text,
+            reply_markup=keyboard,
+            disable_web_page_preview=bool(payload.get("no_preview")),
+        )
+
+
+async def _kick(bot, item: dict[str, Any], payload: dict[str, Any]) -> None:
+    membership_id = payload.get("membership_id")
+    if membership_id is not None:
+        member = db_get_member_by_membership_id(membership_id)
+        if not member or not member["is_confirmed"] or member["expires_at"] != payload.get("expires_at"):
+            # renewed or already handled since the item was queued
+            return
+    summary = await kick_in_all_access_chats(bot, item["chat_id"])
+    if summary["errors"]:
+        # kicking is idempotent, the retry repeats it in every chat
+        raise RuntimeError("; ".join(f"{chat_id}: {err}" for chat_id, err in summary["errors"].items()))
+    if membership_id is not None:
+        await db_set_confirmation_async(membership_id, False, None)
+
+
+_ACTIONS = {"message": _send_message, "kick": _kick}
+
+
+class OutboxDispatcher:
+    """Claim due outbox items, deliver them and record the outcome."""
+
+    def __init__(
+        self,
+        bot,
+        batch: int = OUTBOX_BATCH,
+        poll_sec: float = OUTBOX_POLL_SEC,
+        lease_sec: int = OUTBOX_LEASE_SEC,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff_sec: float = OUTBOX_BACKOFF_SEC,
+        backoff_max_sec: float = OUTBOX_BACKOFF_MAX_SEC,
+    ) -> None:
+        self.bot = bot
+        self.batch = max(1, batch)
+        self.poll_sec = poll_sec
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        self.backoff_sec = backoff_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._wake = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._purged_at = 0.0
+        self._alerts: list[OutboxItem] = []
+
+    def _on_write(self, kind: str, key: Any) -> None:
+        # local enqueues wake the dispatcher instead of waiting for the poll
+        if kind == "outbox" and key and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def retry_delay(self, attempts: int, exc: BaseException) -> float:
+        delay = min(self.backoff_max_sec, self.backoff_sec * 2 ** (attempts - 1))
+        if isinstance(exc, RetryAfter):
+            delay = max(delay, float(exc.retry_after))
+        # jitter spreads the retries of a batch that failed together
+        return delay * random.uniform(0.8, 1.2)
+
+    def outcome(self, item: dict[str, Any], exc: Optional[BaseException]) -> tuple[int, Optional[str], Optional[int]]:
+        """``(id, error, retry_at)`` for :func:`db_finish_outbox`."""
+        if exc is None:
+            OUTBOX_DELIVERIES.inc("sent")
+            return item["id"], None, None
+        error = f"{type(exc).__name__}: {exc}"
+        if isinstance(exc, PERMANENT_ERRORS) or item["attempts"] >= self.max_attempts:
+            OUTBOX_DELIVERIES.inc("failed")
+            logger.error(
+                "Giving up outbox item %s (%s to %s) after %d attempts: %s",
+                item["id"], item["action"], item["chat_id"], item["attempts"], error,
+            )
+            if item["action"] == "kick":
+                self._alert_kick_failed(item, error)
+            return item["id"], error, None
+        OUTBOX_DELIVERIES.inc("retry")
+        delay = self.retry_delay(item["attempts"], exc)
+        logger.warning(
+            "Outbox item %s (%s to %s) failed, retry in %.0fs: %s",
+            item["id"], item["action"], item["chat_id"], delay, error,
+        )
+        return item["id"], error, now_epoch() + int(delay)
+
+    def _alert_kick_failed(self, item: dict[str, Any], error: str) -> None:
+        # the member stays confirmed, so the expiry loop queues the removal
+        # again once this item is purged after OUTBOX_RETENTION_SEC
+        if not ROOT_ADMIN_ID:
+            return
+        payload = json.loads(item["payload"] or "{}")
+        # queued by dispatch_once together with the batch outcome
+        self._alerts.append(OutboxItem(
+            f"kick_failed:{item['id']}", "message", ROOT_ADMIN_ID, "admin_kick_failed.txt", None,
+            {"vars": {"id": item["chat_id"], "membership_id": payload.get("membership_id"), "error": error}},
+        ))
+
+    async def _deliver(self, item: dict[str, Any]) -> None:
+        action = _ACTIONS.get(item["action"])
+        if action is None:
+            raise ValueError(f"Unknown outbox action: {item['action']}")
+        await action(self.bot, item, json.loads(item["payload"] or "{}"))
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch of due items; return how many were claimed."""
+        items = await db_claim_outbox_async(now_epoch(), self.batch, self.lease_sec)
+        if not items:
+            return 0
+        start = perf_counter()
+        errors = await asyncio.gather(*(self._deliver(item) for item in items), return_exceptions=True)
+        await db_finish_outbox_async([self.outcome(item, exc) for item, exc in zip(items, errors)])
+        alerts, self._alerts = self._alerts, []
+        if alerts:
+            try:
+                await db_enqueue_outbox_async(alerts)
+            except Exception:
+                logger.exception("Failed to queue %d kick failure alerts", len(alerts))
+        OUTBOX_BATCH_SECONDS.labels("").observe(perf_counter() - start, len(items))
+        return len(items)
+
+    async def purge(self) -> None:
+        removed = await db_purge_outbox_async(now_epoch() - OUTBOX_RETENTION_SEC)
+        if removed:
+            logger.info("Purged %d delivered or failed outbox items", removed)
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        add_write_listener(self._on_write)
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.dispatch_once()
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    self._purged_at = time.monotonic()
+                    await self.purge()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                claimed = 0
+            if claimed >= self.batch:
+                # more may be due right away
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start_outbox_dispatcher(app) -> asyncio.Task:
+    """Start delivering queued notifications, including those left by a previous run."""
+    return asyncio.create_task(OutboxDispatcher(app.bot).run())
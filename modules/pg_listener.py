@@ -0,0 +1,136 @@
+"""Cross-instance cache invalidation over Postgres LISTEN/NOTIFY.
+
+Migration ``0003_change_notify`` adds a ``members`` trigger that publishes
+every change of a member row on the ``tg_gate_changes`` channel.
+:class:`ChangeListener` keeps one dedicated connection subscribed to it,
+watched by the event loop with ``add_reader``, and replays the changes of other instances through the
+storage write listeners. Those are the same hooks that keep local caches
+current after this instance's own writes.
+
+Notifications sent while the listener is disconnected are lost, so every
+(re)connect is followed by a ``"reset"`` event that reloads the caches.
+The loop only collects payloads; replaying them re-reads rows, so it runs
+in a worker thread, one batch at a time and in arrival order.
+The trigger fires per row, so a bulk import or moderation elsewhere
+arrives as a burst; a burst with more than ``PG_NOTIFY_BURST`` distinct
+keys is applied as one ``"reset"`` instead of a re-read per row.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, Callable, Optional
+
+from modules.db_factory import get_db
+from modules.logging_config import logger
+from modules.storage import apply_remote_write
+
+CHANNEL = "tg_gate_changes"
+PG_NOTIFY = os.getenv("PG_NOTIFY", "true").lower() == "true"
+PG_NOTIFY_RETRY_SEC = float(os.getenv("PG_NOTIFY_RETRY_SEC", "5"))
+PG_NOTIFY_BURST = int(os.getenv("PG_NOTIFY_BURST", "50"))
+
+# table -> (write listener kind, key from the payload's key columns)
+_KINDS: dict[str, tuple[str, Callable[[dict], Any]]] = {
+    "members": ("membership", lambda k: k["membership_id"]),
+}
+
+
+def events(payload: str, own_app: str) -> list[tuple[str, Any]]:
+    """Write listener events of one notification payload."""
+    data = json.loads(payload)
+    if data.get("app") == own_app:
+        # our own write, listeners already ran in the writing call
+        return []
+    spec = _KINDS.get(data.get("table"))
+    if spec is None:
+        return []
+    kind, key_of = spec
+    return [(kind, key_of(key)) for key in data.get("keys") or []]
+
+
+def dispatch(payloads: list[str], own_app: str, burst: int = PG_NOTIFY_BURST) -> int:
+    """Replay a batch of notifications; return the number of events applied."""
+    pending: dict[tuple[str, Any], None] = {}
+    for payload in payloads:
+        try:
+            pending.update(dict.fromkeys(events(payload, own_app)))
+        except Exception:
+            logger.exception("Malformed change notification %r", payload)
+    if len(pending) > burst:
+        # one reload is cheaper than re-reading every row
+        apply_remote_write("reset", None)
+        return 1
+    for kind, key in pending:
+        apply_remote_write(kind, key)
+    return len(pending)
+
+
+class ChangeListener:
+    """Subscribe to change notifications and reconnect when the link drops."""
+
+    def __init__(self, db: Any, channel: str = CHANNEL, retry_sec: float = PG_NOTIFY_RETRY_SEC) -> None:
+        self.db = db
+        self.channel = channel
+        self.retry_sec = retry_sec
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._pending: list[str] = []
+        self._ready = asyncio.Event()
+        drain = asyncio.create_task(self._drain())
+        try:
+            while True:
+                try:
+                    conn = await asyncio.to_thread(self.db.listen, self.channel)
+                except Exception as e:
+                    logger.warning("LISTEN %s failed, retrying in %.0fs: %s", self.channel, self.retry_sec, e)
+                    await asyncio.sleep(self.retry_sec)
+                    continue
+                logger.info("Listening for changes of other instances on %s", self.channel)
+                lost: asyncio.Future = loop.create_future()
+                fd = conn.fileno()
+                try:
+                    # notifications arriving meanwhile wait in the socket
+                    await asyncio.to_thread(apply_remote_write, "reset", None)
+                    loop.add_reader(fd, self._on_readable, conn, lost)
+                    error = await lost
+                finally:
+                    loop.remove_reader(fd)
+                    conn.close()
+                logger.warning("Change listener connection lost, reconnecting in %.0fs: %s", self.retry_sec, error)
+                await asyncio.sleep(self.retry_sec)
+        finally:
+            drain.cancel()
+
+    def _on_readable(self, conn: Any, lost: asyncio.Future) -> None:
+        try:
+            conn.poll()
+        except Exception as e:
+            if not lost.done():
+                lost.set_result(e)
+            return
+        if conn.notifies:
+            self._pending.extend(notify.payload for notify in conn.notifies)
+            conn.notifies.clear()
+            self._ready.set()
+
+    async def _drain(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            # everything that arrived while the previous batch ran
+            payloads, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(dispatch, payloads, self.db.application_name)
+            except Exception:
+                logger.exception("Failed to apply %d change notifications", len(payloads))
+
+
+def start_change_listener() -> Optional[asyncio.Task]:
+    """Start the listener when the database is Postgres and PG_NOTIFY is on."""
+    db = get_db()
+    if not PG_NOTIFY or not hasattr(db, "listen"):
+        return None
+    return asyncio.create_task(ChangeListener(db).run())
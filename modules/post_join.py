@@ -1,33 +1,32 @@
 from __future__ import annotations
 
 from modules.i18n import resolve_user_lang, make_username
-from modules.template_engine import render_template
-from modules.media_utils import send_localized_image_with_text
-from modules.storage import (
-    db_get_user_locale,
-    db_was_post_join_sent,
-    db_mark_post_join_sent,
-)
-from modules.config import post_join as POST
+from modules.storage import db_claim_post_join_async, db_get_user_locale
+from modules.db_base import Member, OutboxItem
+from modules.settings import get_settings
+from modules.time_utils import now_epoch
 from modules.log_utils import log_async_call
 
 
 @log_async_call
-async def maybe_send_post_join(bot, member_row: dict, user) -> None:
-    """Send post-join message once after user joins a channel."""
-    if not POST.get("enabled", True):
-        return
-    if db_was_post_join_sent(member_row["id"]):
+async def maybe_send_post_join(bot, member_row: Member, user) -> None:
+    """Send post-join message once after user joins a channel.
+
+    The message is claimed and queued in the outbox with one conditional
+    update, so concurrent join request and chat member updates cannot both
+    send it, and a restart before delivery does not lose it.
+    """
+    prompt = get_settings().post_join
+    if not prompt.enabled:
         return
-    lang = resolve_user_lang(None, {"locale": db_get_user_locale(member_row["telegram_id"])})
-    username = make_username(user, lang)
-    text = render_template(POST.get("template", "post_join.txt"), lang=lang, username=username)
-    await send_localized_image_with_text(
-        bot,
-        member_row["telegram_id"],
-        asset_key="post_join.image",
-        cfg_section=POST,
-        lang=lang,
-        text=text,
+    telegram_id = member_row["telegram_id"]
+    lang = resolve_user_lang(None, {"locale": db_get_user_locale(telegram_id)})
+    message = OutboxItem(
+        f"post_join:{member_row['id']}:{now_epoch()}",
+        "message",
+        telegram_id,
+        prompt.template,
+        lang,
+        {"vars": {"username": make_username(user, lang)}, "prompt": "post_join"},
     )
-    db_mark_post_join_sent(member_row["id"])
+    await db_claim_post_join_async(member_row["id"], [message])
@@ -0,0 +1,298 @@
+"""Catalogue of named SQL statements shared by the database adapters.
+
+Statements are written once with ``?`` placeholders. SQLite runs the text
+as is, so its per-connection statement cache can reuse the compiled
+statement. PostgreSQL runs them as server-side prepared statements
+(``PREPARE name AS ...`` once per pooled connection, then ``EXECUTE``).
+Where the dialects differ, the PostgreSQL text is passed separately.
+
+Only fixed statements belong here; queries assembled at runtime (``IN``
+lists, optional filters, bulk helpers) stay in the adapters.
+"""
+from __future__ import annotations
+
+
+class Query:
+    """Named SQL statement with SQLite and PostgreSQL renderings."""
+
+    __slots__ = ("name", "sqlite", "postgres", "prepared", "nparams")
+
+    def __init__(self, name: str, sql: str, postgres: str | None = None) -> None:
+        parts = (sql if postgres is None else postgres).split("?")
+        self.name = name
+        self.sqlite = sql
+        self.postgres = "%s".join(parts)
+        # PREPARE takes positional $n parameters
+        self.prepared = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+        self.nparams = len(parts) - 1
+
+    def __repr__(self) -> str:
+        return f"Query({self.name})"
+
+
+MEMBER_SELECT = "SELECT m.*, u.username, u.full_name FROM members m LEFT JOIN users u ON m.telegram_id=u.telegram_id"
+
+# Member lookups ---------------------------------------------------------
+MEMBER_BY_TELEGRAM = Query("member_by_telegram", f"{MEMBER_SELECT} WHERE m.telegram_id=?")
+MEMBER_BY_MEMBERSHIP_ID = Query("member_by_membership_id", f"{MEMBER_SELECT} WHERE m.membership_id=?")
+MEMBER_BY_USERNAME = Query(
+    "member_by_username",
+    "SELECT m.*, u.username, u.full_name FROM members m JOIN users u ON m.telegram_id=u.telegram_id WHERE u.username=?",
+)
+MEMBERS_ALL = Query("members_all", MEMBER_SELECT)
+MEMBERS_ACTIVE = Query(
+    "members_active",
+    f"{MEMBER_SELECT} WHERE m.is_banned=FALSE AND m.is_confirmed=TRUE AND (m.expires_at IS NULL OR m.expires_at > ?)",
+)
+MEMBERS_EXPIRED = Query(
+    "members_expired", f"{MEMBER_SELECT} WHERE m.is_confirmed=TRUE AND m.expires_at <= ?"
+)
+MEMBERS_BANNED = Query("members_banned", f"{MEMBER_SELECT} WHERE m.is_banned=TRUE")
+
+# Member writes ----------------------------------------------------------
+UPSERT_USER = Query(
+    "upsert_user",
+    """
+    INSERT INTO users (telegram_id, username, full_name)
+    VALUES (?,?,?)
+    ON CONFLICT(telegram_id) DO UPDATE SET
+        username=excluded.username,
+        full_name=excluded.full_name
+    """,
+)
+# telegram bound to other membership and the new one unknown -> rebind
+REBIND_MEMBER = Query(
+    "rebind_member",
+    """
+    UPDATE members SET membership_id=?
+    WHERE telegram_id=? AND NOT EXISTS (SELECT 1 FROM members WHERE membership_id=?)
+    """,
+)
+# telegram still bound to another existing membership -> release it
+RELEASE_TELEGRAM = Query(
+    "release_telegram", "UPDATE members SET telegram_id=NULL WHERE telegram_id=? AND membership_id<>?"
+)
+# PostgreSQL runs the three statements above as one CTE on one snapshot
+UPSERT_USER_REBIND = Query(
+    "upsert_user_rebind",
+    """
+    WITH upsert_user AS (
+        INSERT INTO users (telegram_id, username, full_name)
+        VALUES (?,?,?)
+        ON CONFLICT(telegram_id) DO UPDATE SET
+            username=EXCLUDED.username,
+            full_name=EXCLUDED.full_name
+    ), rebind AS (
+        UPDATE members SET membership_id=?
+        WHERE telegram_id=? AND NOT EXISTS (SELECT 1 FROM members WHERE membership_id=?)
+    )
+    UPDATE members SET telegram_id=NULL
+    WHERE telegram_id=? AND membership_id<>?
+      AND EXISTS (SELECT 1 FROM members WHERE membership_id=?)
+    """,
+)
+UPSERT_MEMBER = Query(
+    "upsert_member",
+    """
+    INSERT INTO members (membership_id, telegram_id, is_confirmed)
+    VALUES (?,?,?)
+    ON CONFLICT(membership_id) DO UPDATE SET telegram_id=excluded.telegram_id
+    RETURNING id
+    """,
+)
+SET_CONFIRMATION = Query(
+    "set_confirmation",
+    "UPDATE members SET is_confirmed=?, expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE membership_id=?",
+)
+SET_CONFIRMED = Query(
+    "set_confirmed",
+    "UPDATE members SET is_confirmed=?, expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL, post_join_sent_at=NULL WHERE telegram_id=?",
+)
+SET_BAN = Query("set_ban", "UPDATE members SET is_banned=? WHERE membership_id=?")
+SET_BANNED = Query("set_banned", "UPDATE members SET is_banned=? WHERE telegram_id=?")
+UPDATE_EXPIRATION = Query(
+    "update_expiration",
+    "UPDATE members SET expires_at=?, warn_sent_at=NULL, grace_notified_at=NULL WHERE membership_id=?",
+)
+DELETE_MEMBER = Query("delete_member", "DELETE FROM members WHERE id=?")
+DELETE_USER = Query("delete_user", "DELETE FROM users WHERE telegram_id=?")
+
+# Expiration -------------------------------------------------------------
+MEMBERS_FOR_WARNING = Query(
+    "members_for_warning",
+    """
+    SELECT * FROM members
+    WHERE is_confirmed=TRUE AND warn_sent_at IS NULL
+      AND expires_at > ? AND expires_at <= ?
+    """,
+)
+EXPIRED_MEMBERS = Query(
+    "expired_members", "SELECT * FROM members WHERE is_confirmed=TRUE AND expires_at <= ?"
+)
+RECENTLY_EXPIRED = Query(
+    "recently_expired",
+    """
+    SELECT * FROM members
+    WHERE is_confirmed=TRUE AND grace_notified_at IS NULL
+      AND expires_at <= ? AND expires_at >= ?
+    """,
+)
+MARK_WARNING_SENT = Query(
+    "mark_warning_sent",
+    "UPDATE members SET warn_sent_at=? WHERE telegram_id=?",
+    "UPDATE members SET warn_sent_at=NOW() WHERE telegram_id=?",
+)
+MARK_GRACE_NOTIFIED = Query(
+    "mark_grace_notified",
+    "UPDATE members SET grace_notified_at=? WHERE telegram_id=?",
+    "UPDATE members SET grace_notified_at=NOW() WHERE telegram_id=?",
+)
+
+# Eligibility index --------------------------------------------------------
+FETCH_ELIGIBILITY = Query(
+    "fetch_eligibility",
+    "SELECT telegram_id, id, membership_id, is_confirmed, is_banned, expires_at FROM members WHERE telegram_id IS NOT NULL",
+    """
+    SELECT telegram_id, id, membership_id, is_confirmed, is_banned,
+           EXTRACT(EPOCH FROM expires_at)::BIGINT AS expires_at
+    FROM members WHERE telegram_id IS NOT NULL
+    """,
+)
+
+# Post-join ----------------------------------------------------------------
+WAS_POST_JOIN_SENT = Query("was_post_join_sent", "SELECT post_join_sent_at FROM members WHERE id=?")
+MARK_POST_JOIN_SENT = Query(
+    "mark_post_join_sent",
+    "UPDATE members SET post_join_sent_at=? WHERE id=?",
+    "UPDATE members SET post_join_sent_at=NOW() WHERE id=?",
+)
+CLAIM_POST_JOIN = Query(
+    "claim_post_join",
+    """
+    UPDATE members SET post_join_sent_at=?
+    WHERE id=? AND post_join_sent_at IS NULL
+    RETURNING (SELECT locale FROM users WHERE users.telegram_id=members.telegram_id) AS locale
+    """,
+    """
+    UPDATE members m SET post_join_sent_at=NOW()
+    WHERE m.id=? AND m.post_join_sent_at IS NULL
+    RETURNING (SELECT u.locale FROM users u WHERE u.telegram_id=m.telegram_id) AS locale
+    """,
+)
+RELEASE_POST_JOIN = Query("release_post_join", "UPDATE members SET post_join_sent_at=NULL WHERE id=?")
+
+# Join links ---------------------------------------------------------------
+GET_JOIN_LINK = Query("get_join_link", "SELECT * FROM join_invite_links WHERE chat_id=?")
+UPSERT_JOIN_LINK = Query(
+    "upsert_join_link",
+    """
+    INSERT INTO join_invite_links (chat_id, invite_link)
+    VALUES (?,?)
+    ON CONFLICT(chat_id) DO UPDATE SET invite_link=excluded.invite_link
+    """,
+)
+
+# Admins -------------------------------------------------------------------
+IS_ADMIN = Query("is_admin", "SELECT 1 FROM admins WHERE telegram_id=?")
+ADD_ADMIN = Query(
+    "add_admin",
+    """
+    INSERT INTO admins (telegram_id, is_top_level)
+    VALUES (?,?)
+    ON CONFLICT(telegram_id) DO UPDATE SET is_top_level=excluded.is_top_level
+    """,
+)
+REMOVE_ADMIN = Query("remove_admin", "DELETE FROM admins WHERE telegram_id=?")
+LIST_ADMINS = Query("list_admins", "SELECT * FROM admins")
+
+# User preferences ---------------------------------------------------------
+GET_USER_LOCALE = Query("get_user_locale", "SELECT locale FROM users WHERE telegram_id=?")
+SET_USER_LOCALE = Query(
+    "set_user_locale",
+    """
+    INSERT INTO users (telegram_id, locale)
+    VALUES (?,?)
+    ON CONFLICT (telegram_id) DO UPDATE SET locale=excluded.locale
+    """,
+)
+
+# Media cache --------------------------------------------------------------
+GET_MEDIA_CACHE = Query(
+    "get_media_cache", "SELECT file_hash, file_id FROM media_cache WHERE asset_key=? AND lang=?"
+)
+UPSERT_MEDIA_CACHE = Query(
+    "upsert_media_cache",
+    """
+    INSERT INTO media_cache (asset_key, lang, file_hash, file_id)
+    VALUES (?,?,?,?)
+    ON CONFLICT (asset_key, lang) DO UPDATE SET
+        file_hash=excluded.file_hash,
+        file_id=excluded.file_id,
+        updated_at=CURRENT_TIMESTAMP
+    """,
+)
+
+# Leases -------------------------------------------------------------------
+# Expiry is compared against the database clock so that replica clocks may
+# drift. The upsert only succeeds for the current holder or an expired
+# lease; RETURNING yields a row exactly when the lease is ours.
+ACQUIRE_LEASE = Query(
+    "acquire_lease",
+    """
+    INSERT INTO leases (name, holder, expires_at)
+    VALUES (?, ?, CAST(strftime('%s','now') AS INTEGER) + ?)
+    ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at
+    WHERE leases.holder=excluded.holder OR leases.expires_at < CAST(strftime('%s','now') AS INTEGER)
+    RETURNING holder
+    """,
+    """
+    INSERT INTO leases (name, holder, expires_at)
+    VALUES (?, ?, EXTRACT(EPOCH FROM NOW())::BIGINT + ?)
+    ON CONFLICT (name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at
+    WHERE leases.holder=excluded.holder OR leases.expires_at < EXTRACT(EPOCH FROM NOW())::BIGINT
+    RETURNING holder
+    """,
+)
+RELEASE_LEASE = Query("release_lease", "DELETE FROM leases WHERE name=? AND holder=?")
+LIVE_LEASES = Query(
+    "live_leases",
+    "SELECT name, holder FROM leases WHERE expires_at >= CAST(strftime('%s','now') AS INTEGER)",
+    "SELECT name, holder FROM leases WHERE expires_at >= EXTRACT(EPOCH FROM NOW())::BIGINT",
+)
+
+# Outbox -------------------------------------------------------------------
+ENQUEUE_OUTBOX = Query(
+    "enqueue_outbox",
+    """
+    INSERT INTO outbox (dedup_key, action, chat_id, template, lang, payload, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (dedup_key) DO NOTHING
+    """,
+)
+# Claiming pushes next_attempt_at past the lease, so an item whose sender
+# died is picked up again once the lease runs out. SKIP LOCKED lets
+# Postgres replicas claim disjoint batches concurrently.
+CLAIM_OUTBOX = Query(
+    "claim_outbox",
+    """
+    UPDATE outbox SET next_attempt_at=?, attempts=attempts+1
+    WHERE id IN (
+        SELECT id FROM outbox WHERE status='pending' AND next_attempt_at<=?
+        ORDER BY next_attempt_at, id LIMIT ?
+    )
+    RETURNING id, action, chat_id, template, lang, payload, attempts
+    """,
+    """
+    UPDATE outbox SET next_attempt_at=?, attempts=attempts+1
+    WHERE id IN (
+        SELECT id FROM outbox WHERE status='pending' AND next_attempt_at<=?
+        ORDER BY next_attempt_at, id LIMIT ?
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, action, chat_id, template, lang, payload, attempts
+    """,
+)
+OUTBOX_SENT = Query("outbox_sent", "UPDATE outbox SET status='sent', sent_at=?, last_error=NULL WHERE id=?")
+OUTBOX_RETRY = Query("outbox_retry", "UPDATE outbox SET next_attempt_at=?, last_error=? WHERE id=?")
+OUTBOX_FAILED = Query("outbox_failed", "UPDATE outbox SET status='failed', last_error=? WHERE id=?")
+PURGE_OUTBOX = Query("purge_outbox", "DELETE FROM outbox WHERE status<>'pending' AND created_at<?")
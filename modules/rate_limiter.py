@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from telegram.error import RetryAfter
+
+from modules.logging_config import logger
+
+
+class RateLimiter:
+    """Spread Telegram API calls over time and cap how many run at once.
+
+    Calls are started no faster than ``rate`` per second, at most
+    ``concurrency`` are in flight, and ``RetryAfter`` responses are retried
+    after the delay requested by Telegram.
+    """
+
+    def __init__(self, rate: float, concurrency: int, max_retries: int = 3) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.max_retries = max_retries
+        self._concurrency = max(1, concurrency)
+        self._sem: asyncio.Semaphore | None = None
+        self._next_slot = 0.0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # created on first use so that the limiter is bound to the running loop
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._concurrency)
+        return self._sem
+
+    async def _wait_slot(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            async with self._semaphore():
+                await self._wait_slot()
+                try:
+                    return await func(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = float(e.retry_after)
+            attempt += 1
+            logger.warning(
+                "RetryAfter in %s, sleeping %.1fs (attempt %s)",
+                getattr(func, "__name__", func), delay, attempt,
+            )
+            await asyncio.sleep(delay)
+
+
+api_limiter = RateLimiter(
+    rate=float(os.getenv("TG_API_RATE", "25")),
+    concurrency=int(os.getenv("TG_API_CONCURRENCY", "8")),
+    max_retries=int(os.getenv("TG_API_MAX_RETRIES", "3")),
+)
@@ -3,6 +3,7 @@ from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
 from modules.log_utils import log_async_call
+from modules.settings import get_settings
 from modules.states import UserState
 
 
@@ -10,7 +11,8 @@ from modules.states import UserState
 async def suppress_service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Delete service messages like joins or pins if the feature is enabled."""
     context.user_data["state"] = UserState.IDLE
-    if not context.bot_data.get("suppress_service_messages", True):
+    # read per update so that a settings reload applies at once
+    if not get_settings().suppress_service_messages:
         return
     try:
         await update.effective_message.delete()
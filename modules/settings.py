@@ -0,0 +1,252 @@
+"""Validated, immutable runtime settings built from the YAML configs and env.
+
+``config.py`` only parses the files; this module turns the parts used at
+runtime into frozen slotted objects, checks them once, and lets handlers
+read plain attributes (``get_settings().templates.granted``) instead of
+``dict.get`` chains with defaults repeated at every call site.
+
+:func:`reload_settings` re-reads ``ui_config.yaml``, ``membership.yaml``
+and ``ACCESS_CHATS`` from ``.env``, validates the result and swaps it in
+with a single assignment, so a reader always sees either the old or the
+new settings. On a validation error the current settings stay in place.
+The ``i18n.yaml`` languages are read once at startup.
+"""
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, Optional
+
+import yaml
+from dotenv import dotenv_values, load_dotenv
+
+from modules import config
+from modules.logging_config import logger
+
+load_dotenv()
+
+Label = Any  # plain string or {lang: text}
+
+
+class SettingsError(ValueError):
+    """Configuration failed validation; ``problems`` lists every issue found."""
+
+    def __init__(self, problems: list[str]) -> None:
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+@dataclass(frozen=True, slots=True)
+class MessageTemplates:
+    ask_id: str = "ask_id.txt"
+    waiting: str = "id_waiting.txt"
+    banned: str = "id_banned.txt"
+    not_found: str = "id_not_found.txt"
+    granted: str = "access_granted.txt"
+    denied: str = "access_denied.txt"
+    expired: str = "expired.txt"
+    admin_request: str = "admin_request.txt"
+    renewal_warning: str = "renewal_warning.txt"
+    grace_warning: str = "grace_warning.txt"
+    renewal_requested_admin: str = "renewal_requested_admin.txt"
+    links_unavailable: str = "links_unavailable.txt"
+    session_timeout: str = "session_timeout.txt"
+
+
+@dataclass(frozen=True, slots=True)
+class Prompt:
+    """A message with optional image; ``section`` keeps the raw media settings."""
+
+    template: str
+    enabled: bool
+    enabled_image: bool
+    button_text: Label
+    section: Mapping[str, Any]
+
+
+@dataclass(frozen=True, slots=True)
+class Plan:
+    id: str
+    label: Label
+    duration_sec: int
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    access_chats: tuple[int, ...]
+    templates: MessageTemplates
+    id_pattern: re.Pattern
+    approve_durations: tuple[int, ...]
+    enable_decline: bool
+    enable_ban: bool
+    check_interval: int
+    warn_before_sec: int
+    grace_after_sec: int
+    plans: tuple[Plan, ...]
+    plans_by_id: Mapping[str, Plan]
+    session_timeout_sec: int
+    session_timeout_message: bool
+    suppress_service_messages: bool
+    start: Prompt
+    ask_id: Prompt
+    invalid_id: Prompt
+    post_join: Prompt
+    language_prompt: Mapping[str, Any]
+    start_language_prompt: Mapping[str, Any]
+    admin_ui: Mapping[str, Any]
+
+
+def _freeze(section: Optional[Mapping[str, Any]]) -> Mapping[str, Any]:
+    return MappingProxyType(dict(section or {}))
+
+
+def _int(section: Mapping[str, Any], key: str, default: int, problems: list[str], where: str) -> int:
+    value = section.get(key, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        problems.append(f"{where}.{key} must be an integer, got {value!r}")
+        return default
+    if value < 0:
+        problems.append(f"{where}.{key} must not be negative")
+    return value
+
+
+def _prompt(section: Optional[Mapping[str, Any]], template: str, enabled_image: bool) -> Prompt:
+    section = section or {}
+    return Prompt(
+        template=section.get("template", template),
+        enabled=bool(section.get("enabled", True)),
+        enabled_image=bool(section.get("enabled_image", enabled_image)),
+        button_text=section.get("action_button_text"),
+        section=_freeze(section),
+    )
+
+
+def parse_access_chats(raw: Optional[str], problems: list[str]) -> tuple[int, ...]:
+    chats = []
+    for cid in (raw or "").split(","):
+        cid = cid.strip()
+        if not cid:
+            continue
+        try:
+            chats.append(int(cid))
+        except ValueError:
+            problems.append(f"ACCESS_CHATS contains a non-numeric chat id {cid!r}")
+    return tuple(chats)
+
+
+def build_settings(ui: Mapping[str, Any], mb: Mapping[str, Any], access_chats: Optional[str]) -> Settings:
+    """Build and validate settings from parsed config files; raise SettingsError."""
+    problems: list[str] = []
+
+    messages = ui.get("messages") or {}
+    known = {f.name for f in fields(MessageTemplates)}
+    templates = MessageTemplates(**{k: v for k, v in messages.items() if k in known})
+    for name in known:
+        template = getattr(templates, name)
+        if not any((config.TEMPLATES_DIR / rel).exists() for rel in (f"{config.DEFAULT_LANG}/{template}", template)):
+            problems.append(f"messages.{name}: template {template!r} not found")
+
+    id_cfg = mb.get("id") or {}
+    try:
+        id_pattern = re.compile(id_cfg.get("pattern", ".+"))
+    except re.error as e:
+        problems.append(f"id.pattern is not a valid regular expression: {e}")
+        id_pattern = re.compile(".+")
+
+    admin = mb.get("admin") or {}
+    approve_durations = []
+    for sec in admin.get("approve_durations") or []:
+        try:
+            approve_durations.append(int(sec))
+        except (TypeError, ValueError):
+            problems.append(f"admin.approve_durations: {sec!r} is not a number of seconds")
+
+    expiration = mb.get("expiration") or {}
+    renewal = mb.get("renewal") or {}
+    check_interval = _int(expiration, "check_interval", 60, problems, "expiration")
+    if check_interval == 0:
+        problems.append("expiration.check_interval must be positive")
+    warn_before = _int(
+        renewal, "warn_before_sec", _int(expiration, "warn_before_sec", 86400, problems, "expiration"), problems, "renewal"
+    )
+    grace_after = _int(renewal, "grace_after_expiry_sec", 86400, problems, "renewal")
+
+    plans = []
+    for i, plan in enumerate(renewal.get("user_plans") or []):
+        if not plan.get("id"):
+            problems.append(f"renewal.user_plans[{i}] has no id")
+            continue
+        plans.append(Plan(str(plan["id"]), plan.get("label"), _int(plan, "duration_sec", 0, problems, f"renewal.user_plans[{i}]")))
+    plans_by_id = {p.id: p for p in plans}
+    if len(plans_by_id) != len(plans):
+        problems.append("renewal.user_plans ids must be unique")
+
+    session = mb.get("session_timeout") or {}
+    session_timeout = _int(session, "seconds", 900, problems, "session_timeout")
+    if session_timeout == 0:
+        problems.append("session_timeout.seconds must be positive")
+
+    chats = parse_access_chats(access_chats, problems)
+    if problems:
+        raise SettingsError(problems)
+    return Settings(
+        access_chats=chats,
+        templates=templates,
+        id_pattern=id_pattern,
+        approve_durations=tuple(approve_durations),
+        enable_decline=bool(admin.get("enable_decline", True)),
+        enable_ban=bool(admin.get("enable_ban", True)),
+        check_interval=check_interval,
+        warn_before_sec=warn_before,
+        grace_after_sec=grace_after,
+        plans=tuple(plans),
+        plans_by_id=MappingProxyType(plans_by_id),
+        session_timeout_sec=session_timeout,
+        session_timeout_message=bool(session.get("send_message", False)),
+        suppress_service_messages=bool((ui.get("behavior") or {}).get("suppress_service_messages", True)),
+        start=_prompt(ui.get("start"), "start_user.txt", True),
+        ask_id=_prompt(ui.get("ask_id_prompt"), "ask_id.txt", False),
+        invalid_id=_prompt(ui.get("invalid_id_prompt"), "id_invalid.txt", False),
+        post_join=_prompt(ui.get("post_join"), "post_join.txt", False),
+        language_prompt=_freeze(ui.get("language_prompt")),
+        start_language_prompt=_freeze(ui.get("start_language_prompt")),
+        admin_ui=_freeze(ui.get("admin_interface")),
+    )
+
+
+_current = build_settings(config.ui_raw, config.membership_raw, os.getenv("ACCESS_CHATS"))
+_reload_listeners: list[Callable[[Settings], None]] = []
+
+
+def get_settings() -> Settings:
+    return _current
+
+
+def add_reload_listener(callback: Callable[[Settings], None]) -> None:
+    """Call ``callback(new_settings)`` after every successful reload."""
+    _reload_listeners.append(callback)
+
+
+def reload_settings() -> Settings:
+    """Re-read configs and swap them in atomically; raise SettingsError and keep
+    the current settings if the new ones are invalid."""
+    global _current
+    try:
+        ui, mb = config.load_raw()
+    except (OSError, yaml.YAMLError) as exc:
+        # unreadable or malformed file: callers only handle SettingsError
+        raise SettingsError([f"cannot load config: {exc}"]) from exc
+    access_chats = dotenv_values().get("ACCESS_CHATS", os.getenv("ACCESS_CHATS"))
+    new = build_settings(ui, mb, access_chats)
+    _current = new
+    for callback in _reload_listeners:
+        try:
+            callback(new)
+        except Exception:
+            logger.exception("Settings reload listener %r failed", callback)
+    logger.info("Configuration reloaded")
+    return new
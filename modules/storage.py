@@ -1,22 +1,109 @@
 from __future__ import annotations
 
+import asyncio
 import os
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Any, Callable, Sequence
 
 from dotenv import load_dotenv
 
-from modules.log_utils import log_sync_call
-from modules.db_factory import get_db
+from modules.log_utils import log_async_call, log_sync_call
+from modules.db_base import OutboxItem
+from modules.db_factory import close_writer, get_db, get_writer
+from modules.logging_config import logger
 
 load_dotenv()
 ROOT_ADMIN_ID = int(os.getenv("ROOT_ADMIN_ID", 0))
 
+# Write listeners are called as listener(kind, key) after member writes.
+# kind is "membership" (membership_id), "telegram" (telegram_id),
+# "row" (members.id), "bulk" ((action, membership_ids)) or "import" (rows).
+# Member changes made by other instances (modules.pg_listener) arrive as
+# "membership" too, and "reset" (None) stands for changes that may have
+# been missed or were too many to replay one by one. "outbox"
+# (number of items) follows writes that enqueued outbox items.
+_write_listeners: list[Callable[[str, Any], None]] = []
+
+
+def add_write_listener(listener: Callable[[str, Any], None]) -> None:
+    """Register a callback notified after member rows change."""
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+
+def _notify_write(kind: str, key: Any) -> None:
+    for listener in _write_listeners:
+        try:
+            listener(kind, key)
+        except Exception:
+            logger.exception("Write listener %s failed for %s %s", listener, kind, key)
+
+
+def _write(method: str, *args: Any) -> Any:
+    """Run an adapter write, through the SQLite writer thread when it is on.
+
+    The calling thread waits until the writer commits the batch holding
+    this write. Called from a coroutine this blocks the event loop, so
+    handlers use the ``*_async`` variants built on :func:`_write_async`.
+    """
+    writer = get_writer()
+    if writer is None:
+        return getattr(get_db(), method)(*args)
+    return writer.submit(method, *args).result()
+
+
+def _write_behind(method: str, key: Any, *args: Any) -> Future:
+    """Queue a write without waiting; a newer one for the same key replaces it."""
+    writer = get_writer()
+    if writer is not None:
+        return writer.submit(method, *args, key=key)
+    future: Future = Future()
+    future.set_result(getattr(get_db(), method)(*args))
+    return future
+
+
+async def _write_async(method: str, *args: Any) -> Any:
+    """Like :func:`_write`, but the event loop keeps running until the commit."""
+    writer = get_writer()
+    if writer is None:
+        return await asyncio.to_thread(getattr(get_db(), method), *args)
+    return await asyncio.wrap_future(writer.submit(method, *args))
+
+
+async def _read_async(method: str, *args: Any) -> Any:
+    """Run an adapter read in a worker thread.
+
+    For the list reads only: they scan many rows, and concurrent ones use
+    separate connections of the SQLite read pool. Point lookups stay on
+    the event loop, where they take less than a thread hop.
+    """
+    return await asyncio.to_thread(getattr(get_db(), method), *args)
+
+
+def _write_with_outbox(method: str, outbox: Sequence[OutboxItem], *args: Any) -> Any:
+    """Run a write together with enqueueing ``outbox`` in one transaction."""
+    result = _write(method, *args, tuple(outbox))
+    _notify_write("outbox", len(outbox))
+    return result
+
+
+def apply_remote_write(kind: str, key: Any) -> None:
+    """Replay a change committed by another bot instance to local caches."""
+    _notify_write(kind, key)
+
 
 @log_sync_call
 def db_init() -> None:
     get_db().init()
 
 
+@log_sync_call
+def db_close() -> None:
+    close_writer()
+    get_db().close()
+
+
 @log_sync_call
 def db_get_member_by_telegram(telegram_id: int):
     return get_db().get_member_by_telegram(telegram_id)
@@ -37,18 +124,59 @@ def db_get_member_by_username(username: str):
 
 
 @log_sync_call
-def db_upsert_member(membership_id: str, telegram_id: int, username: str | None, full_name: str | None, is_confirmed: bool = False) -> None:
-    get_db().upsert_member(membership_id, telegram_id, username, full_name, is_confirmed)
+def db_upsert_member(membership_id: str, telegram_id: int, username: str | None, full_name: str | None, is_confirmed: bool = False) -> int:
+    member_id = _write("upsert_member", membership_id, telegram_id, username, full_name, is_confirmed)
+    _notify_write("membership", membership_id)
+    _notify_write("telegram", telegram_id)
+    return member_id
+
+
+@log_async_call
+async def db_upsert_member_async(
+    membership_id: str, telegram_id: int, username: str | None, full_name: str | None, is_confirmed: bool = False
+) -> int:
+    member_id = await _write_async("upsert_member", membership_id, telegram_id, username, full_name, is_confirmed)
+    _notify_write("membership", membership_id)
+    _notify_write("telegram", telegram_id)
+    return member_id
 
 
 @log_sync_call
-def db_set_confirmation(membership_id: str, is_confirmed: bool, expires_at: datetime | None = None) -> None:
-    get_db().set_confirmation(membership_id, is_confirmed, expires_at)
+def db_set_confirmation(
+    membership_id: str, is_confirmed: bool, expires_at: datetime | None = None, outbox: Sequence[OutboxItem] = ()
+) -> None:
+    if outbox:
+        _write_with_outbox("set_confirmation", outbox, membership_id, is_confirmed, expires_at)
+    else:
+        _write("set_confirmation", membership_id, is_confirmed, expires_at)
+    _notify_write("membership", membership_id)
+
+
+@log_async_call
+async def db_set_confirmation_async(
+    membership_id: str, is_confirmed: bool, expires_at: datetime | None = None, outbox: Sequence[OutboxItem] = ()
+) -> None:
+    await _write_async("set_confirmation", membership_id, is_confirmed, expires_at, tuple(outbox))
+    if outbox:
+        _notify_write("outbox", len(outbox))
+    _notify_write("membership", membership_id)
 
 
 @log_sync_call
-def db_set_ban(membership_id: str, is_banned: bool) -> None:
-    get_db().set_ban(membership_id, is_banned)
+def db_set_ban(membership_id: str, is_banned: bool, outbox: Sequence[OutboxItem] = ()) -> None:
+    if outbox:
+        _write_with_outbox("set_ban", outbox, membership_id, is_banned)
+    else:
+        _write("set_ban", membership_id, is_banned)
+    _notify_write("membership", membership_id)
+
+
+@log_async_call
+async def db_set_ban_async(membership_id: str, is_banned: bool, outbox: Sequence[OutboxItem] = ()) -> None:
+    await _write_async("set_ban", membership_id, is_banned, tuple(outbox))
+    if outbox:
+        _notify_write("outbox", len(outbox))
+    _notify_write("membership", membership_id)
 
 
 @log_sync_call
@@ -58,22 +186,38 @@ def db_get_member_by_id_or_username(key: int | str):
 
 @log_sync_call
 def db_set_banned(member_id: int, banned: bool) -> None:
-    get_db().set_banned(member_id, banned)
+    _write("set_banned", member_id, banned)
+    _notify_write("telegram", member_id)
 
 
 @log_sync_call
 def db_set_confirmed(member_id: int, confirmed: bool, expires_at: datetime | None) -> None:
-    get_db().set_confirmed(member_id, confirmed, expires_at)
+    _write("set_confirmed", member_id, confirmed, expires_at)
+    _notify_write("telegram", member_id)
 
 
 @log_sync_call
 def db_delete_member_by_id(member_id: int) -> None:
-    get_db().delete_member_by_id(member_id)
+    _write("delete_member_by_id", member_id)
+    _notify_write("row", member_id)
+
+
+@log_async_call
+async def db_delete_member_by_id_async(member_id: int) -> None:
+    await _write_async("delete_member_by_id", member_id)
+    _notify_write("row", member_id)
 
 
 @log_sync_call
 def db_delete_user_by_telegram_id(telegram_id: int) -> None:
-    get_db().delete_user_by_telegram_id(telegram_id)
+    _write("delete_user_by_telegram_id", telegram_id)
+    _notify_write("telegram", telegram_id)
+
+
+@log_async_call
+async def db_delete_user_by_telegram_id_async(telegram_id: int) -> None:
+    await _write_async("delete_user_by_telegram_id", telegram_id)
+    _notify_write("telegram", telegram_id)
 
 
 @log_sync_call
@@ -81,9 +225,16 @@ def db_iter_members(scope: str):
     return list(get_db().iter_members(scope))
 
 
+@log_async_call
+async def db_iter_members_async(scope: str):
+    # the rows are listed in the worker thread too
+    return await asyncio.to_thread(lambda: list(get_db().iter_members(scope)))
+
+
 @log_sync_call
 def db_update_expiration(membership_id: str, expires_at: datetime | None) -> None:
-    get_db().update_expiration(membership_id, expires_at)
+    _write("update_expiration", membership_id, expires_at)
+    _notify_write("membership", membership_id)
 
 
 @log_sync_call
@@ -91,14 +242,73 @@ def db_fetch_members_for_warning(now: datetime, threshold: int):
     return get_db().fetch_members_for_warning(now, threshold)
 
 
+@log_async_call
+async def db_fetch_members_for_warning_async(now: datetime, threshold: int):
+    return await _read_async("fetch_members_for_warning", now, threshold)
+
+
 @log_sync_call
 def db_fetch_expired_members(now: datetime):
     return get_db().fetch_expired_members(now)
 
 
+@log_async_call
+async def db_fetch_expired_members_async(now: datetime):
+    return await _read_async("fetch_expired_members", now)
+
+
+@log_sync_call
+def db_mark_warning_sent(telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> Future | None:
+    if outbox:
+        # not write-behind: coalescing would drop the replaced call's items
+        return _write_with_outbox("mark_warning_sent", outbox, telegram_id)
+    return _write_behind("mark_warning_sent", telegram_id, telegram_id)
+
+
+@log_sync_call
+def db_get_members_by_keys(membership_ids=(), telegram_ids=(), usernames=()):
+    return get_db().get_members_by_keys(membership_ids, telegram_ids, usernames)
+
+
+@log_async_call
+async def db_get_members_by_keys_async(membership_ids=(), telegram_ids=(), usernames=()):
+    return await _read_async("get_members_by_keys", membership_ids, telegram_ids, usernames)
+
+
 @log_sync_call
-def db_mark_warning_sent(telegram_id: int) -> None:
-    get_db().mark_warning_sent(telegram_id)
+def db_find_members(expired_before: datetime | None = None, never_joined: bool = False):
+    return get_db().find_members(expired_before, never_joined)
+
+
+@log_async_call
+async def db_find_members_async(expired_before: datetime | None = None, never_joined: bool = False):
+    return await _read_async("find_members", expired_before, never_joined)
+
+
+@log_sync_call
+def db_bulk_moderate(action: str, membership_ids) -> int:
+    affected = _write("bulk_moderate", action, membership_ids)
+    _notify_write("bulk", (action, list(membership_ids)))
+    return affected
+
+
+@log_async_call
+async def db_bulk_moderate_async(action: str, membership_ids) -> int:
+    affected = await _write_async("bulk_moderate", action, membership_ids)
+    _notify_write("bulk", (action, list(membership_ids)))
+    return affected
+
+
+@log_sync_call
+def db_bulk_upsert_members(rows) -> int:
+    written = _write("bulk_upsert_members", rows)
+    _notify_write("import", rows)
+    return written
+
+
+@log_sync_call
+def db_fetch_eligibility():
+    return get_db().fetch_eligibility()
 
 
 @log_sync_call
@@ -107,8 +317,28 @@ def db_was_post_join_sent(member_id: int) -> bool:
 
 
 @log_sync_call
-def db_mark_post_join_sent(member_id: int) -> None:
-    get_db().mark_post_join_sent(member_id)
+def db_mark_post_join_sent(member_id: int) -> Future:
+    return _write_behind("mark_post_join_sent", member_id, member_id)
+
+
+@log_sync_call
+def db_claim_post_join(member_id: int, outbox: Sequence[OutboxItem] = ()) -> tuple[bool, str | None]:
+    if outbox:
+        return _write_with_outbox("claim_post_join", outbox, member_id)
+    return _write("claim_post_join", member_id)
+
+
+@log_async_call
+async def db_claim_post_join_async(member_id: int, outbox: Sequence[OutboxItem] = ()) -> tuple[bool, str | None]:
+    result = await _write_async("claim_post_join", member_id, tuple(outbox))
+    if outbox and result[0]:
+        _notify_write("outbox", len(outbox))
+    return result
+
+
+@log_sync_call
+def db_release_post_join(member_id: int) -> None:
+    _write("release_post_join", member_id)
 
 
 @log_sync_call
@@ -117,8 +347,8 @@ def db_get_join_link(chat_id: int):
 
 
 @log_sync_call
-def db_upsert_join_link(chat_id: int, invite_link: str) -> None:
-    get_db().upsert_join_link(chat_id, invite_link)
+def db_upsert_join_link(chat_id: int, invite_link: str) -> Future:
+    return _write_behind("upsert_join_link", chat_id, chat_id, invite_link)
 
 
 @log_sync_call
@@ -126,9 +356,16 @@ def db_fetch_recently_expired(now: datetime, grace_sec: int):
     return get_db().fetch_recently_expired(now, grace_sec)
 
 
+@log_async_call
+async def db_fetch_recently_expired_async(now: datetime, grace_sec: int):
+    return await _read_async("fetch_recently_expired", now, grace_sec)
+
+
 @log_sync_call
-def db_mark_grace_notified(telegram_id: int) -> None:
-    get_db().mark_grace_notified(telegram_id)
+def db_mark_grace_notified(telegram_id: int, outbox: Sequence[OutboxItem] = ()) -> Future | None:
+    if outbox:
+        return _write_with_outbox("mark_grace_notified", outbox, telegram_id)
+    return _write_behind("mark_grace_notified", telegram_id, telegram_id)
 
 
 @log_sync_call
@@ -138,12 +375,12 @@ def db_is_admin(telegram_id: int) -> bool:
 
 @log_sync_call
 def db_add_admin(telegram_id: int, is_top_level: bool = False) -> None:
-    get_db().add_admin(telegram_id, is_top_level)
+    _write("add_admin", telegram_id, is_top_level)
 
 
 @log_sync_call
 def db_remove_admin(telegram_id: int) -> None:
-    get_db().remove_admin(telegram_id)
+    _write("remove_admin", telegram_id)
 
 
 @log_sync_call
@@ -153,12 +390,17 @@ def db_list_admins() -> list[dict]:
 
 @log_sync_call
 def db_get_user_locale(telegram_id: int) -> str | None:
+    writer = get_writer()
+    pending = writer.pending("set_user_locale", telegram_id) if writer else None
+    if pending is not None:
+        # the new locale is still queued; the next screen must already use it
+        return pending[1]
     return get_db().get_user_locale(telegram_id)
 
 
 @log_sync_call
-def db_set_user_locale(telegram_id: int, lang: str) -> None:
-    get_db().set_user_locale(telegram_id, lang)
+def db_set_user_locale(telegram_id: int, lang: str) -> Future:
+    return _write_behind("set_user_locale", telegram_id, telegram_id, lang)
 
 
 @log_sync_call
@@ -167,6 +409,60 @@ def db_get_media_cache(asset_key: str, lang: str) -> dict | None:
 
 
 @log_sync_call
-def db_upsert_media_cache(asset_key: str, lang: str, file_hash: str, file_id: str) -> None:
-    get_db().upsert_media_cache(asset_key, lang, file_hash, file_id)
+def db_acquire_lease(name: str, holder: str, ttl_sec: int) -> bool:
+    return _write("acquire_lease", name, holder, ttl_sec)
+
+
+@log_sync_call
+def db_release_lease(name: str, holder: str) -> None:
+    _write("release_lease", name, holder)
+
+
+@log_sync_call
+def db_live_leases() -> list[tuple[str, str]]:
+    return get_db().live_leases()
+
+
+@log_sync_call
+def db_upsert_media_cache(asset_key: str, lang: str, file_hash: str, file_id: str) -> Future:
+    return _write_behind("upsert_media_cache", (asset_key, lang), asset_key, lang, file_hash, file_id)
+
+
+@log_sync_call
+def db_enqueue_outbox(items: Sequence[OutboxItem]) -> int:
+    added = _write("enqueue_outbox", tuple(items))
+    _notify_write("outbox", added)
+    return added
+
+
+@log_async_call
+async def db_enqueue_outbox_async(items: Sequence[OutboxItem]) -> int:
+    added = await _write_async("enqueue_outbox", tuple(items))
+    _notify_write("outbox", added)
+    return added
+
+
+@log_async_call
+async def db_record_expiry_pass_async(
+    warned: Sequence[int], graced: Sequence[int], revoked: Sequence[str], outbox: Sequence[OutboxItem] = ()
+) -> None:
+    """Write one expiry loop pass as a single writer job."""
+    await _write_async("record_expiry_pass", tuple(warned), tuple(graced), tuple(revoked), tuple(outbox))
+    for membership_id in revoked:
+        _notify_write("membership", membership_id)
+    _notify_write("outbox", len(outbox))
+
+
+@log_async_call
+async def db_claim_outbox_async(now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+    return await _write_async("claim_outbox", now, limit, lease_sec)
+
+
+@log_async_call
+async def db_finish_outbox_async(results) -> None:
+    await _write_async("finish_outbox", results)
+
 
+@log_async_call
+async def db_purge_outbox_async(before: int) -> int:
+    return await _write_async("purge_outbox", before)
@@ -0,0 +1,33 @@
+"""HTTP transport for the Bot API that records per-method latency and errors."""
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Any
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+from modules.metrics import TG_API_ERRORS, TG_API_RETRY_AFTER, TG_API_SECONDS
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """``HTTPXRequest`` feeding ``tg_api_*`` metrics, labelled by API method.
+
+    Used for regular bot calls only; long polling ``getUpdates`` keeps its
+    own request object so idle waits do not show up as latency.
+    """
+
+    async def post(self, url: str, *args: Any, **kwargs: Any) -> Any:
+        method = url.rsplit("/", 1)[-1]
+        start = perf_counter()
+        try:
+            result = await super().post(url, *args, **kwargs)
+        except RetryAfter:
+            TG_API_RETRY_AFTER.inc(method)
+            raise
+        except TelegramError:
+            TG_API_ERRORS.inc(method)
+            raise
+        finally:
+            TG_API_SECONDS.labels(method).observe(perf_counter() - start)
+        return result
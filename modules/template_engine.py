@@ -1,14 +1,12 @@
-from pathlib import Path
 import logging
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-from modules.config import i18n
+from modules.config import TEMPLATES_DIR, i18n
 from modules.i18n import plural_days
 
 logger = logging.getLogger("tg_support_bot.template")
 
 DEFAULT_LANG = i18n.get("default_lang", "en")
-TEMPLATES_DIR = Path("templates")
 
 env = Environment(
     loader=FileSystemLoader(str(TEMPLATES_DIR)),
@@ -1,38 +1,88 @@
 from __future__ import annotations
 
-def humanize_period(seconds: int) -> str:
-    """Convert seconds to human readable Russian label."""
+import calendar
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+from modules.config import durations, i18n
+
+DEFAULT_LANG = i18n.get("default_lang", "en")
+
+
+def to_epoch(dt: Optional[datetime]) -> Optional[int]:
+    """Convert datetime to epoch seconds. Naive datetimes are treated as UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        return calendar.timegm(dt.utctimetuple())
+    return calendar.timegm(dt.timetuple())
+
+
+def from_epoch(ts: Optional[int]) -> Optional[datetime]:
+    """Convert epoch seconds to naive UTC datetime."""
+    return None if ts is None else datetime.utcfromtimestamp(ts)
+
+
+def now_epoch() -> int:
+    return int(time.time())
+
+
+def _one_other(n: int) -> int:
+    return 0 if n == 1 else 1
+
+
+def _east_slavic(n: int) -> int:
+    n10, n100 = n % 10, n % 100
+    if n10 == 1 and n100 != 11:
+        return 0
+    if 2 <= n10 <= 4 and not 12 <= n100 <= 14:
+        return 1
+    return 2
+
+
+# referenced by ``plural_rule`` in config/i18n.yaml
+PLURAL_RULES: dict[str, Callable[[int], int]] = {"one_other": _one_other, "east_slavic": _east_slavic}
+
+# largest unit that divides the period exactly wins
+_UNITS = (
+    ("year", 365 * 24 * 3600),
+    ("month", 30 * 24 * 3600),
+    ("week", 7 * 24 * 3600),
+    ("day", 24 * 3600),
+    ("hour", 3600),
+    ("minute", 60),
+)
+
+
+def _duration_cfg(lang: str) -> dict:
+    return durations.get(lang) or durations.get(DEFAULT_LANG) or durations.get("en", {})
+
+
+def plural_form(n: int, lang: str, forms: Sequence[str]) -> str:
+    """Pick the form of ``forms`` matching ``n`` under the language's plural rule."""
+    rule = PLURAL_RULES[_duration_cfg(lang).get("plural_rule", "one_other")]
+    return forms[min(rule(n), len(forms) - 1)]
+
+
+@lru_cache(maxsize=4096)
+def humanize_period(seconds: int, lang: str = DEFAULT_LANG) -> str:
+    """Convert seconds to a human readable label in ``lang`` (e.g. "3 дня")."""
+    cfg = _duration_cfg(lang)
     if seconds == 0:
-        return "бессрочно"
-    units = [
-        (365 * 24 * 3600, "год"),
-        (30 * 24 * 3600, "месяц"),
-        (7 * 24 * 3600, "неделю"),
-        (24 * 3600, "день"),
-        (3600, "час"),
-        (60, "минуту"),
-    ]
-    for unit_seconds, name in units:
+        return cfg.get("lifetime", "")
+    units = cfg.get("units", {})
+    for name, unit_seconds in _UNITS:
         if seconds % unit_seconds == 0 and seconds >= unit_seconds:
             amount = seconds // unit_seconds
-            if name == "минуту" and amount > 1:
-                name = "минут"
-            elif name == "час" and amount > 1:
-                name = "часов" if amount >= 5 else "часа"
-            elif name == "день" and amount > 1:
-                name = "дней" if amount >= 5 else "дня"
-            elif name == "неделю" and amount > 1:
-                name = "недель" if amount >= 5 else "недели"
-            elif name == "месяц" and amount > 1:
-                name = "месяцев" if amount >= 5 else "месяца"
-            elif name == "год" and amount > 1:
-                name = "лет" if amount >= 5 else "года"
-            return f"{amount} {name}"
+            return f"{amount} {plural_form(amount, lang, units[name])}"
     # Fallback
+    short = cfg.get("short", {})
     if seconds < 60:
-        return f"{seconds} с"
+        return f"{seconds} {short['second']}"
     if seconds < 3600:
-        return f"{seconds // 60} мин"
+        return f"{seconds // 60} {short['minute']}"
     if seconds < 86400:
-        return f"{seconds // 3600} ч"
-    return f"{seconds // 86400} дн"
+        return f"{seconds // 3600} {short['hour']}"
+    return f"{seconds // 86400} {short['day']}"
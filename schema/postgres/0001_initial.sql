@@ -35,6 +35,8 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- databases created before schema_version existed already have the trigger
+DROP TRIGGER IF EXISTS members_updated_at ON members;
 CREATE TRIGGER members_updated_at
 BEFORE UPDATE ON members
 FOR EACH ROW EXECUTE FUNCTION trg_members_updated_at();
@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- expiry loop queries filter on is_confirmed and a range of expires_at;
+-- the composite index also serves lookups by is_confirmed alone.
+-- CONCURRENTLY builds it without blocking writes; a build interrupted
+-- earlier leaves an invalid index behind, so drop it first.
+DROP INDEX CONCURRENTLY IF EXISTS idx_members_confirmed_expires;
+CREATE INDEX CONCURRENTLY idx_members_confirmed_expires ON members(is_confirmed, expires_at);
+DROP INDEX CONCURRENTLY IF EXISTS idx_members_confirmed;
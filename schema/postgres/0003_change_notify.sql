@@ -0,0 +1,40 @@
+-- Publish member changes on the tg_gate_changes channel so that other bot
+-- instances can drop cached rows. The payload carries the table, the key
+-- columns (trigger arguments) of the old and new row, and the
+-- application_name of the writing session so an instance can skip its
+-- own changes. NOTIFY is delivered on commit; identical payloads within
+-- one transaction are sent once.
+CREATE OR REPLACE FUNCTION notify_gate_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    keys JSONB := '[]'::JSONB;
+    rec JSONB;
+    key JSONB;
+    col TEXT;
+BEGIN
+    FOREACH rec IN ARRAY ARRAY[
+        CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END,
+        CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END
+    ] LOOP
+        CONTINUE WHEN rec IS NULL;
+        key := '{}'::JSONB;
+        FOREACH col IN ARRAY TG_ARGV LOOP
+            key := key || jsonb_build_object(col, rec -> col);
+        END LOOP;
+        IF NOT keys @> jsonb_build_array(key) THEN
+            keys := keys || jsonb_build_array(key);
+        END IF;
+    END LOOP;
+    PERFORM pg_notify('tg_gate_changes', jsonb_build_object(
+        'app', current_setting('application_name'),
+        'table', TG_TABLE_NAME,
+        'keys', keys
+    )::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS members_notify ON members;
+CREATE TRIGGER members_notify
+AFTER INSERT OR UPDATE OR DELETE ON members
+FOR EACH ROW EXECUTE FUNCTION notify_gate_change('membership_id', 'telegram_id');
@@ -0,0 +1,7 @@
+-- time-limited ownership records used by modules.leadership; expires_at is
+-- epoch seconds of the database clock, so replica clocks may drift
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at BIGINT NOT NULL
+);
@@ -0,0 +1,4 @@
+-- expiry loop queries filter on is_confirmed and a range of expires_at;
+-- the composite index also serves lookups by is_confirmed alone
+CREATE INDEX IF NOT EXISTS idx_members_confirmed_expires ON members(is_confirmed, expires_at);
+DROP INDEX IF EXISTS idx_members_confirmed;
@@ -0,0 +1,21 @@
+-- outbound Telegram messages and actions, written in the same transaction
+-- as the state change that caused them and sent by modules.outbox;
+-- times are epoch seconds
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    action TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    template TEXT,
+    lang TEXT,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at INTEGER NOT NULL,
+    last_error TEXT,
+    created_at INTEGER NOT NULL,
+    sent_at INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at) WHERE status='pending';
+CREATE INDEX IF NOT EXISTS idx_outbox_created ON outbox(created_at);
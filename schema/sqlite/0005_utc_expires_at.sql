@@ -0,0 +1,7 @@
+-- expires_at used to be written as int(dt.timestamp()) of a naive UTC
+-- datetime, which Python reads as local time, so stored values are off by
+-- the host UTC offset. 'localtime' adds that offset back; run the upgrade
+-- on the host (time zone) that wrote the rows. A no-op on UTC hosts.
+UPDATE members
+SET expires_at = CAST(strftime('%s', expires_at, 'unixepoch', 'localtime') AS INTEGER)
+WHERE expires_at IS NOT NULL;
@@ -1,7 +1,8 @@
 import os
 import asyncio
+import signal
 from dotenv import load_dotenv
-from telegram import BotCommand
+from telegram import BotCommand, Update
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -10,12 +11,13 @@ from telegram.ext import (
     CallbackQueryHandler,
     ChatJoinRequestHandler,
     ChatMemberHandler,
+    TypeHandler,
     filters,
 )
-from rich.console import Console
 
 from modules.routing import route_message, handle_inline_button
-from modules.join_approver import on_join_request, on_chat_member
+from modules.join_approver import on_join_request, on_chat_member, start_join_approval_workers
+from modules.eligibility import ELIGIBILITY_INDEX, load_eligibility_index
 from modules.common import handle_start_command, handle_help_command
 from modules.i18n import cmd_language, on_lang_pick
 from modules.admin_commands import (
@@ -26,23 +28,32 @@ from modules.admin_commands import (
     handle_export,
     handle_user,
     handle_user_action,
+    handle_bulk,
+    handle_import_members,
+    handle_stats,
+    handle_reload_config,
 )
-from modules.storage import db_init
-from modules.log_utils import log_async_call, log_sync_call
+from modules.storage import db_close, db_init
+from modules.log_utils import get_console, log_async_call, log_sync_call
 from modules.logging_config import logger
 from modules.inactivity import check_user_inactivity_loop
 from modules.membership_checker import check_membership_expiry_loop
 from modules.service_messages import suppress_service
-from modules.config import behavior
-
-# Консоль и логгер
-console = Console()
+from modules.settings import SettingsError, reload_settings
+from modules.metrics import METRICS_PORT, UPDATES, monitor_event_loop_lag, start_metrics_server
+from modules.telegram_request import InstrumentedRequest
+from modules.loop_profiler import LOOP_PROFILER, LoopProfiler
+from modules.pg_listener import start_change_listener
+from modules.leadership import ExpiryLeases
+from modules.outbox import start_outbox_dispatcher
 
 # Загрузка .env
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 background_tasks = []
+# partitions of the expiry work this replica owns, renewed in the background
+expiry_leases = ExpiryLeases()
 
 
 @log_async_call
@@ -54,28 +65,65 @@ async def setup_bot_commands(app: Application):
     ])
 
 
+async def count_update(update: Update, context) -> None:
+    for kind in ("message", "callback_query", "chat_join_request", "chat_member", "my_chat_member", "edited_message"):
+        if getattr(update, kind) is not None:
+            UPDATES.inc(kind)
+            return
+    UPDATES.inc("other")
+
+
+def reload_on_sighup() -> None:
+    try:
+        reload_settings()
+    except SettingsError as e:
+        logger.error("Configuration reload failed, keeping the current one: %s", e)
+
+
 @log_async_call
 async def post_init(app: Application):
     await setup_bot_commands(app)
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_on_sighup)
+    if METRICS_PORT:
+        start_metrics_server()
+        logger.info(f"Metrics exposed on port {METRICS_PORT}")
+    if LOOP_PROFILER:
+        # the profiler heartbeat also feeds event_loop_lag_seconds
+        background_tasks.append(LoopProfiler().start(asyncio.get_running_loop()))
+    elif METRICS_PORT:
+        background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
     inactivity_task = asyncio.create_task(check_user_inactivity_loop(app))
     background_tasks.append(inactivity_task)
-    expiry_task = asyncio.create_task(check_membership_expiry_loop(app))
+    background_tasks.append(asyncio.create_task(expiry_leases.run()))
+    expiry_task = asyncio.create_task(check_membership_expiry_loop(app, expiry_leases))
     background_tasks.append(expiry_task)
+    background_tasks.extend(start_join_approval_workers(app))
+    background_tasks.append(start_outbox_dispatcher(app))
+    change_listener = start_change_listener()
+    if change_listener is not None:
+        background_tasks.append(change_listener)
 
 # Запуск
 @log_sync_call
 def run_telegram_bot():
     if not BOT_TOKEN:
         logger.critical("BOT_TOKEN not set in .env")
-        console.print("[bold red]Error: BOT_TOKEN not set in .env[/bold red]")
+        get_console().print("[bold red]Error: BOT_TOKEN not set in .env[/bold red]")
         exit(1)
 
     logger.info("Starting Telegram bot...")
     db_init()
+    if ELIGIBILITY_INDEX:
+        load_eligibility_index()
 
-    app = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).build()
-    app.bot_data["suppress_service_messages"] = behavior.get("suppress_service_messages", True)
+    builder = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init)
+    if METRICS_PORT:
+        builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+    app = builder.build()
 
+    if METRICS_PORT:
+        app.add_handler(TypeHandler(Update, count_update), group=-1)
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, suppress_service), group=0)
     app.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER, suppress_service), group=0)
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_TITLE, suppress_service), group=0)
@@ -93,6 +141,18 @@ def run_telegram_bot():
     app.add_handler(CommandHandler("remove", handle_remove), group=1)
     app.add_handler(CommandHandler("export_users", handle_export), group=1)
     app.add_handler(CommandHandler("user", handle_user), group=1)
+    app.add_handler(CommandHandler(["ban_bulk", "kick_bulk", "remove_bulk"], handle_bulk), group=1)
+    app.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/(ban|kick|remove)_bulk\b"), handle_bulk),
+        group=1,
+    )
+    app.add_handler(CommandHandler("import_members", handle_import_members), group=1)
+    app.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import_members\b"), handle_import_members),
+        group=1,
+    )
+    app.add_handler(CommandHandler("stats", handle_stats), group=1)
+    app.add_handler(CommandHandler("reload_config", handle_reload_config), group=1)
     app.add_handler(CallbackQueryHandler(handle_user_action, pattern=r"^admin:(ban|unban|kick|remove):"), group=1)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, route_message), group=1)
     app.add_handler(CallbackQueryHandler(on_lang_pick, pattern=r"^lang:"), group=1)
@@ -100,7 +160,7 @@ def run_telegram_bot():
     app.add_handler(ChatJoinRequestHandler(on_join_request), group=1)
     app.add_handler(ChatMemberHandler(on_chat_member, ChatMemberHandler.CHAT_MEMBER), group=1)
 
-    console.print("[bold green]Telegram bot is running[/bold green]")
+    get_console().print("[bold green]Telegram bot is running[/bold green]")
     logger.info("Telegram bot is now polling for messages")
 
     try:
@@ -113,11 +173,16 @@ def run_telegram_bot():
             coro = getattr(task, 'get_coro', lambda: None)()
             name = getattr(coro, '__name__', 'unknown')
             logger.debug(f"Cancelled task: {name}")
+        try:
+            expiry_leases.release_all()
+        except Exception as e:
+            logger.warning("Failed to release leases: %s", e)
+        db_close()
 
 if __name__ == "__main__":
     try:
         run_telegram_bot()
     except KeyboardInterrupt:
-        console.print("\n[yellow][!] Stopped by user (Ctrl+C).[/yellow]")
+        get_console().print("\n[yellow][!] Stopped by user (Ctrl+C).[/yellow]")
     finally:
         pass
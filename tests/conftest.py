@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# modules.logging_config opens its log file on import; keep test runs out of logs/
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="tg-gate-logs-"))
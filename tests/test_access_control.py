@@ -0,0 +1,106 @@
+import asyncio
+import sys
+from dataclasses import replace
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from telegram.error import RetryAfter
+
+from modules import access_control, settings
+from modules.rate_limiter import RateLimiter
+
+
+class FakeBot:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(("get_chat_member", chat_id, user_id))
+        status = self.statuses[chat_id]
+        if isinstance(status, Exception):
+            raise status
+        return SimpleNamespace(status=status)
+
+
+def test_probe_member_statuses_uses_cache(monkeypatch):
+    monkeypatch.setattr(settings, "_current", replace(settings.get_settings(), access_chats=(-1, -2, -3)))
+    monkeypatch.setattr(access_control, "_member_status_cache", {})
+    bot = FakeBot({-1: "left", -2: "member", -3: RuntimeError("boom")})
+
+    statuses = asyncio.run(access_control.probe_member_statuses(bot, 42))
+    assert statuses == {-1: "left", -2: "member", -3: None}
+    assert access_control.is_in_any_chat(statuses)
+    assert len(bot.calls) == 3
+
+    bot.calls.clear()
+    access_control.remember_member_status(-2, 42, "kicked")
+    statuses = asyncio.run(access_control.probe_member_statuses(bot, 42))
+    assert statuses[-2] == "kicked"
+    # only the failed chat is probed again
+    assert bot.calls == [("get_chat_member", -3, 42)]
+    assert not access_control.is_in_any_chat(statuses)
+
+
+def test_cached_member_status_expires(monkeypatch):
+    monkeypatch.setattr(access_control, "_member_status_cache", {})
+    monkeypatch.setattr(access_control, "MEMBER_STATUS_TTL", -1)
+    access_control.remember_member_status(-1, 42, "member")
+    assert access_control.cached_member_status(-1, 42) is None
+
+
+def test_member_status_cache_is_bounded(monkeypatch):
+    cache = {}
+    monkeypatch.setattr(access_control, "_member_status_cache", cache)
+    monkeypatch.setattr(access_control, "MEMBER_STATUS_CACHE_SIZE", 3)
+    for user_id in range(5):
+        access_control.remember_member_status(-1, user_id, "member")
+    assert list(cache) == [(-1, 2), (-1, 3), (-1, 4)]
+    # an update refreshes the entry, so it is evicted last
+    access_control.remember_member_status(-1, 2, "left")
+    access_control.remember_member_status(-1, 5, "member")
+    assert list(cache) == [(-1, 4), (-1, 2), (-1, 5)]
+
+    # expired entries go on the next insert
+    monkeypatch.setattr(access_control, "MEMBER_STATUS_TTL", -1)
+    access_control.remember_member_status(-1, 6, "member")
+    assert cache == {}
+
+
+class ModerationBot:
+    def __init__(self, fail_chat=None, retry_chat=None):
+        self.calls = []
+        self.fail_chat = fail_chat
+        self.retry_chat = retry_chat
+
+    async def ban_chat_member(self, chat_id, user_id):
+        self.calls.append(("ban", chat_id))
+        if chat_id == self.retry_chat:
+            self.retry_chat = None
+            raise RetryAfter(0)
+        if chat_id == self.fail_chat:
+            raise RuntimeError("no rights")
+        await asyncio.sleep(0)
+
+    async def unban_chat_member(self, chat_id, user_id, only_if_banned=True):
+        self.calls.append(("unban", chat_id))
+        await asyncio.sleep(0)
+
+
+def test_kick_in_all_access_chats_summary(monkeypatch):
+    monkeypatch.setattr(settings, "_current", replace(settings.get_settings(), access_chats=(-1, -2, -3)))
+    monkeypatch.setattr(access_control, "_member_status_cache", {})
+    monkeypatch.setattr(access_control, "api_limiter", RateLimiter(rate=0, concurrency=4))
+    bot = ModerationBot(fail_chat=-2, retry_chat=-3)
+
+    summary = asyncio.run(access_control.kick_in_all_access_chats(bot, 42))
+    assert summary["ok"] == [-1, -3]
+    assert list(summary["errors"]) == [-2]
+    # RetryAfter is retried and ban always precedes unban within a chat
+    assert bot.calls.count(("ban", -3)) == 2
+    for chat_id in (-1, -3):
+        assert bot.calls.index(("unban", chat_id)) > bot.calls.index(("ban", chat_id))
+    assert ("unban", -2) not in bot.calls
+    assert access_control.cached_member_status(-1, 42) == "left"
@@ -0,0 +1,32 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.bulk_moderation import parse_keys, parse_filter
+
+
+def test_parse_keys_plain_lines():
+    keys = parse_keys(b"# leaked ids\n100\n\n@alice\n200,comment\n")
+    assert keys.membership_ids == ["100", "200"]
+    assert keys.usernames == ["alice"]
+    assert keys.telegram_ids == []
+
+
+def test_parse_keys_export_csv():
+    data = b"membership_id,telegram_id,username\n100,111,a\n,222,b\n"
+    keys = parse_keys(data)
+    assert keys.membership_ids == ["100"]
+    assert keys.telegram_ids == [222]
+
+
+def test_parse_filter():
+    assert parse_filter(["expired_before:2024-01-31", "never_joined"]) == {
+        "expired_before": datetime(2024, 1, 31),
+        "never_joined": True,
+    }
+    with pytest.raises(ValueError):
+        parse_filter(["everyone"])
@@ -1,11 +1,22 @@
 from datetime import datetime, timedelta
 
+import asyncio
+import sqlite3
 import sys
+import threading
+import time
 from pathlib import Path
 
+import pytest
+
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+from modules import db_factory, storage
+from modules import queries as Q
+from modules.db_base import Member
 from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.migrations import discover
+from modules.time_utils import to_epoch
 
 
 def test_member_flow(tmp_path):
@@ -23,7 +34,7 @@ def test_member_flow(tmp_path):
     db.set_confirmation("123", True, datetime.utcnow() + timedelta(seconds=10))
     member = db.get_member_by_membership_id("123")
     assert member["is_confirmed"] == 1
-    assert isinstance(member["expires_at"], str)
+    assert isinstance(member["expires_at"], int)
     db.set_ban("123", True)
     member = db.get_member_by_membership_id("123")
     assert member["is_banned"] == 1
@@ -64,3 +75,253 @@ def test_upsert_member_swap(tmp_path):
     assert m_a["telegram_id"] is None
     assert db.get_member_by_telegram(2) is None
     assert db.get_member_by_telegram(1)["membership_id"] == "B"
+
+
+def test_upsert_member_returns_row_id(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    member_id = db.upsert_member("A", 1, None, None, is_confirmed=True)
+    assert db.get_member_by_membership_id("A")["id"] == member_id
+    # re-submission keeps the row and its confirmation
+    assert db.upsert_member("A", 1, "user", None) == member_id
+    assert db.get_member_by_telegram(1)["is_confirmed"]
+    # rebind moves the existing row to the new membership ID
+    assert db.upsert_member("B", 1, None, None) == member_id
+
+
+def test_expiry_filters_use_epoch(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    now = datetime(2030, 1, 1, 12, 0)
+    for mid, tid, delta in (("soon", 1, 60), ("later", 2, 7200), ("past", 3, -60), ("old", 4, -7200)):
+        db.upsert_member(mid, tid, None, None)
+        db.set_confirmation(mid, True, now + timedelta(seconds=delta))
+    # naive datetimes are UTC regardless of the host timezone
+    assert db.get_member_by_membership_id("soon")["expires_at"] == 1893499260
+    assert [m["membership_id"] for m in db.fetch_members_for_warning(now, 3600)] == ["soon"]
+    assert sorted(m["membership_id"] for m in db.fetch_expired_members(now)) == ["old", "past"]
+    assert [m["membership_id"] for m in db.fetch_recently_expired(now, 3600)] == ["past"]
+
+
+def test_member_record_dict_access(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    db.upsert_member("A", 1, "alice", None)
+    member = db.get_member_by_telegram(1)
+    assert isinstance(member, Member)
+    assert member.membership_id == member["membership_id"] == "A"
+    assert member.get("full_name", "-") is None
+    member.update(is_banned=1)
+    assert member["is_banned"] == 1
+    assert dict(member)["username"] == "alice"
+    # columns not selected by a query behave like missing dict keys
+    bare = Member(id=1)
+    assert "username" not in bare and bare.get("username", "x") == "x"
+    with pytest.raises(KeyError):
+        bare["username"]
+
+
+def test_connection_reuse(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"), read_pool_size=2)
+    db.init()
+    conn = db._connect()
+    db.upsert_member("A", 1, None, None)
+    # one write connection shared by all threads
+    assert db._connect() is conn
+    other: list = []
+    t = threading.Thread(target=lambda: other.append(db._connect()))
+    t.start()
+    t.join()
+    assert other[0] is conn
+    assert db._run("PRAGMA journal_mode", fetchone=True)[0] == "wal"
+    with db._reading() as reader:
+        assert reader is not conn
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM members")
+    with db._reading() as again:
+        assert again is reader
+    db.close()
+    assert db._connect() is not conn
+    assert db.get_member_by_telegram(1)["membership_id"] == "A"
+
+
+def test_read_pool_is_bounded(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"), read_pool_size=2)
+    db.init()
+    db.upsert_member("A", 1, None, None)
+    seen = set()
+    errors: list = []
+
+    def reader():
+        try:
+            for _ in range(50):
+                with db._reading() as conn:
+                    seen.add(id(conn))
+                assert db.get_member_by_telegram(1)["membership_id"] == "A"
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=reader) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(seen) <= 2
+
+
+def test_async_list_reads_share_read_pool(tmp_path, monkeypatch):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"), read_pool_size=3)
+    db.init()
+    monkeypatch.setattr(db_factory, "_DB", db)
+    db.upsert_member("A", 1, None, None)
+    db.set_confirmation("A", True, datetime(2000, 1, 1))
+    # every read waits inside its connection until all three hold one
+    barrier = threading.Barrier(3, timeout=5)
+    fetch = db._fetch
+    seen = set()
+
+    def held_fetch(conn, *args):
+        seen.add(id(conn))
+        barrier.wait()
+        return fetch(conn, *args)
+
+    monkeypatch.setattr(db, "_fetch", held_fetch)
+    now = datetime.utcnow()
+
+    async def main():
+        return await asyncio.gather(
+            storage.db_fetch_members_for_warning_async(now, 60),
+            storage.db_fetch_recently_expired_async(now, 60),
+            storage.db_fetch_expired_members_async(now),
+        )
+
+    warning, grace, expired = asyncio.run(main())
+    assert [m["membership_id"] for m in expired] == ["A"]
+    assert len(seen) == 3
+
+
+def test_query_catalogue_placeholders():
+    assert Q.MEMBER_BY_TELEGRAM.postgres.endswith("WHERE m.telegram_id=%s")
+    assert Q.SET_BAN.prepared == "UPDATE members SET is_banned=$1 WHERE membership_id=$2"
+    assert Q.MARK_WARNING_SENT.nparams == 1 and "?" in Q.MARK_WARNING_SENT.sqlite
+    names = [q.name for q in vars(Q).values() if isinstance(q, Q.Query)]
+    assert len(names) == len(set(names))
+
+
+def test_bulk_moderate(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    db.upsert_member("A", 1, "alice", None)
+    db.upsert_member("B", 2, "bob", None)
+    db.upsert_member("C", 3, None, None)
+    db.set_confirmation("A", True, datetime.utcnow() - timedelta(days=2))
+    db.set_confirmation("B", True, None)
+    db.mark_post_join_sent(db.get_member_by_membership_id("B")["id"])
+
+    found = db.get_members_by_keys(["A"], [3], ["bob"])
+    assert sorted(m["membership_id"] for m in found) == ["A", "B", "C"]
+    expired = db.find_members(expired_before=datetime.utcnow() - timedelta(days=1))
+    assert [m["membership_id"] for m in expired] == ["A"]
+    never_joined = db.find_members(never_joined=True)
+    assert sorted(m["membership_id"] for m in never_joined) == ["A", "C"]
+
+    assert db.bulk_moderate("ban", ["A", "B"]) == 2
+    a = db.get_member_by_membership_id("A")
+    assert a["is_banned"] == 1 and a["is_confirmed"] == 0 and a["expires_at"] is None
+    assert db.bulk_moderate("remove", ["B", "C"]) == 2
+    assert db.get_member_by_membership_id("B") is None
+    assert db.get_member_by_telegram(3) is None
+    assert db.get_member_by_membership_id("A") is not None
+
+
+def test_bulk_upsert_members(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    db.upsert_member("OLD", 7, "old", None)
+    expires = datetime.utcnow() + timedelta(days=30)
+    written = db.bulk_upsert_members([
+        ("A", 1, expires),
+        ("B", None, None),
+        ("C", 7, None),   # takes telegram 7 from OLD
+        ("A", 2, expires),  # duplicate membership: last row wins
+    ])
+    assert written == 3
+    a = db.get_member_by_membership_id("A")
+    assert a["telegram_id"] == 2 and a["is_confirmed"] == 1 and a["expires_at"]
+    assert db.get_member_by_membership_id("B")["telegram_id"] is None
+    assert db.get_member_by_telegram(7)["membership_id"] == "C"
+    assert db.get_member_by_membership_id("OLD")["telegram_id"] is None
+
+
+def test_claim_post_join(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    db.upsert_member("A", 1, None, None)
+    db.set_user_locale(1, "ru")
+    member_id = db.get_member_by_membership_id("A")["id"]
+    assert db.claim_post_join(member_id) == (True, "ru")
+    assert db.claim_post_join(member_id) == (False, None)
+    assert db.was_post_join_sent(member_id)
+    db.release_post_join(member_id)
+    assert db.claim_post_join(member_id) == (True, "ru")
+
+
+def test_migrations_apply_once(tmp_path):
+    latest = discover("sqlite")[-1].version
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    assert db.schema_version() == latest
+    versions = [r[0] for r in db._run("SELECT version FROM schema_version ORDER BY version", fetchall=True)]
+    assert versions == list(range(1, latest + 1))
+    indexes = {r[0] for r in db._run("SELECT name FROM sqlite_master WHERE type='index'", fetchall=True)}
+    assert "idx_members_confirmed_expires" in indexes
+    assert "idx_members_confirmed" not in indexes
+    # the trigger body survives statement splitting
+    db.upsert_member("1", 1, "u", "U")
+    db.set_ban("1", True)
+
+    db.init()
+    assert db._run("SELECT COUNT(*) FROM schema_version", fetchone=True)[0] == latest
+
+
+def test_migrations_adopt_pre_versioning_database(tmp_path):
+    path = tmp_path / "db.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript(discover("sqlite")[0].sql)
+    conn.execute("INSERT INTO members (membership_id) VALUES ('old')")
+    conn.commit()
+    conn.close()
+
+    db = SQLiteAdapter(str(path))
+    db.init()
+    assert db.schema_version() == discover("sqlite")[-1].version
+    assert db.get_member_by_membership_id("old") is not None
+
+
+def test_migration_converts_local_time_epochs(tmp_path, monkeypatch):
+    path = tmp_path / "db.sqlite"
+    expires = datetime(2030, 1, 15, 12, 0)
+    monkeypatch.setenv("TZ", "Etc/GMT-3")  # UTC+3
+    time.tzset()
+    try:
+        conn = sqlite3.connect(path)
+        conn.executescript(discover("sqlite")[0].sql)
+        # how rows were written before epochs were UTC
+        conn.execute("INSERT INTO members (membership_id, expires_at) VALUES ('old', ?)", (int(expires.timestamp()),))
+        conn.commit()
+        conn.close()
+        db = SQLiteAdapter(str(path))
+        db.init()
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+    assert db.get_member_by_membership_id("old")["expires_at"] == to_epoch(expires)
+
+
+def test_postgres_concurrent_index_migration_is_split():
+    migration = {m.version: m for m in discover("postgres")}[2]
+    assert not migration.transactional
+    statements = migration.statements()
+    assert all(s.startswith(("CREATE INDEX CONCURRENTLY", "DROP INDEX CONCURRENTLY")) for s in statements)
+    assert len(statements) == 3
@@ -0,0 +1,117 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import db_factory, storage
+from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.db_writer import SQLiteWriter
+from modules.metrics import DB_WRITE_BATCH_SECONDS
+
+
+def _db(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    return db
+
+
+def test_keyed_writes_coalesce(tmp_path):
+    db = _db(tmp_path)
+    db.upsert_member("A", 1, None, None)
+    writer = SQLiteWriter(db, window_ms=200)
+    futures = [writer.submit("set_user_locale", 1, lang, key=1) for lang in ("en", "ru", "en", "ru")]
+    assert writer.pending("set_user_locale", 1) == (1, "ru")
+    assert writer.flush(5)
+    assert [f.result() for f in futures] == [None] * 4
+    assert db.get_user_locale(1) == "ru"
+    assert writer.pending("set_user_locale", 1) is None
+    writer.close()
+
+
+def test_failed_write_does_not_discard_batch(tmp_path):
+    db = _db(tmp_path)
+    writer = SQLiteWriter(db, window_ms=200)
+    ok = writer.submit("upsert_member", "A", 1, "a", None, key="A")
+    bad = writer.submit("bulk_moderate", "explode", ["A"], key="bad")
+    writer.close()
+    assert isinstance(ok.result(), int)
+    with pytest.raises(ValueError):
+        bad.result()
+    assert db.get_member_by_membership_id("A") is not None
+
+
+def test_concurrent_writers_share_transactions(tmp_path):
+    db = _db(tmp_path)
+    writer = SQLiteWriter(db)
+    batches = DB_WRITE_BATCH_SECONDS.labels("").count
+
+    def worker(n):
+        for i in range(20):
+            writer.submit("upsert_member", f"M{n}-{i}", n * 100 + i, None, None).result()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+    assert len(db.find_members()) == 160
+    assert DB_WRITE_BATCH_SECONDS.labels("").count - batches < 160
+
+
+def test_storage_reads_queued_locale(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    monkeypatch.setenv("SQLITE_WRITE_WINDOW_MS", "500")
+    storage.db_upsert_member("A", 7, None, None)
+    future = storage.db_set_user_locale(7, "ru")
+    assert storage.db_get_user_locale(7) == "ru"
+    storage.db_close()
+    assert future.done()
+    assert db.get_user_locale(7) == "ru"
+
+
+def test_async_write_does_not_block_loop(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    db.upsert_member("A", 7, None, None)
+    ticks = []
+
+    async def main():
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        # held write lock keeps the writer thread busy
+        with db._writing():
+            write = asyncio.create_task(storage.db_set_confirmation_async("A", True, None))
+            await asyncio.sleep(0.05)
+            assert not write.done()
+        await write
+        task.cancel()
+
+    asyncio.run(main())
+    storage.db_close()
+    assert ticks
+    assert db.get_member_by_membership_id("A")["is_confirmed"]
+
+
+def test_pending_covers_uncommitted_batch(tmp_path):
+    db = _db(tmp_path)
+    db.upsert_member("A", 1, None, None)
+    writer = SQLiteWriter(db)
+    with db._writing():
+        # the thread has taken the batch but cannot commit it yet
+        future = writer.submit("set_user_locale", 1, "ru", key=1)
+        writer.flush(0.2)
+        assert not writer._queue and not future.done()
+        assert writer.pending("set_user_locale", 1) == (1, "ru")
+    assert writer.flush(5)
+    assert writer.pending("set_user_locale", 1) is None
+    writer.close()
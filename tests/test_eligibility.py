@@ -0,0 +1,113 @@
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import db_factory, eligibility, storage
+from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.time_utils import to_epoch
+
+
+def _setup(tmp_path, monkeypatch):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    monkeypatch.setattr(db_factory, "_DB", db)
+    monkeypatch.setattr(eligibility, "_index", eligibility._Index())
+    monkeypatch.setattr(eligibility, "_loaded", False)
+    return db
+
+
+def test_index_follows_storage_writes(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    storage.db_upsert_member("A", 1, None, None)
+    storage.db_set_confirmation("A", True, None)
+    assert eligibility.load_eligibility_index() == 1
+    assert eligibility.is_eligible(1)
+
+    storage.db_set_ban("A", True)
+    assert not eligibility.is_eligible(1)
+    storage.db_set_ban("A", False)
+    assert eligibility.is_eligible(1)
+
+    # membership moves to another telegram account
+    storage.db_upsert_member("A", 2, None, None)
+    assert eligibility.is_eligible(2)
+    assert 1 not in eligibility._index.entries
+
+    storage.db_set_confirmation("A", True, datetime.utcnow() - timedelta(seconds=5))
+    assert not eligibility.is_eligible(2)
+
+    storage.db_bulk_moderate("remove", ["A"])
+    assert eligibility.eligibility_index_size() == 0
+    assert not eligibility.is_eligible(2)
+
+
+def test_index_miss_falls_back_to_db(tmp_path, monkeypatch):
+    db = _setup(tmp_path, monkeypatch)
+    db.bulk_upsert_members([("B", 3, datetime.utcnow() + timedelta(days=1))])
+    assert eligibility.is_eligible(3, now=time.time())
+    assert 3 in eligibility._index.entries
+
+    # a non-member is looked up once, then answered from the index
+    lookups = []
+    lookup = eligibility.db_get_member_by_telegram
+    monkeypatch.setattr(eligibility, "db_get_member_by_telegram", lambda tid: lookups.append(tid) or lookup(tid))
+    assert not eligibility.is_eligible(4)
+    assert not eligibility.is_eligible(4)
+    assert lookups == [4]
+    # the write listener drops the negative entry
+    storage.db_upsert_member("C", 4, None, None)
+    storage.db_set_confirmation("C", True, None)
+    assert eligibility.is_eligible(4)
+
+
+def test_loaded_index_answers_misses_without_db(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    storage.db_upsert_member("A", 1, None, None)
+    storage.db_set_confirmation("A", True, None)
+    eligibility.load_eligibility_index()
+    monkeypatch.setattr(eligibility, "db_get_member_by_telegram", None)
+    assert eligibility.is_eligible(1)
+    assert not eligibility.is_eligible(2)
+
+
+def test_import_chunks_update_index_in_place(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    storage.db_upsert_member("A", 1, None, None)
+    storage.db_set_ban("A", True)
+    storage.db_upsert_member("B", 2, None, None)
+    eligibility.load_eligibility_index()
+    monkeypatch.setattr(eligibility, "load_eligibility_index", None)
+    monkeypatch.setattr(eligibility, "db_fetch_eligibility", None)
+
+    expires = datetime.utcnow() + timedelta(days=1)
+    storage.db_bulk_upsert_members([("A", None, expires), ("B", 2, expires), ("C", 3, expires)])
+    assert eligibility._index.entries[1] == (True, True, to_epoch(expires))
+    assert eligibility._index.entries[2] == (True, False, to_epoch(expires))
+    # a loaded index must hold new members right away
+    assert eligibility._index.entries[3] == (True, False, to_epoch(expires))
+    assert eligibility.is_eligible(2) and eligibility.is_eligible(3)
+
+    # membership B moves to the account of A
+    storage.db_bulk_upsert_members([("B", 1, expires)])
+    assert eligibility.is_eligible(1)
+    assert not eligibility.is_eligible(2)
+
+
+def test_reload_replays_writes_made_while_loading(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    storage.db_upsert_member("A", 1, None, None)
+    storage.db_set_confirmation("A", True, None)
+    fetch = eligibility.db_fetch_eligibility
+
+    def stale_fetch():
+        rows = fetch()
+        # committed after the snapshot was read
+        storage.db_set_ban("A", True)
+        return rows
+
+    monkeypatch.setattr(eligibility, "db_fetch_eligibility", stale_fetch)
+    eligibility.load_eligibility_index()
+    assert eligibility._index.entries[1] == (True, True, None)
@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.config import renewal
+from modules.settings import get_settings
+from modules.keyboards import _renewal_layout, admin_keyboard, renewal_admin_keyboard, renewal_keyboard
+
+
+def _buttons(markup):
+    return [[(b.text, b.callback_data) for b in row] for row in markup.inline_keyboard]
+
+
+def test_renewal_keyboard_fills_membership_id():
+    plans = renewal["user_plans"]
+    rows = _buttons(renewal_keyboard("M-1", "ru"))
+    assert rows == [[(p["label"]["ru"], f"renew:M-1:{p['id']}")] for p in plans]
+    assert _buttons(renewal_keyboard("M-2", "ru"))[0][0][1] == f"renew:M-2:{plans[0]['id']}"
+    assert _renewal_layout("ru") is _renewal_layout("ru")
+    assert get_settings().plans_by_id[plans[0]["id"]].label == plans[0]["label"]
+
+
+def test_admin_keyboards():
+    rows = _buttons(admin_keyboard("A1", "en"))
+    assert rows[0] == [("Approve for lifetime", "approve:A1:0")]
+    assert rows[-1] == [("Decline", "decline:A1"), ("Ban", "ban:A1")]
+    assert _buttons(renewal_admin_keyboard("A1", 0, "ru")) == [
+        [("Подтвердить на бессрочно", "approve:A1:0")],
+        [("Отклонить", "decline:A1")],
+    ]
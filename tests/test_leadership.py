@@ -0,0 +1,75 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import db_factory, storage
+from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.leadership import ExpiryLeases, partition_of
+
+
+def _db(tmp_path, monkeypatch):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    monkeypatch.setattr(db_factory, "_DB", db)
+    return db
+
+
+def test_lease_is_exclusive_until_it_expires(tmp_path, monkeypatch):
+    db = _db(tmp_path, monkeypatch)
+    assert db.acquire_lease("expiry:0", "a", 60)
+    assert db.acquire_lease("expiry:0", "a", 60)
+    assert not db.acquire_lease("expiry:0", "b", 60)
+    assert db.live_leases() == [("expiry:0", "a")]
+    # an expired lease is free for anyone
+    assert db.acquire_lease("expiry:0", "a", -1)
+    assert db.live_leases() == []
+    assert db.acquire_lease("expiry:0", "b", 60)
+    db.release_lease("expiry:0", "a")
+    assert db.live_leases() == [("expiry:0", "b")]
+    db.release_lease("expiry:0", "b")
+    assert db.acquire_lease("expiry:0", "a", 60)
+
+
+def test_replicas_split_partitions(tmp_path, monkeypatch):
+    _db(tmp_path, monkeypatch)
+    a = ExpiryLeases(partitions=4, ttl_sec=60, holder="a")
+    b = ExpiryLeases(partitions=4, ttl_sec=60, holder="b")
+    assert a.tick() == {0, 1, 2, 3}
+    assert b.tick() == frozenset()
+    # a sees the new replica and hands over half, b picks it up
+    assert len(a.tick()) == 2
+    assert len(b.tick()) == 2
+    assert a.held | b.held == {0, 1, 2, 3}
+    b.release_all()
+    assert a.tick() == {0, 1, 2, 3}
+    member = {"membership_id": "M1", "telegram_id": 6}
+    assert a.owns(member) and not b.owns(member)
+
+
+def test_partition_is_stable():
+    assert partition_of({"membership_id": "M", "telegram_id": 7}, 4) == 3
+    assert partition_of({"membership_id": "M", "telegram_id": None}, 4) == partition_of(
+        {"membership_id": "M", "telegram_id": None}, 4
+    )
+    assert partition_of({"membership_id": "M", "telegram_id": None}, 1) == 0
+
+
+def test_renewal_does_not_block_loop(tmp_path, monkeypatch):
+    db = _db(tmp_path, monkeypatch)
+    leases = ExpiryLeases(partitions=2, ttl_sec=60, holder="a")
+
+    async def main():
+        # held write lock keeps the writer thread busy with the renewal
+        with db._writing():
+            task = asyncio.create_task(leases.run())
+            await asyncio.sleep(0.05)
+            assert leases.held == frozenset()
+        while not leases.held:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(main())
+    storage.db_close()
+    assert leases.held == {0, 1}
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import log_utils
+from modules.logging_config import logger
+from modules.metrics import CALL_ERRORS, CALL_SECONDS
+
+
+def test_no_debug_records_at_info(monkeypatch):
+    calls = []
+    monkeypatch.setattr(logger, "debug", lambda *a, **k: calls.append(a))
+    level = logger.level
+
+    @log_utils.log_sync_call
+    def add(a, b):
+        return a + b
+
+    try:
+        logger.setLevel(logging.INFO)
+        assert add(1, 2) == 3
+        assert calls == []
+        logger.setLevel(logging.DEBUG)
+        add(1, 2)
+        assert calls == [("%s called", "add"), ("%s completed successfully", "add")]
+    finally:
+        logger.setLevel(level)
+
+
+def test_opt_in_timing_and_errors(monkeypatch):
+    monkeypatch.setattr(log_utils, "CALL_TIMING", True)
+
+    @log_utils.log_async_call
+    async def traced_handler():
+        return "ok"
+
+    @log_utils.log_sync_call
+    def failing_call():
+        raise ValueError("boom")
+
+    before = CALL_SECONDS.labels("traced_handler").count
+    assert asyncio.run(traced_handler()) == "ok"
+    assert CALL_SECONDS.labels("traced_handler").count == before + 1
+
+    errors = CALL_ERRORS.values.get("failing_call", 0)
+    with pytest.raises(ValueError):
+        failing_call()
+    assert CALL_ERRORS.values["failing_call"] == errors + 1
+
+
+def test_queued_records_keep_traceback_for_json():
+    from modules.logging_config import JsonFormatter, _QueueHandler
+
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logger.makeRecord(logger.name, logging.ERROR, __file__, 1, "failed %s", ("job",), sys.exc_info())
+    prepared = _QueueHandler(None).prepare(record)
+    assert prepared.exc_info is None and prepared.args is None
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert entry["message"] == "failed job"
+    assert entry["exc_info"].endswith("ZeroDivisionError: division by zero")
+    assert "Traceback" in logging.Formatter().format(prepared)
@@ -0,0 +1,29 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.loop_profiler import LoopProfiler
+from modules.metrics import LOOP_STALLS
+
+
+def blocking_work():
+    time.sleep(0.3)
+
+
+def test_stall_is_attributed_to_blocking_function():
+    label = f"{__name__}.blocking_work"
+    before = LOOP_STALLS.values.get(label, 0)
+
+    async def main():
+        profiler = LoopProfiler(slow_callback_ms=1000, lag_warn_ms=100, interval=0.02, package=__name__)
+        task = profiler.start(asyncio.get_running_loop())
+        await asyncio.sleep(0.05)
+        blocking_work()
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(main())
+    assert LOOP_STALLS.values.get(label, 0) == before + 1
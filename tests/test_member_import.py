@@ -0,0 +1,28 @@
+import io
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import member_import
+
+
+def test_import_members_chunks_and_errors(monkeypatch):
+    chunks = []
+    monkeypatch.setattr(member_import, "db_bulk_upsert_members", lambda rows: chunks.append(rows) or len(rows))
+    data = "membership_id,telegram_id,expires_at\n1,11,2030-01-01T00:00:00Z\n2,,\nbad,3,\n4,44,1893456000\n"
+    summary = member_import.import_members(io.StringIO(data), "csv", chunk_size=2)
+    assert summary["rows"] == 4
+    assert summary["imported"] == 3
+    assert [line for line, _ in summary["errors"]] == [4]
+    assert [len(c) for c in chunks] == [2, 1]
+    assert chunks[0][0][2].year == 2030 and chunks[0][1] == ("2", None, None)
+
+
+def test_import_members_jsonl(monkeypatch):
+    chunks = []
+    monkeypatch.setattr(member_import, "db_bulk_upsert_members", lambda rows: chunks.append(rows) or len(rows))
+    data = '{"membership_id": "1", "telegram_id": 11}\n\nnot json\n'
+    summary = member_import.import_members(io.StringIO(data), "jsonl")
+    assert summary["imported"] == 1
+    assert [line for line, _ in summary["errors"]] == [3]
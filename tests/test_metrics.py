@@ -0,0 +1,87 @@
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.metrics import (
+    DB_CALL_SECONDS,
+    DB_SLOW_QUERIES,
+    Histogram,
+    _MetricsHandler,
+    counter,
+    db_stats,
+    histogram,
+    render_prometheus,
+    start_metrics_server,
+)
+
+
+def test_histogram_quantile():
+    h = Histogram((0.001, 0.01, 0.1))
+    for seconds in (0.0005, 0.002, 0.002, 0.05):
+        h.observe(seconds, rows=2)
+    assert h.count == 4 and h.rows == 8
+    assert h.counts == [1, 2, 1, 0]
+    assert h.quantile(0.5) == 0.01
+    assert h.quantile(1.0) == 0.1
+    h.observe(5)
+    assert h.quantile(1.0) is None
+
+
+def test_adapter_methods_are_timed(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    before = DB_CALL_SECONDS.labels("get_member_by_telegram").count
+    db.upsert_member("A", 1, None, None)
+    db.get_member_by_telegram(1)
+    db.get_member_by_telegram(2)
+    hist = DB_CALL_SECONDS.labels("get_member_by_telegram")
+    assert hist.count == before + 2
+    assert any(r["method"] == "upsert_member" for r in db_stats(limit=100))
+
+
+def test_slow_query_logged_with_plan(tmp_path, caplog):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"), slow_query_ms=0.000001)
+    db.init()
+    before = DB_SLOW_QUERIES.values.get("member_by_telegram", 0)
+    with caplog.at_level("WARNING", logger="tg_support_bot"):
+        db.get_member_by_telegram(1)
+    assert DB_SLOW_QUERIES.values["member_by_telegram"] == before + 1
+    assert any("Slow query member_by_telegram" in r.message and "SEARCH" in r.message for r in caplog.records)
+
+
+def test_prometheus_exposition():
+    h = histogram("test_render_seconds", "render test", "step", buckets=(0.01, 0.1))
+    h.labels('a"b').observe(0.05)
+    h.labels('a"b').observe(0.5)
+    counter("test_render_total", "render test", None).inc(amount=3)
+    text = render_prometheus()
+    assert "# TYPE test_render_seconds histogram" in text
+    assert 'test_render_seconds_bucket{step="a\\"b",le="0.01"} 0' in text
+    assert 'test_render_seconds_bucket{step="a\\"b",le="0.1"} 1' in text
+    assert 'test_render_seconds_bucket{step="a\\"b",le="+Inf"} 2' in text
+    assert 'test_render_seconds_count{step="a\\"b"} 2' in text
+    assert "test_render_total 3" in text
+
+
+def test_metrics_endpoint():
+    assert start_metrics_server(port=0) is None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert b"# TYPE db_call_seconds histogram" in resp.read()
+        try:
+            urllib.request.urlopen(f"{url}/other")
+            assert False, "expected 404"
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+    finally:
+        server.shutdown()
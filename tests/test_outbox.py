@@ -0,0 +1,167 @@
+import asyncio
+import sys
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from telegram.error import Forbidden, NetworkError
+
+from modules import db_factory, outbox, settings, storage
+from modules.db_base import OutboxItem
+from modules.db_sqlite_adapter import SQLiteAdapter
+from modules.outbox import OutboxDispatcher
+from modules.time_utils import now_epoch
+
+
+def _db(tmp_path):
+    db = SQLiteAdapter(str(tmp_path / "db.sqlite"))
+    db.init()
+    return db
+
+
+def _status(db, key):
+    row = db._query("SELECT status, attempts, next_attempt_at FROM outbox WHERE dedup_key=?", [key], fetchone=True)
+    return tuple(row)
+
+
+def test_outbox_items_commit_with_state_change(tmp_path):
+    db = _db(tmp_path)
+    member_id = db.upsert_member("A", 1, None, None)
+    db.mark_warning_sent(1, [OutboxItem("warning:A", "message", 1, "expired.txt", "en")])
+    assert db.get_member_by_membership_id("A")["warn_sent_at"] is not None
+    assert db.enqueue_outbox([OutboxItem("warning:A", "message", 1, "expired.txt", "en")]) == 0
+    db.set_ban("A", True, [OutboxItem("decision:1", "message", 1, "banned.txt")])
+    assert db.get_member_by_membership_id("A")["is_banned"]
+
+    assert db.claim_post_join(member_id, [OutboxItem("post_join:1", "message", 1, "post_join.txt")])[0]
+    # a lost claim queues nothing
+    assert not db.claim_post_join(member_id, [OutboxItem("post_join:2", "message", 1, "post_join.txt")])[0]
+    # not due before it was created
+    assert db.claim_outbox(0, 10, 60) == []
+    items = db.claim_outbox(2**40, 10, 60)
+    assert [i["template"] for i in items] == ["expired.txt", "banned.txt", "post_join.txt"]
+
+
+def test_claim_hides_items_until_lease_ends(tmp_path):
+    db = _db(tmp_path)
+    db.enqueue_outbox([OutboxItem("k", "kick", 1)])
+    now = 2**40
+    assert [i["attempts"] for i in db.claim_outbox(now, 10, 60)] == [1]
+    assert db.claim_outbox(now + 30, 10, 60) == []
+    assert [i["attempts"] for i in db.claim_outbox(now + 61, 10, 60)] == [2]
+    db.finish_outbox([(db.claim_outbox(now + 200, 10, 60)[0]["id"], None, None)])
+    assert _status(db, "k")[0] == "sent"
+    assert db.purge_outbox(2**41) == 1
+
+
+class FakeBot:
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        error = self.errors.pop(chat_id, None)
+        if error:
+            raise error
+        self.sent.append((chat_id, text))
+
+
+def test_dispatcher_retries_with_backoff(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    db.enqueue_outbox([
+        OutboxItem("ok", "message", 1, "expired.txt", "en"),
+        OutboxItem("flaky", "message", 2, "expired.txt", "en"),
+        OutboxItem("blocked", "message", 3, "expired.txt", "en"),
+    ])
+    bot = FakeBot({2: NetworkError("timeout"), 3: Forbidden("bot was blocked by the user")})
+    dispatcher = OutboxDispatcher(bot, backoff_sec=100)
+
+    assert asyncio.run(dispatcher.dispatch_once()) == 3
+    assert [chat_id for chat_id, _ in bot.sent] == [1]
+    assert _status(db, "ok")[0] == "sent"
+    assert _status(db, "blocked")[:2] == ("failed", 1)
+    status, attempts, retry_at = _status(db, "flaky")
+    assert (status, attempts) == ("pending", 1)
+    assert retry_at >= now_epoch() + 79
+    # backed off, not due on the next pass
+    assert asyncio.run(dispatcher.dispatch_once()) == 0
+
+    db._run("UPDATE outbox SET next_attempt_at=0")
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    assert [chat_id for chat_id, _ in bot.sent] == [1, 2]
+    assert _status(db, "flaky")[:2] == ("sent", 2)
+
+
+class KickBot:
+    def __init__(self, fail):
+        self.fail = fail
+
+    async def ban_chat_member(self, chat_id, user_id):
+        if self.fail:
+            raise NetworkError("timeout")
+
+    async def unban_chat_member(self, chat_id, user_id):
+        pass
+
+
+def test_confirmation_revoked_only_after_kick(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    monkeypatch.setattr(settings, "_current", replace(settings.get_settings(), access_chats=(-1,)))
+    monkeypatch.setattr(outbox, "ROOT_ADMIN_ID", 99)
+    db.upsert_member("A", 5, None, None)
+    db.set_confirmation("A", True, datetime(2000, 1, 1))
+    expires_at = db.get_member_by_membership_id("A")["expires_at"]
+    db.enqueue_outbox([OutboxItem("kick:A", "kick", 5, payload={"membership_id": "A", "expires_at": expires_at})])
+
+    dispatcher = outbox.OutboxDispatcher(KickBot(fail=True), max_attempts=1)
+    asyncio.run(dispatcher.dispatch_once())
+    assert _status(db, "kick:A")[0] == "failed"
+    assert db.get_member_by_membership_id("A")["is_confirmed"]
+    alert = db._query("SELECT chat_id, template FROM outbox WHERE dedup_key LIKE 'kick_failed:%'", fetchone=True)
+    assert tuple(alert) == (99, "admin_kick_failed.txt")
+
+    db.enqueue_outbox([OutboxItem("kick:A2", "kick", 5, payload={"membership_id": "A", "expires_at": expires_at})])
+    dispatcher.bot = KickBot(fail=False)
+    db._run("UPDATE outbox SET status='sent' WHERE dedup_key LIKE 'kick_failed:%'")
+    asyncio.run(dispatcher.dispatch_once())
+    assert _status(db, "kick:A2")[0] == "sent"
+    assert not db.get_member_by_membership_id("A")["is_confirmed"]
+
+
+def test_dispatch_does_not_block_loop(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    db.enqueue_outbox([OutboxItem("ok", "message", 1, "expired.txt", "en")])
+    bot = FakeBot({})
+
+    async def main():
+        # held write lock keeps the writer thread busy with the claim
+        with db._writing():
+            task = asyncio.create_task(OutboxDispatcher(bot).dispatch_once())
+            await asyncio.sleep(0.05)
+            assert not task.done()
+        return await task
+
+    assert asyncio.run(main()) == 1
+    storage.db_close()
+    assert _status(db, "ok")[0] == "sent"
+
+
+def test_expiry_pass_is_one_write(tmp_path, monkeypatch):
+    db = _db(tmp_path)
+    monkeypatch.setattr(db_factory, "_DB", db)
+    for mid, tid in (("W", 1), ("G", 2), ("R", None)):
+        db.upsert_member(mid, tid, None, None)
+        db.set_confirmation(mid, True, datetime(2000, 1, 1))
+    items = [OutboxItem("warning:W", "message", 1, "expired.txt", "en"), OutboxItem("grace:G", "message", 2, "expired.txt", "en")]
+
+    asyncio.run(storage.db_record_expiry_pass_async([1], [2], ["R"], items))
+    storage.db_close()
+    assert db.get_member_by_membership_id("W")["warn_sent_at"] is not None
+    assert db.get_member_by_membership_id("G")["grace_notified_at"] is not None
+    assert not db.get_member_by_membership_id("R")["is_confirmed"]
+    assert [i["chat_id"] for i in db.claim_outbox(2**40, 10, 60)] == [1, 2]
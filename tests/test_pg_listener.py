@@ -0,0 +1,89 @@
+import asyncio
+import json
+import socket
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import pg_listener, storage
+
+
+def _payload(table, keys, app="other"):
+    return json.dumps({"app": app, "table": table, "keys": keys})
+
+
+def test_dispatch_maps_tables_to_write_kinds(monkeypatch):
+    events = []
+    monkeypatch.setattr(storage, "_write_listeners", [lambda kind, key: events.append((kind, key))])
+    payloads = [
+        _payload("members", [{"membership_id": "A", "telegram_id": 1}, {"membership_id": "C", "telegram_id": 2}]),
+        _payload("members", [{"membership_id": "A", "telegram_id": 1}]),
+    ]
+    assert pg_listener.dispatch(payloads, "me") == 2
+    assert pg_listener.dispatch([_payload("members", [{"membership_id": "B"}], app="me")], "me") == 0
+    assert pg_listener.dispatch([_payload("unknown", [{}])], "me") == 0
+    assert events == [("membership", "A"), ("membership", "C")]
+
+
+def test_dispatch_collapses_bursts(monkeypatch):
+    events = []
+    monkeypatch.setattr(storage, "_write_listeners", [lambda kind, key: events.append((kind, key))])
+    payloads = [_payload("members", [{"membership_id": f"M{i}"}]) for i in range(10)]
+    assert pg_listener.dispatch(payloads, "me", burst=5) == 1
+    assert events == [("reset", None)]
+
+
+class FakeConn:
+    """Socket-backed stand-in for a psycopg2 connection in LISTEN mode."""
+
+    def __init__(self):
+        self.ours, self.server = socket.socketpair()
+        self.notifies = []
+        self.closed = False
+
+    def fileno(self):
+        return self.ours.fileno()
+
+    def poll(self):
+        data = self.ours.recv(4096)
+        if not data:
+            raise ConnectionError("server closed the connection")
+        for line in data.decode().splitlines():
+            self.notifies.append(SimpleNamespace(payload=line))
+
+    def close(self):
+        self.closed = True
+        self.ours.close()
+
+
+def test_listener_replays_and_resets_after_reconnect(monkeypatch):
+    events = []
+    threads = set()
+
+    def listener(kind, key):
+        events.append((kind, key))
+        threads.add(threading.current_thread())
+
+    monkeypatch.setattr(storage, "_write_listeners", [listener])
+    conns = [FakeConn(), FakeConn()]
+    pending = iter(conns)
+    db = SimpleNamespace(application_name="me", listen=lambda channel: next(pending))
+
+    async def scenario():
+        task = asyncio.create_task(pg_listener.ChangeListener(db, retry_sec=0).run())
+        await asyncio.sleep(0.05)
+        conns[0].server.sendall((_payload("members", [{"membership_id": "A"}]) + "\n").encode())
+        await asyncio.sleep(0.05)
+        conns[0].server.close()
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert events == [("reset", None), ("membership", "A"), ("reset", None)]
+    # re-reads happen in worker threads, not on the event loop
+    assert threading.main_thread() not in threads
+    # cancelling the task closes the live connection too
+    assert all(c.closed for c in conns)
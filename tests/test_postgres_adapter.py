@@ -0,0 +1,59 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+# runs only against a disposable database: PG_TEST_DB=... pytest tests/test_postgres_adapter.py
+pytestmark = pytest.mark.skipif(not os.getenv("PG_TEST_DB"), reason="PG_TEST_DB is not set")
+
+
+def _adapter():
+    from modules.db_postgres_adapter import PostgresAdapter
+
+    return PostgresAdapter(
+        host=os.getenv("PG_HOST", "127.0.0.1"),
+        port=int(os.getenv("PG_PORT", "5432")),
+        db=os.getenv("PG_TEST_DB", ""),
+        user=os.getenv("PG_USER", ""),
+        password=os.getenv("PG_PASSWORD", ""),
+    )
+
+
+@pytest.fixture
+def db():
+    db = _adapter()
+    db.init()
+    db._run("TRUNCATE members, users RESTART IDENTITY CASCADE")
+    yield db
+    db.close()
+
+
+def test_bulk_writes_commit_once(db):
+    expires = datetime.utcnow().replace(microsecond=0) + timedelta(days=1)
+    assert db.bulk_upsert_members([("A", 1, expires), ("B", 2, expires), ("C", None, None)]) == 3
+    assert db.bulk_moderate("ban", ["A"]) == 1
+    assert db.bulk_moderate("remove", ["B"]) == 1
+
+    # a second pool sees the committed state
+    other = _adapter()
+    try:
+        a = other.get_member_by_membership_id("A")
+        assert a["is_banned"] and not a["is_confirmed"]
+        assert other.get_member_by_membership_id("B") is None
+        assert other.get_member_by_telegram(2) is None
+        assert other.get_member_by_membership_id("C")["expires_at"] is None
+    finally:
+        other.close()
+
+
+def test_failed_bulk_import_rolls_back(db):
+    db.bulk_upsert_members([("A", 1, None)])
+    with pytest.raises(Exception):
+        # out of BIGINT range: the chunk fails as a whole
+        db.bulk_upsert_members([("B", 2, None), ("C", 2**70, None)])
+    assert db.get_member_by_telegram(2) is None
+    assert db.get_member_by_membership_id("A")["telegram_id"] == 1
@@ -0,0 +1,62 @@
+import copy
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules import config, settings
+from modules.settings import SettingsError, build_settings
+
+
+def test_build_settings_from_repo_config():
+    s = build_settings(config.ui_raw, config.membership_raw, "-100, -200")
+    assert s.access_chats == (-100, -200)
+    assert s.id_pattern.fullmatch("12345678")
+    assert [p.id for p in s.plans] == list(s.plans_by_id)
+    assert s.templates.granted == config.templates.get("granted", "access_granted.txt")
+
+
+def test_invalid_config_lists_every_problem():
+    mb = copy.deepcopy(config.membership_raw)
+    mb["id"] = {"pattern": "("}
+    mb["expiration"] = {"check_interval": "often"}
+    ui = {"messages": {"granted": "missing.txt"}}
+    with pytest.raises(SettingsError) as e:
+        build_settings(ui, mb, "-1,abc")
+    problems = " ".join(e.value.problems)
+    for fragment in ("id.pattern", "check_interval", "missing.txt", "'abc'"):
+        assert fragment in problems
+
+
+def test_reload_swaps_settings_and_notifies(monkeypatch):
+    seen = []
+    monkeypatch.setattr(settings, "_reload_listeners", [seen.append])
+    monkeypatch.setattr(settings, "_current", settings.get_settings())
+    monkeypatch.setattr(settings, "dotenv_values", lambda: {"ACCESS_CHATS": "-7"})
+    old = settings.get_settings()
+
+    new = settings.reload_settings()
+    assert settings.get_settings() is new is not old
+    assert new.access_chats == (-7,)
+    assert seen == [new]
+
+    monkeypatch.setattr(settings, "dotenv_values", lambda: {"ACCESS_CHATS": "nope"})
+    with pytest.raises(SettingsError):
+        settings.reload_settings()
+    assert settings.get_settings() is new
+    assert seen == [new]
+
+
+def test_reload_reports_unreadable_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "_current", settings.get_settings())
+    old = settings.get_settings()
+    (tmp_path / "ui_config.yaml").write_text("messages: [unclosed\n", encoding="utf-8")
+    monkeypatch.setattr(config, "CONFIG_DIR", tmp_path)
+    with pytest.raises(SettingsError, match="ui_config.yaml"):
+        settings.reload_settings()
+    (tmp_path / "ui_config.yaml").write_text("{}", encoding="utf-8")
+    with pytest.raises(SettingsError, match="membership.yaml"):
+        settings.reload_settings()
+    assert settings.get_settings() is old
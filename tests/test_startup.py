@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_startup_keeps_optional_modules_lazy(tmp_path):
+    probe = (
+        f"import sys; sys.path.insert(0, {str(ROOT)!r}); import telegram_bot; "
+        "print(','.join(sorted(sys.modules)))"
+    )
+    env = dict(os.environ, DB_BACKEND="sqlite", METRICS_PORT="0")
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    loaded = set(out.strip().splitlines()[-1].split(","))
+    for name in ("psycopg2", "rich", "modules.member_import", "modules.bulk_moderation"):
+        assert name not in loaded
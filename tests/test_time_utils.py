@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from modules.i18n import plural_days
+from modules.time_utils import humanize_period, plural_form
+
+
+def test_humanize_period_localized():
+    assert humanize_period(0, "ru") == "бессрочно"
+    assert humanize_period(120, "ru") == "2 минуты"
+    assert humanize_period(21 * 3600, "ru") == "21 час"
+    assert humanize_period(5 * 86400, "ru") == "5 дней"
+    assert humanize_period(14 * 86400, "ru") == "2 недели"
+    assert humanize_period(2592000, "en") == "1 month"
+    assert humanize_period(3 * 86400, "en") == "3 days"
+    assert humanize_period(3601, "en") == "1 h"
+    assert humanize_period(86400, "de") == humanize_period(86400, "en")
+
+
+def test_plural_rules():
+    forms = ["день", "дня", "дней"]
+    assert [plural_form(n, "ru", forms) for n in (1, 2, 5, 11, 12, 21, 22, 111)] == [
+        "день", "дня", "дней", "дней", "дней", "день", "дня", "дней",
+    ]
+    assert plural_days(4, "ru") == "дня"
+    assert plural_days(1, "en") == "day"